@@ -0,0 +1,180 @@
+"""Content-addressed file store for offset-based chunks (CHUNK_STORE=blob).
+
+With CHUNK_STORE=blob the indexer writes the text of every chunked file once
+to ``<out>/<repo>/blobs/<h[:2]>/<h>`` (``h`` = sha1 of the utf-8 text, as
+chunked: decoded, newlines normalized). Rows of chunks.jsonl / parents.jsonl
+whose code is a contiguous slice of that text drop ``code`` and keep
+``blob`` plus ``byte_range`` (``[start, end)`` in the blob) next to their
+line range. Rows that are not a slice (greedy sections, signature-only units)
+keep ``code`` inline. Readers call ``hydrate()``, which slices from an mmap of
+the blob; open maps are cached per process.
+"""
+
+from __future__ import annotations
+
+import os
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+BLOBS_DIR = 'blobs'
+_MAX_OPEN = 128
+
+
+def store_mode() -> str:
+    """``blob`` or ``inline`` (code kept in every chunks.jsonl row; default)."""
+    return 'blob' if (os.getenv('CHUNK_STORE', 'inline') or 'inline').strip().lower() == 'blob' else 'inline'
+
+
+def blobs_dir(outdir: str) -> str:
+    return os.path.join(outdir, BLOBS_DIR)
+
+
+def blob_path(root: str, h: str) -> str:
+    return os.path.join(root, h[:2], h)
+
+
+def put_blob(root: str, data: bytes, h: Optional[str] = None) -> str:
+    """Store ``data`` under its sha1 (no-op if present); returns the hash."""
+    h = h or hashlib.sha1(data).hexdigest()
+    p = blob_path(root, h)
+    if not os.path.exists(p):
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f'{p}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, p)
+    return h
+
+
+def attach_offsets(chunks: List[Dict], data: bytes, h: str) -> int:
+    """Give every chunk whose code is a slice of ``data`` its ``blob`` and
+    ``byte_range`` (``code`` is left in place). Returns how many matched."""
+    starts = [0]
+    pos = data.find(b'\n')
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = data.find(b'\n', pos + 1)
+    n = 0
+    for c in chunks:
+        code = (c.get('code') or '').encode('utf-8')
+        if not code:
+            continue
+        line = int(c.get('start_line') or 1) - 1
+        b = starts[line] if 0 <= line < len(starts) else -1
+        if b < 0 or data[b:b + len(code)] != code:
+            b = data.find(code)
+        if b < 0:
+            continue
+        c['blob'] = h
+        c['byte_range'] = [b, b + len(code)]
+        n += 1
+    return n
+
+
+def strip_code(c: Dict) -> Dict:
+    """The row as stored in blob mode: without ``code`` when it has offsets."""
+    if c.get('blob') and c.get('byte_range'):
+        return {k: v for k, v in c.items() if k != 'code'}
+    return c
+
+
+def gc_blobs(outdir: str, keep: Iterable[str]) -> int:
+    """Delete blobs that no chunk refers to any more; returns how many."""
+    root = blobs_dir(outdir)
+    if not os.path.isdir(root):
+        return 0
+    keep = set(keep)
+    n = 0
+    for sub in os.scandir(root):
+        if not sub.is_dir():
+            continue
+        for e in os.scandir(sub.path):
+            if e.name not in keep:
+                try:
+                    os.remove(e.path)
+                    n += 1
+                except OSError:
+                    pass
+        try:
+            os.rmdir(sub.path)
+        except OSError:
+            pass
+    if not keep:
+        try:
+            os.rmdir(root)
+        except OSError:
+            pass
+    return n
+
+
+class BlobReader:
+    """Slices chunk code out of mmapped blobs (LRU of open maps)."""
+
+    def __init__(self, outdir: str, max_open: int = _MAX_OPEN):
+        self.root = blobs_dir(outdir)
+        self.max_open = max_open
+        self._maps: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _map(self, h: str):
+        with self._lock:
+            m = self._maps.get(h)
+            if m is not None:
+                self._maps.move_to_end(h)
+                return m
+        with open(blob_path(self.root, h), 'rb') as f:
+            # Content-addressed blobs never change, so a map stays valid
+            # even after the file is garbage-collected.
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        with self._lock:
+            self._maps[h] = m
+            while len(self._maps) > self.max_open:
+                _h, old = self._maps.popitem(last=False)
+                if isinstance(old, mmap.mmap):
+                    old.close()
+        return m
+
+    def text(self, c: Dict, max_chars: int = 0) -> str:
+        """Code of row ``c``: inline ``code`` or its slice of the blob."""
+        code = c.get('code')
+        if code is None and c.get('blob') and c.get('byte_range'):
+            start, end = c['byte_range']
+            if max_chars > 0:
+                end = min(end, start + 4 * max_chars)  # utf-8: at most 4 bytes per char
+            try:
+                code = bytes(self._map(c['blob'])[start:end]).decode('utf-8', 'ignore')
+            except (OSError, ValueError):
+                code = ''
+        code = code or ''
+        return code[:max_chars] if max_chars > 0 else code
+
+    def hydrate(self, c: Dict) -> Dict:
+        if c.get('code') is None and c.get('blob'):
+            c['code'] = self.text(c)
+        return c
+
+    def iter_hydrated(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        for c in rows:
+            yield self.hydrate(c)
+
+
+_READERS: Dict[str, BlobReader] = {}
+_READERS_LOCK = threading.Lock()
+
+
+def reader(outdir: str) -> BlobReader:
+    """Shared per-process reader for ``outdir``."""
+    key = os.path.abspath(outdir)
+    with _READERS_LOCK:
+        r = _READERS.get(key)
+        if r is None:
+            r = _READERS[key] = BlobReader(outdir)
+        return r
+
+
+def hydrate(outdir: str, c: Dict) -> Dict:
+    """Fill ``c['code']`` from the blob store if the row only has offsets."""
+    return reader(outdir).hydrate(c) if c.get('code') is None and c.get('blob') else c
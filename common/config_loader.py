@@ -90,6 +90,11 @@ def _out_base_dir() -> Path:
     return root / "out"
 
 
+def out_base_dir() -> str:
+    """Directory holding every repo's out dir (OUT_DIR_BASE or the default)."""
+    return str(_out_base_dir())
+
+
 def out_dir(name: str) -> str:
     return str(_out_base_dir() / name)
 
@@ -123,6 +128,19 @@ def layer_bonuses(name: str) -> Dict[str, Dict[str, float]]:
     return out
 
 
+def prefix_dim(name: str) -> int:
+    """Matryoshka prefix dimension for ``name``: the repo's ``prefix_dim`` in
+    repos.json, else EMBED_PREFIX_DIM (0 = full vectors only)."""
+    r = _find_repo(name) or {}
+    raw = r.get("prefix_dim")
+    if raw is None:
+        raw = os.getenv("EMBED_PREFIX_DIM", "0") or 0
+    try:
+        return max(0, int(raw))
+    except (TypeError, ValueError):
+        return 0
+
+
 def choose_repo_from_query(query: str, default: Optional[str] = None) -> str:
     q = (query or "").lower().strip()
     if ":" in q:
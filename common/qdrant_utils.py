@@ -1,6 +1,9 @@
+"""Qdrant collection helpers: 404-safe recreate and alias-swapped versions."""
+
 from __future__ import annotations
 
-"""Qdrant recreate fallback wrappers to avoid hard failures on 404/exists."""
+import os
+
 
 def recreate_collection(client, collection_name: str, vectors_config):
     try:
@@ -13,3 +16,146 @@ def recreate_collection(client, collection_name: str, vectors_config):
             pass
         return client.create_collection(collection_name=collection_name, vectors_config=vectors_config)
 
+
+
+# --- Versioned collections behind an alias (zero-downtime rebuilds) ---
+#
+# Full rebuilds go into a fresh ``<alias>__v<timestamp>`` collection; queries
+# keep using the alias name (e.g. ``code_chunks_<repo>``), which is repointed
+# atomically once the upload has finished. Older versions are then dropped.
+
+VERSION_SEP = "__v"
+
+
+def resolve_alias(client, alias: str):
+    """Collection currently served under ``alias``: the alias target, a plain
+    collection of that name (pre-alias layout), or None."""
+    try:
+        for a in client.get_aliases().aliases:
+            if a.alias_name == alias:
+                return a.collection_name
+    except Exception:
+        pass
+    try:
+        if client.collection_exists(alias):
+            return alias
+    except Exception:
+        pass
+    return None
+
+
+def create_versioned_collection(client, alias: str, vectors_config, **kwargs) -> str:
+    from datetime import datetime
+    name = f"{alias}{VERSION_SEP}{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}"
+    client.create_collection(collection_name=name, vectors_config=vectors_config, **kwargs)
+    return name
+
+
+def swap_alias(client, alias: str, collection: str):
+    """Point ``alias`` at ``collection`` in one alias transaction.
+
+    Returns the collection previously served under ``alias`` (if any). A plain
+    collection that still holds the alias name has to be dropped first; that
+    one-time migration is the only moment the name is briefly unavailable.
+    """
+    from qdrant_client import models
+    prev = resolve_alias(client, alias)
+    ops = []
+    if prev == alias:
+        client.delete_collection(alias)
+        prev = None
+    elif prev is not None:
+        ops.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    ops.append(models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=ops)
+    return prev
+
+
+def gc_versions(client, alias: str, keep: int = 0):
+    """Delete versioned collections of ``alias`` older than the live one,
+    except the ``keep`` most recent. Newer ones may be builds in progress and
+    are left alone; failed builds are collected after the next swap.
+    Returns the deleted names."""
+    live = resolve_alias(client, alias)
+    prefix = alias + VERSION_SEP
+    try:
+        names = sorted(c.name for c in client.get_collections().collections if c.name.startswith(prefix))
+    except Exception:
+        return []
+    if live is None:
+        return []
+    old = [n for n in names if n < live]
+    doomed = old[:max(0, len(old) - max(0, keep))]
+    deleted = []
+    for n in doomed:
+        try:
+            client.delete_collection(n)
+            deleted.append(n)
+        except Exception:
+            pass
+    return deleted
+
+
+# --- Quantization (QDRANT_QUANTIZATION=none|scalar|binary) ---
+
+QUANTIZATION_MODES = ("none", "scalar", "binary")
+DEFAULT_OVERSAMPLING = {"scalar": 2.0, "binary": 3.0}
+
+
+def quantization_mode() -> str:
+    mode = (os.getenv("QDRANT_QUANTIZATION", "none") or "none").strip().lower()
+    return mode if mode in QUANTIZATION_MODES else "none"
+
+
+def quantization_config(mode: str):
+    """Collection-level quantization config: int8 scalar or 1-bit binary codes
+    kept in RAM, with the float32 originals on disk for rescoring."""
+    from qdrant_client import models
+    if mode == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def quantization_search_params(mode: str):
+    """Query-time params for a quantized collection: search the codes, then
+    rescore an oversampled candidate set with the original vectors."""
+    from qdrant_client import models
+    if mode not in ("scalar", "binary"):
+        return None
+    try:
+        oversampling = float(os.getenv("QDRANT_OVERSAMPLING", "") or DEFAULT_OVERSAMPLING[mode])
+    except ValueError:
+        oversampling = DEFAULT_OVERSAMPLING[mode]
+    rescore = (os.getenv("QDRANT_RESCORE", "1") or "1").strip() != "0"
+    return models.SearchParams(quantization=models.QuantizationSearchParams(
+        ignore=False, rescore=rescore, oversampling=oversampling))
+
+
+# --- Matryoshka prefix vectors (per-repo ``prefix_dim`` / EMBED_PREFIX_DIM) ---
+#
+# Collections built with a prefix dimension carry a second named vector, the
+# first ``prefix_dim`` components of the embedding re-normalized, kept in RAM
+# for the first-stage search; the full vector moves to disk and only rescores
+# the oversampled candidates.
+
+PREFIX_NAME = "dense_prefix"
+DEFAULT_PREFIX_OVERSAMPLING = 4.0
+
+
+def prefix_oversampling() -> float:
+    try:
+        return max(1.0, float(os.getenv("EMBED_PREFIX_OVERSAMPLING", "") or DEFAULT_PREFIX_OVERSAMPLING))
+    except ValueError:
+        return DEFAULT_PREFIX_OVERSAMPLING
+
+
+def shard_number() -> int:
+    """QDRANT_SHARD_NUMBER: shards of a new collection, spread over the nodes
+    of a Qdrant cluster and searched in parallel by Qdrant itself."""
+    try:
+        return max(1, int(os.getenv("QDRANT_SHARD_NUMBER", "1") or 1))
+    except ValueError:
+        return 1
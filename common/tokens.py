@@ -0,0 +1,84 @@
+"""Token counts for chunk sizing, embedding clipping and context packing.
+
+Counts use tiktoken's ``cl100k_base`` (the tokenizer of the OpenAI embedding
+and chat models) when its encoding can be loaded, else a conservative
+estimate of ~3 characters per token. The chunker sizes chunks against the
+embedding model's budget and stores the count as ``token_count`` on every
+chunk, so later stages read it instead of re-tokenizing.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+# EMBEDDING_TYPE -> (model, max input tokens)
+EMBED_MODELS: Dict[str, Tuple[str, int]] = {
+    'openai': ('text-embedding-3-large', 8191),
+    'voyage': ('voyage-code-3', 32000),
+    'local': ('BAAI/bge-small-en-v1.5', 512),
+    'mxbai': ('mixedbread-ai/mxbai-embed-large-v1', 512),
+}
+DEFAULT_CHUNK_TOKENS = 400
+# The local models use WordPiece, which splits code finer than cl100k;
+# chunks stay under this share of their input limit.
+LIMIT_SHARE = 0.75
+
+_ENC = None
+_ENC_TRIED = False
+_ENC_LOCK = threading.Lock()
+
+
+def encoding():
+    """The cl100k encoding, or None if tiktoken or its data is unavailable
+    (tried once per process)."""
+    global _ENC, _ENC_TRIED
+    if not _ENC_TRIED:
+        with _ENC_LOCK:
+            if not _ENC_TRIED:
+                try:
+                    import tiktoken  # type: ignore
+                    _ENC = tiktoken.get_encoding('cl100k_base')
+                except Exception:
+                    _ENC = None
+                _ENC_TRIED = True
+    return _ENC
+
+
+def tokenizer_name() -> str:
+    return 'cl100k' if encoding() is not None else 'chars/3'
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = encoding()
+    if enc is None:
+        return (len(text) + 2) // 3
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def stored_tokens(c: Dict) -> int:
+    """``token_count`` of a chunk row, counted from its code if missing."""
+    n = c.get('token_count')
+    return int(n) if n is not None else count_tokens(c.get('code') or '')
+
+
+def embed_token_limit(embedding_type: Optional[str] = None) -> int:
+    et = (embedding_type or os.getenv('EMBEDDING_TYPE', 'openai') or 'openai').lower()
+    return EMBED_MODELS.get(et, EMBED_MODELS['openai'])[1]
+
+
+def chunk_token_budget(embedding_type: Optional[str] = None) -> int:
+    """Target tokens per chunk: CHUNK_TOKENS (default 400), capped at
+    LIMIT_SHARE of the embedding model's input limit. 0 sizes chunks by
+    non-whitespace characters instead."""
+    raw = (os.getenv('CHUNK_TOKENS', '') or '').strip()
+    try:
+        n = int(raw) if raw else DEFAULT_CHUNK_TOKENS
+    except ValueError:
+        n = DEFAULT_CHUNK_TOKENS
+    if n <= 0:
+        return 0
+    return max(1, min(n, int(embed_token_limit(embedding_type) * LIMIT_SHARE)))
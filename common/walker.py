@@ -0,0 +1,300 @@
+"""os.scandir-based repository walker.
+
+Honours, in order of cost: pruned directory names (``PRUNE_DIRS`` and the
+chunker's ``SKIP_DIRS``), exclude globs (``exclude_globs.txt``) and
+``.gitignore`` files (plus ``.git/info/exclude``; WALK_GITIGNORE=0 turns
+them off). Directories are rejected before they are descended into, and each
+file is stat()ed at most once through its directory entry.
+
+Exclude globs keep ``fnmatch`` semantics (``*`` also matches ``/``) but are
+compiled once into a single regex instead of being tried one by one; a
+pattern ending in ``*`` that matches ``dir/`` covers everything below it, so
+those also prune directories. ``.gitignore`` rules follow git: patterns
+without a slash match at any depth, ``!`` re-includes, a trailing ``/`` only
+matches directories, deeper files and later lines win.
+
+Walk order is deterministic (entries sorted by name, a directory's files
+before its subdirectories).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import fnmatch
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def gitignore_enabled() -> bool:
+    return (os.getenv('WALK_GITIGNORE', '1') or '1').strip() != '0'
+
+
+class GlobMatcher:
+    """fnmatch-compatible patterns compiled into one regex."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = [p for p in patterns if p]
+        self._any = self._compile(self.patterns)
+        self._dirs = self._compile([p for p in self.patterns if p.endswith('*')])
+
+    @staticmethod
+    def _compile(patterns: List[str]):
+        if not patterns:
+            return None
+        return re.compile('|'.join(f'(?:{fnmatch.translate(p)})' for p in patterns))
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def match(self, path: str) -> bool:
+        return bool(self._any is not None and self._any.match(path))
+
+    def match_dir(self, path: str) -> bool:
+        """True if every path below directory ``path`` is matched."""
+        return bool(self._dirs is not None and self._dirs.match(path.rstrip('/') + '/'))
+
+
+def _gitignore_regex(pat: str) -> str:
+    anchored = '/' in pat
+    pat = pat.lstrip('/')
+    out, i, n = [], 0, len(pat)
+    while i < n:
+        c = pat[i]
+        if c == '*':
+            if pat.startswith('**/', i):
+                out.append('(?:.*/)?')
+                i += 3
+                continue
+            if pat.startswith('**', i):
+                out.append('.*')
+                i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = pat.find(']', i + 2)
+            if j < 0:
+                out.append(re.escape(c))
+            else:
+                body = pat[i + 1:j]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pat[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ('' if anchored else '(?:.*/)?') + ''.join(out) + r'\Z'
+
+
+def _parse_gitignore(lines: Iterable[str]) -> List[Tuple[re.Pattern, bool, bool]]:
+    """``(regex, negated, dir_only)`` per rule, in file order."""
+    rules: List[Tuple[re.Pattern, bool, bool]] = []
+    for raw in lines:
+        line = raw.rstrip('\n')
+        if not line or line.startswith('#'):
+            continue
+        if not line.endswith('\\ '):
+            line = line.rstrip()
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        try:
+            rules.append((re.compile(_gitignore_regex(line)), negate, dir_only))
+        except re.error:
+            continue
+    return rules
+
+
+class _IgnoreFile:
+    """Rules of one .gitignore, matched against paths relative to its dir."""
+
+    def __init__(self, rules: List[Tuple[re.Pattern, bool, bool]]):
+        self.rules = rules
+        # Without negations the order doesn't matter: one regex per kind.
+        self._simple = not any(neg for _r, neg, _d in rules)
+        if self._simple:
+            any_kind = [r.pattern for r, _n, d in rules if not d]
+            self._files = re.compile('|'.join(f'(?:{p})' for p in any_kind)) if any_kind else None
+            every = [r.pattern for r, _n, _d in rules]
+            self._dirs = re.compile('|'.join(f'(?:{p})' for p in every)) if every else None
+
+    def decide(self, rel: str, is_dir: bool) -> Optional[bool]:
+        """True = ignored, False = re-included, None = no rule matched."""
+        if self._simple:
+            rx = self._dirs if is_dir else self._files
+            return True if rx is not None and rx.match(rel) else None
+        for rx, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if rx.match(rel):
+                return not negate
+        return None
+
+    @staticmethod
+    def read(path: str) -> List[Tuple[re.Pattern, bool, bool]]:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                return _parse_gitignore(f)
+        except OSError:
+            return []
+
+
+def _relpath(path: str, base: str) -> str:
+    if path.startswith(base) and path[len(base):len(base) + 1] == os.sep:
+        return path[len(base) + 1:]
+    return os.path.relpath(path, base)
+
+
+class RepoWalker:
+    """Walks one root. ``prune`` are directory names never entered,
+    ``skip_dir(name)`` an extra name test, ``excludes`` globs matched against
+    both the absolute and the root-relative path, ``abs_excludes`` globs
+    matched against the absolute path only, ``file_ok(name)`` a cheap
+    filename filter applied before anything else."""
+
+    def __init__(self, root: str, prune: Iterable[str] = (), skip_dir: Optional[Callable[[str], bool]] = None,
+                 excludes: Iterable[str] = (), abs_excludes: Iterable[str] = (),
+                 file_ok: Optional[Callable[[str], bool]] = None, gitignore: Optional[bool] = None):
+        self.root = root  # kept as given: yielded paths are os.path.join(root, ...) like os.walk
+        self.prune = frozenset(prune)
+        self.skip_dir = skip_dir
+        self.excludes = GlobMatcher(excludes)
+        self.abs_excludes = GlobMatcher(abs_excludes)
+        self.file_ok = file_ok
+        self.gitignore = gitignore_enabled() if gitignore is None else gitignore
+        self._ignore_files: Dict[str, Optional[_IgnoreFile]] = {}
+
+    # --- rules ---
+
+    def _rel(self, path: str) -> str:
+        return _relpath(path, self.root)
+
+    def _dir_name_pruned(self, name: str) -> bool:
+        return name in self.prune or (self.skip_dir is not None and self.skip_dir(name))
+
+    def _globbed(self, path: str, is_dir: bool) -> bool:
+        if is_dir:
+            return bool(self.excludes) and (self.excludes.match_dir(path) or self.excludes.match_dir(self._rel(path))) \
+                or self.abs_excludes.match_dir(path)
+        return bool(self.excludes) and (self.excludes.match(path) or self.excludes.match(self._rel(path))) \
+            or self.abs_excludes.match(path)
+
+    def _ignore_file(self, d: str) -> Optional[_IgnoreFile]:
+        if d not in self._ignore_files:
+            rules = _IgnoreFile.read(os.path.join(d, '.gitignore'))
+            if d == self.root:
+                # .git/info/exclude ranks below the root .gitignore.
+                rules = _IgnoreFile.read(os.path.join(d, '.git', 'info', 'exclude')) + rules
+            self._ignore_files[d] = _IgnoreFile(rules) if rules else None
+        return self._ignore_files[d]
+
+    def _frames(self, d: str) -> List[Tuple[str, _IgnoreFile]]:
+        """(dir, rules) for every .gitignore from the root down to ``d``."""
+        rel = self._rel(d)
+        parts = [] if rel == '.' else rel.split(os.sep)
+        frames = []
+        cur = self.root
+        for i in range(len(parts) + 1):
+            if i:
+                cur = os.path.join(cur, parts[i - 1])
+            rules = self._ignore_file(cur)
+            if rules is not None:
+                frames.append((cur, rules))
+        return frames
+
+    @staticmethod
+    def _git_ignored(frames: List[Tuple[str, _IgnoreFile]], path: str, is_dir: bool) -> bool:
+        for base, rules in reversed(frames):
+            got = rules.decide(_relpath(path, base).replace(os.sep, '/'), is_dir)
+            if got is not None:
+                return got
+        return False
+
+    def ignored(self, path: str) -> bool:
+        """Would ``walk()`` skip this (existing) file? Checks every ancestor
+        directory too, for paths that come from git or the file watcher."""
+        rel = self._rel(path)
+        if rel.startswith('..'):
+            return True
+        parts = rel.split(os.sep)
+        if self.file_ok is not None and not self.file_ok(parts[-1]):
+            return True
+        cur = self.root
+        for name in parts[:-1]:
+            cur = os.path.join(cur, name)
+            if self._dir_name_pruned(name) or self._globbed(cur, True):
+                return True
+            if self.gitignore and self._git_ignored(self._frames(os.path.dirname(cur)), cur, True):
+                return True
+        if self._globbed(path, False):
+            return True
+        return self.gitignore and self._git_ignored(self._frames(os.path.dirname(path)), path, False)
+
+    # --- walking ---
+
+    def _walk(self, want_files: bool) -> Iterator[str]:
+        stack: List[Tuple[str, List[Tuple[str, _IgnoreFile]]]] = [(self.root, [])]
+        while stack:
+            d, frames = stack.pop()
+            if self.gitignore:
+                rules = self._ignore_file(d)
+                if rules is not None:
+                    frames = frames + [(d, rules)]
+            try:
+                with os.scandir(d) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            if not want_files:
+                yield d
+            subdirs = []
+            for e in entries:
+                try:
+                    is_dir = e.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if self._dir_name_pruned(e.name) or self._globbed(e.path, True):
+                        continue
+                    if frames and self._git_ignored(frames, e.path, True):
+                        continue
+                    subdirs.append(e.path)
+                elif want_files:
+                    if self.file_ok is not None and not self.file_ok(e.name):
+                        continue
+                    try:
+                        if not e.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if self._globbed(e.path, False):
+                        continue
+                    if frames and self._git_ignored(frames, e.path, False):
+                        continue
+                    yield e.path
+            stack.extend((sd, frames) for sd in reversed(subdirs))
+
+    def walk(self) -> Iterator[str]:
+        """Files under the root that pass every rule."""
+        if os.path.isfile(self.root):
+            name = os.path.basename(self.root)
+            if (self.file_ok is None or self.file_ok(name)) and not self.abs_excludes.match(self.root):
+                yield self.root
+            return
+        yield from self._walk(True)
+
+    def dirs(self) -> Iterator[str]:
+        """Directories that ``walk()`` descends into (the root included)."""
+        if os.path.isdir(self.root):
+            yield from self._walk(False)
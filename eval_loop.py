@@ -7,13 +7,14 @@ Usage:
   python eval_loop.py --watch            # Run on file changes
   python eval_loop.py --baseline         # Save current results as baseline
   python eval_loop.py --compare          # Compare against baseline
+  python eval_loop.py --dim-tiers 128,256,512   # Matryoshka prefix tiers: recall vs latency
 """
 import os
 import sys
 import json
 import time
 import argparse
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 from dotenv import load_dotenv
 from eval_rag import hit, GOLDEN_PATH, USE_MULTI, FINAL_K
 from retrieval.hybrid_search import search_routed, search_routed_multi
@@ -24,21 +25,21 @@ load_dotenv()
 BASELINE_PATH = os.getenv('BASELINE_PATH', 'eval_baseline.json')
 
 
-def run_eval_with_results() -> Dict[str, Any]:
-    """Run eval and return detailed results."""
+def load_golden() -> Tuple[List[Dict[str, Any]], str]:
+    """Valid golden questions, or an error message."""
     if not os.path.exists(GOLDEN_PATH):
-        return {"error": f"No golden questions file found at: {GOLDEN_PATH}. Create golden.json with test questions first."}
+        return [], f"No golden questions file found at: {GOLDEN_PATH}. Create golden.json with test questions first."
 
     try:
         with open(GOLDEN_PATH) as f:
             gold = json.load(f)
     except json.JSONDecodeError as e:
-        return {"error": f"Invalid JSON in {GOLDEN_PATH}: {e}. Check file syntax."}
+        return [], f"Invalid JSON in {GOLDEN_PATH}: {e}. Check file syntax."
     except Exception as e:
-        return {"error": f"Failed to read {GOLDEN_PATH}: {e}"}
+        return [], f"Failed to read {GOLDEN_PATH}: {e}"
 
     if not isinstance(gold, list):
-        return {"error": f"golden.json must be a JSON array, got {type(gold).__name__}"}
+        return [], f"golden.json must be a JSON array, got {type(gold).__name__}"
 
     # Filter out comment entries and invalid questions
     valid_questions = []
@@ -55,7 +56,15 @@ def run_eval_with_results() -> Dict[str, Any]:
         valid_questions.append(row)
 
     if not valid_questions:
-        return {"error": f"No valid questions found in {GOLDEN_PATH}. Each question must have a 'q' field."}
+        return [], f"No valid questions found in {GOLDEN_PATH}. Each question must have a 'q' field."
+    return valid_questions, ""
+
+
+def run_eval_with_results() -> Dict[str, Any]:
+    """Run eval and return detailed results."""
+    valid_questions, error = load_golden()
+    if error:
+        return {"error": error}
 
     total = len(valid_questions)
     hits_top1 = 0
@@ -182,6 +191,121 @@ def compare_with_baseline(current: Dict[str, Any]):
         return False
 
 
+def _prefix_copy(qc, src: str, dst: str, pdim: int) -> None:
+    """Copy ``src`` into ``dst`` with a ``pdim`` Matryoshka prefix vector
+    derived from the stored full vectors (no re-embedding)."""
+    import numpy as np
+    from qdrant_client import models
+    from common.qdrant_utils import PREFIX_NAME
+    dim = qc.get_collection(src).config.params.vectors['dense'].size
+    if qc.collection_exists(dst):
+        qc.delete_collection(dst)
+    qc.create_collection(dst, vectors_config={
+        'dense': models.VectorParams(size=dim, distance=models.Distance.COSINE, on_disk=True),
+        PREFIX_NAME: models.VectorParams(size=pdim, distance=models.Distance.COSINE),
+    })
+    offset = None
+    while True:
+        points, offset = qc.scroll(src, limit=256, offset=offset, with_vectors=['dense'],
+                                   with_payload=models.PayloadSelectorInclude(include=['file_path']))
+        if points:
+            full = np.asarray([p.vector['dense'] for p in points], dtype=np.float32)
+            pre = full[:, :pdim]
+            pre = pre / np.maximum(np.linalg.norm(pre, axis=1, keepdims=True), 1e-12)
+            qc.upsert(dst, points=models.Batch(ids=[p.id for p in points],
+                                               vectors={'dense': full.tolist(), PREFIX_NAME: pre.tolist()},
+                                               payloads=[p.payload for p in points]), wait=True)
+        if offset is None:
+            break
+
+
+def run_dim_tiers(tiers: List[int], repeats: int = 3, keep: bool = False) -> Dict[str, Any]:
+    """Benchmark Matryoshka prefix tiers on the golden questions.
+
+    For each repo, every tier gets a scratch copy of the live collection with
+    a prefix vector of that size; dense retrieval (prefix search + full-vector
+    rescoring, as in hybrid_search) is then scored for recall@K against exact
+    full-vector search, golden top-K hits and query latency. ``full`` is the
+    live collection as served. Only the dense stage is measured: BM25 and
+    reranking don't depend on the tier.
+    """
+    import statistics
+    from qdrant_client import QdrantClient, models
+    from common.qdrant_utils import resolve_alias
+    from retrieval.hybrid_search import QDRANT_URL, _dense_prefetch, _get_embedding, _index_meta
+
+    questions, error = load_golden()
+    if error:
+        return {"error": error}
+    qc = QdrantClient(url=QDRANT_URL)
+    by_repo: Dict[str, List[Dict[str, Any]]] = {}
+    for row in questions:
+        by_repo.setdefault(row.get('repo') or os.getenv('REPO', 'agro'), []).append(row)
+
+    report: Dict[str, Any] = {"final_k": FINAL_K, "repeats": repeats, "repos": {}}
+    for repo, rows in by_repo.items():
+        src = resolve_alias(qc, os.getenv('COLLECTION_NAME', f'code_chunks_{repo}'))
+        if src is None:
+            report["repos"][repo] = {"error": "no Qdrant collection"}
+            continue
+        meta = _index_meta(repo)
+        dim = qc.get_collection(src).config.params.vectors['dense'].size
+        qs = [(_get_embedding(r['q'], kind="query"), r.get('expect_paths') or []) for r in rows]
+        truth = [[str(p.id) for p in getattr(qc.query_points(src, query=e, using='dense', limit=FINAL_K,
+                                                             search_params=models.SearchParams(exact=True)), 'points', [])]
+                 for e, _exp in qs]
+
+        def measure(coll: str, tier_meta: Dict[str, Any]) -> Dict[str, Any]:
+            lat: List[float] = []
+            recall = hits = 0.0
+            for i, (e, expect) in enumerate(qs):
+                dp = _dense_prefetch(e, tier_meta, FINAL_K)
+                for _ in range(max(1, repeats)):
+                    t = time.perf_counter()
+                    res = qc.query_points(coll, prefetch=dp.prefetch, query=dp.query, using=dp.using, limit=dp.limit,
+                                          search_params=dp.params,
+                                          with_payload=models.PayloadSelectorInclude(include=['file_path']))
+                    lat.append((time.perf_counter() - t) * 1000.0)
+                pts = getattr(res, 'points', res)
+                ids = [str(p.id) for p in pts]
+                recall += len(set(ids) & set(truth[i])) / max(1, len(truth[i]))
+                hits += 1.0 if hit([(p.payload or {}).get('file_path', '') for p in pts], expect) else 0.0
+            n = max(1, len(qs))
+            lat.sort()
+            return {
+                "recall_at_k": round(recall / n, 3),
+                "topk_accuracy": round(hits / n, 3),
+                "p50_ms": round(statistics.median(lat), 2),
+                "p95_ms": round(lat[min(len(lat) - 1, int(0.95 * len(lat)))], 2),
+            }
+
+        tiers_out: Dict[str, Any] = {"full": dict(measure(src, dict(meta, prefix_dim=0)), dim=dim, ram_bytes_per_point=dim * 4)}
+        for d in sorted(set(t for t in tiers if 0 < t < dim)):
+            scratch = f"{src}__tier{d}"
+            try:
+                _prefix_copy(qc, src, scratch, d)
+                tiers_out[str(d)] = dict(measure(scratch, {'prefix_dim': d}), dim=d, ram_bytes_per_point=d * 4)
+            finally:
+                if not keep:
+                    try:
+                        qc.delete_collection(scratch)
+                    except Exception:
+                        pass
+        report["repos"][repo] = {"collection": src, "questions": len(qs), "tiers": tiers_out}
+    return report
+
+
+def print_dim_tiers(report: Dict[str, Any]) -> None:
+    for repo, r in report["repos"].items():
+        print(f"\n[{repo}] " + (r.get("error") or f"{r['collection']} ({r['questions']} questions)"))
+        if "tiers" not in r:
+            continue
+        print(f"  {'tier':>6} {'recall@' + str(report['final_k']):>9} {'top-k acc':>9} {'p50 ms':>8} {'p95 ms':>8} {'RAM/pt':>8}")
+        for name, t in r["tiers"].items():
+            print(f"  {name:>6} {t['recall_at_k']:>9.3f} {t['topk_accuracy']:>9.3f} {t['p50_ms']:>8.2f} "
+                  f"{t['p95_ms']:>8.2f} {t['ram_bytes_per_point']:>7}B")
+
+
 def watch_mode():
     """Watch for file changes and re-run eval."""
     print("⏱ Watch mode: monitoring for changes...")
@@ -234,9 +358,23 @@ def main():
     parser.add_argument("--compare", action="store_true", help="Compare current results with baseline")
     parser.add_argument("--watch", action="store_true", help="Watch for file changes and re-run")
     parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    parser.add_argument("--dim-tiers", help="Benchmark Matryoshka prefix dims, e.g. 128,256,512")
+    parser.add_argument("--keep-tiers", action="store_true", help="Keep the scratch tier collections")
 
     args = parser.parse_args()
 
+    if args.dim_tiers:
+        tiers = [int(x) for x in args.dim_tiers.split(',') if x.strip()]
+        report = run_dim_tiers(tiers, keep=args.keep_tiers)
+        if "error" in report:
+            print(f"Error: {report['error']}", file=sys.stderr)
+            sys.exit(1)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_dim_tiers(report)
+        return
+
     if args.watch:
         watch_mode()
         return
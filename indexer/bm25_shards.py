@@ -0,0 +1,187 @@
+"""Sharded BM25 build for very large repos (INDEX_SHARDS=dir | hash:N).
+
+Chunks are partitioned by their file's top-level directory (``dir``) or by
+a hash of the repo-relative path (``hash:N``), and every shard gets its own
+bm25s index under ``<out>/bm25_shards/<shard>/``. chunks.jsonl is split in
+one pass; a shard is rebuilt only when the digest of its chunks (ids and
+BM25 text) changed, so an edit under ``api/`` never re-tokenizes ``web/``.
+Changed shards build in parallel (INDEX_WORKERS processes) into a temporary
+directory that is swapped in when complete, so searches never see a
+half-built shard. ``hybrid_search`` queries every shard listed in
+``shards.json`` and merges the hits by score.
+
+The layout is recorded in the manifest (``bm25.shards``); runs without
+INDEX_SHARDS keep it, so manual and watcher builds never flip between a
+sharded and a single index. INDEX_SHARDS=off switches back to one index.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import shutil
+import hashlib
+import zlib
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+SHARDS_DIR = 'bm25_shards'
+STATE_NAME = 'shards.json'
+_SAFE = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._-')
+
+
+def shard_mode(recorded: Optional[str] = None) -> Optional[str]:
+    """``dir``, ``hash:N`` or None (one BM25 index for the whole repo).
+    Without INDEX_SHARDS, the ``recorded`` mode of the last build."""
+    raw = (os.getenv('INDEX_SHARDS', '') or '').strip().lower() or (recorded or '').lower()
+    if raw == 'dir':
+        return raw
+    if raw.startswith('hash:'):
+        try:
+            n = int(raw.split(':', 1)[1])
+        except ValueError:
+            return None
+        return f'hash:{n}' if n > 1 else None
+    return None
+
+
+def rebuild_requested() -> set:
+    """Shards named in REBUILD_SHARDS (comma-separated) are rebuilt from scratch."""
+    return {s.strip() for s in (os.getenv('REBUILD_SHARDS', '') or '').split(',') if s.strip()}
+
+
+def _relative(fp: str, bases: List[str]) -> str:
+    best = ''
+    for b in bases:
+        b = os.path.abspath(b)
+        if (fp == b or fp.startswith(b.rstrip(os.sep) + os.sep)) and len(b) > len(best):
+            best = b
+    return os.path.relpath(fp, best) if best else fp.lstrip(os.sep)
+
+
+def shard_of(fp: str, bases: List[str], mode: str) -> str:
+    rel = _relative(os.path.abspath(fp), bases).replace(os.sep, '/')
+    if mode.startswith('hash:'):
+        n = int(mode.split(':', 1)[1])
+        return f'h{zlib.crc32(rel.encode("utf-8")) % n:03d}'
+    head, sep, _rest = rel.partition('/')
+    name = head if sep else '_root'
+    return ''.join(ch if ch in _SAFE else '_' for ch in name) or '_root'
+
+
+def shards_dir(outdir: str) -> str:
+    return os.path.join(outdir, SHARDS_DIR)
+
+
+def read_state(outdir: str) -> Dict:
+    try:
+        with open(os.path.join(shards_dir(outdir), STATE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def remove_shards(outdir: str) -> None:
+    shutil.rmtree(shards_dir(outdir), ignore_errors=True)
+
+
+def _iter_docs(path: str) -> Iterator[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _build_one(tmp: str, final: str, save_corpus: bool = True) -> Tuple[int, float]:
+    """Worker: index ``tmp/docs.jsonl`` into ``tmp`` and swap it into ``final``."""
+    from indexer.bm25_stream import build_bm25_streaming
+    docs = os.path.join(tmp, 'docs.jsonl')
+    n, avgdl = build_bm25_streaming(lambda: _iter_docs(docs), tmp, save_corpus=save_corpus)
+    os.remove(docs)
+    old = final + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.isdir(final):
+        os.replace(final, old)
+    os.replace(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+    return n, avgdl
+
+
+def build_bm25_shards(chunks: Iterable[Dict], outdir: str, bases: List[str], mode: str,
+                      doc: Callable[[Dict], str], force: Iterable[str] = (), workers: int = 1,
+                      profiler=None, save_corpus: bool = True) -> Dict:
+    """Split ``chunks`` into shards and (re)build the ones that changed.
+
+    Returns the new state (also written to ``bm25_shards/shards.json``):
+    ``mode``, ``shards`` (name -> chunks, avgdl, digest), the names
+    ``rebuilt`` in this run and the corpus-wide ``avgdl``.
+    """
+    root = shards_dir(outdir)
+    os.makedirs(root, exist_ok=True)
+    prev = read_state(outdir)
+    prev_shards = prev.get('shards', {}) if prev.get('mode') == mode else {}
+    force = set(force)
+
+    files: Dict[str, Tuple] = {}  # shard -> (docs file, ids file, digest, count)
+    try:
+        for c in chunks:
+            name = shard_of(c.get('file_path', ''), bases, mode)
+            fh = files.get(name)
+            if fh is None:
+                tmp = os.path.join(root, name + '.tmp')
+                shutil.rmtree(tmp, ignore_errors=True)
+                os.makedirs(tmp)
+                fh = files[name] = (open(os.path.join(tmp, 'docs.jsonl'), 'w', encoding='utf-8'),
+                                    open(os.path.join(tmp, 'chunk_ids.txt'), 'w', encoding='utf-8'),
+                                    hashlib.sha1(), [0])
+            text = doc(c)
+            cid = str(c['id'])
+            fh[0].write(json.dumps(text, ensure_ascii=False) + '\n')
+            fh[1].write(cid + '\n')
+            fh[2].update(f'{cid}\0{text}\n'.encode('utf-8', 'ignore'))
+            fh[3][0] += 1
+    finally:
+        for fh in files.values():
+            fh[0].close()
+            fh[1].close()
+
+    shards: Dict[str, Dict] = {}
+    todo: List[str] = []
+    for name, (_d, _i, digest, count) in sorted(files.items()):
+        old = prev_shards.get(name) or {}
+        tmp = os.path.join(root, name + '.tmp')
+        shards[name] = {'chunks': count[0], 'digest': digest.hexdigest(), 'avgdl': old.get('avgdl', 0.0)}
+        if name in force or old.get('digest') != shards[name]['digest'] \
+                or not os.path.isfile(os.path.join(root, name, 'chunk_ids.txt')):
+            todo.append(name)
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    jobs = [(os.path.join(root, n + '.tmp'), os.path.join(root, n), save_corpus) for n in todo]
+    with (profiler.stage('bm25_shards') if profiler is not None else nullcontext({})) as st:
+        if len(jobs) > 1 and workers > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as ex:
+                results = list(ex.map(_build_one, *zip(*jobs)))
+        else:
+            results = [_build_one(*job) for job in jobs]
+        for name, (_n, avgdl) in zip(todo, results):
+            shards[name]['avgdl'] = round(avgdl, 4)
+        st['items'] = sum(shards[n]['chunks'] for n in todo)
+        st['shards'] = len(todo)
+
+    for entry in os.listdir(root):
+        p = os.path.join(root, entry)
+        if os.path.isdir(p) and entry not in shards:
+            shutil.rmtree(p, ignore_errors=True)
+    total = sum(s['chunks'] for s in shards.values())
+    state = {
+        'mode': mode,
+        'shards': shards,
+        'rebuilt': todo,
+        'avgdl': sum(s['avgdl'] * s['chunks'] for s in shards.values()) / total if total else 0.0,
+    }
+    tmp_state = os.path.join(root, STATE_NAME + '.tmp')
+    with open(tmp_state, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_state, os.path.join(root, STATE_NAME))
+    return state
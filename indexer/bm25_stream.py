@@ -0,0 +1,101 @@
+"""Build the bm25s index from an on-disk corpus without holding it in memory.
+
+Documents come from a caller-supplied factory that re-reads them from disk
+(``index_repo`` derives them from chunks.jsonl). They are tokenized as a
+stream and their token ids are spilled to a flat int32 file, which bm25s then
+iterates (lengths, document frequencies, scores). Peak memory is the
+vocabulary plus the final sparse score matrix rather than several copies of
+the code text.
+"""
+
+from __future__ import annotations
+
+import os
+from array import array
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+import bm25s  # type: ignore
+from bm25s.tokenization import Tokenizer  # type: ignore
+from Stemmer import Stemmer  # type: ignore
+
+from indexer.build_report import BuildProfiler
+
+
+class _TokenIds:
+    """Re-iterable view over token ids spilled to disk (one int32 run per doc)."""
+
+    def __init__(self, path: str, offsets: array):
+        self.path = path
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        if len(self) == 0:
+            return
+        data = np.memmap(self.path, dtype=np.int32, mode='r') if self.offsets[-1] else np.zeros(0, dtype=np.int32)
+        offs = self.offsets
+        for i in range(len(self)):
+            yield data[offs[i]:offs[i + 1]].tolist()
+
+
+class _Corpus:
+    """Minimal object exposing the ``ids``/``vocab`` pair bm25s.index() accepts."""
+
+    def __init__(self, ids: _TokenIds, vocab: dict):
+        self.ids = ids
+        self.vocab = vocab
+
+
+def build_bm25_streaming(docs: Callable[[], Iterable[str]], index_dir: str,
+                         profiler: Optional[BuildProfiler] = None, save_corpus: bool = True) -> Tuple[int, float]:
+    """Tokenize ``docs()`` as a stream and save a bm25s index to ``index_dir``.
+
+    ``docs`` is called twice (tokenize, then save the corpus), so it must
+    return a fresh iterator each time. ``save_corpus=False`` skips the
+    corpus copy bm25s keeps next to the index (search never loads it).
+    Returns the number of indexed documents and their average length in
+    tokens (used for the BM25 sparse vectors in Qdrant). ``profiler`` gets
+    the ``bm25_tokenize`` / ``bm25_index`` / ``bm25_save`` stages.
+    """
+    prof = profiler or BuildProfiler()
+    os.makedirs(index_dir, exist_ok=True)
+    tokenizer = Tokenizer(stemmer=Stemmer('english'), stopwords='en')
+    tok_path = os.path.join(index_dir, 'tokens.tmp.bin')
+    offsets = array('q', [0])
+    with prof.stage('bm25_tokenize') as st, open(tok_path, 'wb') as out:
+        for ids in tokenizer.streaming_tokenize(docs()):
+            array('i', ids).tofile(out)
+            offsets.append(offsets[-1] + len(ids))
+        st['items'] = len(offsets) - 1
+        st['bytes'] = out.tell()
+    n = len(offsets) - 1
+    try:
+        with prof.stage('bm25_index') as st:
+            retriever = bm25s.BM25(method='lucene', k1=1.2, b=0.65)
+            retriever.index(_Corpus(_TokenIds(tok_path, offsets), tokenizer.get_vocab_dict()), show_progress=False)
+            try:
+                retriever.vocab_dict = {str(k): v for k, v in retriever.vocab_dict.items()}
+            except Exception:
+                pass
+            st['items'] = n
+        with prof.stage('bm25_save') as st:
+            retriever.save(index_dir, corpus=docs() if save_corpus else None)
+            if not save_corpus:
+                for name in ('corpus.jsonl', 'corpus.mmindex.json'):
+                    try:
+                        os.remove(os.path.join(index_dir, name))
+                    except OSError:
+                        pass
+            tokenizer.save_vocab(save_dir=index_dir)
+            tokenizer.save_stopwords(save_dir=index_dir)
+            st['items'] = n
+            st['bytes'] = sum(e.stat().st_size for e in os.scandir(index_dir) if e.is_file() and e.path != tok_path)
+    finally:
+        try:
+            os.remove(tok_path)
+        except OSError:
+            pass
+    return n, (offsets[-1] / n if n else 0.0)
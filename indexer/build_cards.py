@@ -3,6 +3,7 @@ import json
 from typing import Dict, Iterator
 from dotenv import load_dotenv
 from server.env_model import generate_text
+from common.blob_store import hydrate
 from common.config_loader import out_dir
 
 load_dotenv()
@@ -24,7 +25,7 @@ def iter_chunks() -> Iterator[Dict]:
     with open(CHUNKS, 'r', encoding='utf-8') as f:
         for line in f:
             o = json.loads(line)
-            yield o
+            yield hydrate(BASE, o)
 
 def main() -> None:
     os.makedirs(BASE, exist_ok=True)
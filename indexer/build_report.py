@@ -0,0 +1,143 @@
+"""Per-stage build profile for ``index_repo`` (``<out>/<repo>/build_report.json``).
+
+Every stage records wall time, CPU time (this process plus finished child
+processes, i.e. the ingestion pool), peak RSS so far, item and byte counts
+and the derived rates. Stages that run interleaved in one streaming loop
+(dedupe, enrich, write) or on other workers (read/chunk in the process pool,
+upload threads) are accumulated with ``add()``; for those ``wall_s`` is the
+summed time spent in the stage, which can exceed the build's wall time when
+the work ran in parallel (``parallel`` says on how many workers).
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import resource  # type: ignore
+except Exception:  # Windows
+    resource = None  # type: ignore
+
+REPORT_NAME = 'build_report.json'
+
+
+def _cpu() -> float:
+    t = time.process_time()
+    if resource is not None:
+        ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+        t += ru.ru_utime + ru.ru_stime
+    return t
+
+
+def peak_rss_mb(who: str = 'self') -> Optional[float]:
+    """Peak RSS of this process, or of its largest finished child (``children``)."""
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_CHILDREN if who == 'children' else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return round(kb / (1024.0 * 1024.0) if os.uname().sysname == 'Darwin' else kb / 1024.0, 1)
+
+
+class BuildProfiler:
+    def __init__(self):
+        self.started = datetime.utcnow().isoformat() + 'Z'
+        self._t0 = time.perf_counter()
+        self._c0 = _cpu()
+        self.stages: Dict[str, Dict] = {}
+        self.info: Dict = {}
+
+    def _entry(self, name: str) -> Dict:
+        e = self.stages.get(name)
+        if e is None:
+            # cpu_s stays None for stages timed on other workers.
+            e = self.stages[name] = {'wall_s': 0.0, 'cpu_s': None, 'items': 0, 'bytes': 0, 'peak_rss_mb': None}
+        return e
+
+    def add(self, name: str, wall: float = 0.0, cpu: Optional[float] = None, items: int = 0, nbytes: int = 0,
+            **extra) -> None:
+        e = self._entry(name)
+        e['wall_s'] += wall
+        if cpu is not None:
+            e['cpu_s'] = (e['cpu_s'] or 0.0) + cpu
+        e['items'] += int(items)
+        e['bytes'] += int(nbytes)
+        e['peak_rss_mb'] = peak_rss_mb()
+        e.update(extra)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict]:
+        """Time a block; the yielded dict takes ``items`` / ``bytes`` (added)
+        and any extra fields."""
+        counts: Dict = {'items': 0, 'bytes': 0}
+        t, c = time.perf_counter(), _cpu()
+        try:
+            yield counts
+        finally:
+            items, nbytes = counts.pop('items'), counts.pop('bytes')
+            self.add(name, time.perf_counter() - t, _cpu() - c, items, nbytes, **counts)
+
+    def timed(self, name: str, it: Iterable) -> Iterator:
+        """Yield from ``it``, charging the time spent waiting on each item
+        (e.g. on a worker pool) to stage ``name``."""
+        it = iter(it)
+        while True:
+            t, c = time.perf_counter(), _cpu()
+            try:
+                x = next(it)
+            except StopIteration:
+                self.add(name, time.perf_counter() - t, _cpu() - c)
+                return
+            self.add(name, time.perf_counter() - t, _cpu() - c, items=1)
+            yield x
+
+    def report(self) -> Dict:
+        stages: List[Dict] = []
+        for name, e in self.stages.items():
+            s = dict({'stage': name}, **e)
+            s['wall_s'] = round(e['wall_s'], 4)
+            if e['cpu_s'] is not None:
+                s['cpu_s'] = round(e['cpu_s'], 4)
+            if e['wall_s'] > 0:
+                s['items_per_s'] = round(e['items'] / e['wall_s'], 1) if e['items'] else None
+                s['mb_per_s'] = round(e['bytes'] / e['wall_s'] / 1e6, 2) if e['bytes'] else None
+            stages.append(s)
+        return {
+            'started': self.started,
+            'finished': datetime.utcnow().isoformat() + 'Z',
+            'wall_s': round(time.perf_counter() - self._t0, 3),
+            'cpu_s': round(_cpu() - self._c0, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_rss_children_mb': peak_rss_mb('children'),
+            'stages': stages,
+            **self.info,
+        }
+
+    def write(self, outdir: str) -> Dict:
+        rep = self.report()
+        try:
+            os.makedirs(outdir, exist_ok=True)
+            p = os.path.join(outdir, REPORT_NAME)
+            with open(p + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(rep, f, indent=2)
+            os.replace(p + '.tmp', p)
+        except Exception:
+            pass
+        return rep
+
+    def summary(self) -> str:
+        parts = [f"{name} {e['wall_s']:.2f}s" for name, e in self.stages.items() if e['wall_s'] >= 0.005]
+        return ', '.join(parts)
+
+
+def read_report(outdir: str) -> Dict:
+    """``build_report.json`` of ``outdir`` ({} if missing or unreadable)."""
+    try:
+        with open(os.path.join(outdir, REPORT_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
@@ -0,0 +1,158 @@
+"""Parallel ingestion stage: read, vet, hash and chunk files in a process pool.
+
+Each file is opened exactly once (mmap for large files). The size and
+line-length heuristics, the content hash used by the manifest and the
+license-header sniff used for origin tagging are all computed from that one
+buffer, then the decoded text is handed to ``chunk_code``. With a blob
+directory (CHUNK_STORE=blob) the worker also stores that text once in the
+content-addressed blob store and gives the chunks their byte offsets.
+
+Workers only import ``retrieval.ast_chunker`` so that spawn-based platforms
+(macOS, Windows) don't pay for the indexer's heavy imports in every child.
+Results come back in input order and at most ``workers * PREFETCH`` files are
+in flight at once, so memory stays bounded on large repos.
+"""
+
+from __future__ import annotations
+
+import os
+import mmap
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from common.blob_store import attach_offsets, put_blob
+from retrieval.ast_chunker import chunk_code, lang_from_path
+
+PREFETCH = 4
+MAX_FILE_CHARS = 2_000_000   # ~2MB of text
+MAX_AVG_LINE = 2500          # minified / generated one-liners
+MMAP_MIN_BYTES = 1 << 20
+HEAD_LINES = 12              # lines sniffed for license headers
+
+
+def chunk_workers() -> int:
+    """Worker count from INDEX_WORKERS (default: all cores; 1 = in-process)."""
+    raw = (os.getenv('INDEX_WORKERS', '') or '').strip()
+    try:
+        n = int(raw) if raw else (os.cpu_count() or 1)
+    except ValueError:
+        n = os.cpu_count() or 1
+    return max(1, n)
+
+
+def content_skip_reason(text: str) -> Optional[str]:
+    """Content heuristics shared by the pool and ``should_index_file``."""
+    if len(text) > MAX_FILE_CHARS:
+        return 'too_large'
+    lines = text.splitlines()
+    if lines:
+        avg = sum(len(x) for x in lines) / max(1, len(lines))
+        if avg > MAX_AVG_LINE:
+            return 'long_lines'
+    return None
+
+
+def _decode(buf) -> str:
+    # Match open(..., 'r', errors='ignore'): utf-8 with universal newlines.
+    text = str(buf, 'utf-8', 'ignore')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def ingest_file(fp: str, target: int = 900, expected_sha: Optional[str] = None, blobs: Optional[str] = None,
+                tokens: Optional[int] = None) -> Dict:
+    """Read ``fp`` once and return its ingestion record.
+
+    Keys: ``path``, ``sha1`` (of the raw bytes), ``skip`` (reason or None),
+    ``unchanged`` (sha matched ``expected_sha``; not chunked), ``head`` (first
+    lines for origin sniffing), ``chunks`` (sized to ``tokens``, see
+    ``chunk_code``) and, for the build report,
+    ``bytes`` read plus ``read_s`` / ``chunk_s`` spent reading and chunking.
+    """
+    rec: Dict = {'path': fp, 'sha1': None, 'skip': None, 'unchanged': False, 'head': '', 'chunks': [],
+                 'bytes': 0, 'read_s': 0.0, 'chunk_s': 0.0}
+    lang = lang_from_path(fp)
+    if not lang:
+        rec['skip'] = 'language'
+        return rec
+    t0 = time.perf_counter()
+    try:
+        with open(fp, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > 4 * MAX_FILE_CHARS:
+                # Even all-4-byte utf-8 would exceed the char limit; don't read it.
+                rec['skip'] = 'too_large'
+                return rec
+            rec['bytes'] = size
+            if size >= MMAP_MIN_BYTES:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    rec['sha1'] = hashlib.sha1(mm).hexdigest()
+                    if expected_sha is not None and rec['sha1'] == expected_sha:
+                        rec['unchanged'] = True
+                        rec['read_s'] = time.perf_counter() - t0
+                        return rec
+                    text = _decode(mm)
+            else:
+                data = f.read()
+                rec['sha1'] = hashlib.sha1(data).hexdigest()
+                if expected_sha is not None and rec['sha1'] == expected_sha:
+                    rec['unchanged'] = True
+                    rec['read_s'] = time.perf_counter() - t0
+                    return rec
+                text = _decode(data)
+                del data
+    except Exception:
+        rec['skip'] = 'unreadable'
+        return rec
+    reason = content_skip_reason(text)
+    t1 = time.perf_counter()
+    rec['read_s'] = t1 - t0
+    if reason:
+        rec['skip'] = reason
+        return rec
+    rec['head'] = ''.join(text[:64 * 1024].splitlines(True)[:HEAD_LINES])
+    out = chunk_code(text, fp, lang, target=target, tokens=tokens)
+    for c in out:
+        c['hash'] = hashlib.md5(c['code'].encode()).hexdigest()
+    if blobs and out:
+        data = text.encode('utf-8')
+        h = hashlib.sha1(data).hexdigest()
+        if attach_offsets(out, data, h):
+            put_blob(blobs, data, h)
+    rec['chunks'] = out
+    rec['chunk_s'] = time.perf_counter() - t1
+    return rec
+
+
+def _ingest_item(item: Tuple[str, Optional[str]], target: int, blobs: Optional[str] = None,
+                 tokens: Optional[int] = None) -> Dict:
+    fp, expected_sha = item
+    return ingest_file(fp, target, expected_sha, blobs, tokens)
+
+
+def iter_ingested_files(items: Iterable[Tuple[str, Optional[str]]], workers: int | None = None, target: int = 900,
+                        blobs: Optional[str] = None, tokens: Optional[int] = None) -> Iterator[Dict]:
+    """Yield ingestion records for ``(path, expected_sha)`` items, in input order."""
+    items = list(items)
+    n = chunk_workers() if workers is None else max(1, workers)
+    if n <= 1 or len(items) < 2 * n:
+        for it in items:
+            yield _ingest_item(it, target, blobs, tokens)
+        return
+    with ProcessPoolExecutor(max_workers=n) as ex:
+        window = max(n * PREFETCH, 1)
+        pending: deque = deque()
+        src = iter(items)
+        for it in src:
+            pending.append(ex.submit(_ingest_item, it, target, blobs, tokens))
+            if len(pending) >= window:
+                break
+        while pending:
+            yield pending.popleft().result()
+            nxt = next(src, None)
+            if nxt is not None:
+                pending.append(ex.submit(_ingest_item, nxt, target, blobs, tokens))
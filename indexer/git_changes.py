@@ -0,0 +1,101 @@
+"""Git-diff aware change detection for incremental indexing.
+
+The indexer records, per repo path, the HEAD it indexed plus the paths that
+were dirty (modified, staged or untracked) at that moment. On the next run
+``changed_since`` combines
+
+  - ``git diff --name-status <indexed HEAD> HEAD`` (committed changes, which
+    after a checkout is exactly the set of files differing between branches),
+  - ``git diff --name-status HEAD`` (staged + unstaged edits),
+  - ``git ls-files --others --exclude-standard`` (untracked files), and
+  - the previously dirty paths (their indexed content may have been reverted),
+
+so only those paths need to be re-read. Every helper returns ``None`` when git
+cannot answer (not a repo, unknown commit after a gc/force-push, no git
+binary) and the caller falls back to the manifest's stat-based walk.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+from typing import Dict, List, Optional, Set
+
+
+def _git(base: str, *args: str) -> Optional[str]:
+    try:
+        r = subprocess.run(["git", "-C", base, *args], capture_output=True, text=True, timeout=120)
+    except Exception:
+        return None
+    if r.returncode != 0:
+        return None
+    return r.stdout
+
+
+def _split_z(out: str) -> List[str]:
+    return [p for p in out.split("\0") if p]
+
+
+def _name_status_paths(out: str) -> List[str]:
+    """Paths from ``--name-status -z`` output (status token, then path(s))."""
+    parts = _split_z(out)
+    paths: List[str] = []
+    i = 0
+    while i < len(parts):
+        status = parts[i]
+        n = 2 if status[:1] in ("R", "C") else 1
+        paths.extend(parts[i + 1:i + 1 + n])
+        i += 1 + n
+    return paths
+
+
+def head_commit(base: str) -> Optional[str]:
+    out = _git(base, "rev-parse", "--verify", "-q", "HEAD")
+    return out.strip() if out else None
+
+
+def _prefix(base: str) -> Optional[str]:
+    """Path of ``base`` relative to its work tree top level ('' or 'sub/dir/')."""
+    out = _git(base, "rev-parse", "--show-prefix")
+    return None if out is None else out.strip()
+
+
+def dirty_paths(base: str) -> Optional[List[str]]:
+    """Top-level-relative paths that differ from HEAD or are untracked."""
+    diff = _git(base, "-c", "core.quotepath=off", "diff", "--name-status", "--no-renames", "-z", "HEAD")
+    untracked = _git(base, "ls-files", "--others", "--exclude-standard", "--full-name", "-z")
+    if diff is None or untracked is None:
+        return None
+    return sorted(set(_name_status_paths(diff)) | set(_split_z(untracked)))
+
+
+def snapshot(base: str) -> Optional[Dict]:
+    """State to persist after indexing ``base``: ``{'head': sha, 'dirty': [...]}``."""
+    head = head_commit(base)
+    if not head:
+        return None
+    dirty = dirty_paths(base)
+    if dirty is None:
+        return None
+    return {"head": head, "dirty": dirty}
+
+
+def changed_since(base: str, state: Optional[Dict]) -> Optional[Set[str]]:
+    """Paths under ``base`` (joined onto ``base``) that may differ from the
+    index recorded in ``state``; ``None`` if git can't tell."""
+    if not state or not state.get("head"):
+        return None
+    prefix = _prefix(base)
+    if prefix is None:
+        return None
+    committed = _git(base, "-c", "core.quotepath=off", "diff", "--name-status", "--no-renames", "-z", state["head"], "HEAD")
+    dirty = dirty_paths(base)
+    if committed is None or dirty is None:
+        return None
+    rel = set(_name_status_paths(committed)) | set(dirty) | set(state.get("dirty") or [])
+    out: Set[str] = set()
+    for r in rel:
+        if prefix and not r.startswith(prefix):
+            continue
+        out.add(os.path.join(base, r[len(prefix):]))
+    return out
@@ -0,0 +1,232 @@
+"""Index many repos at once with a shared worker budget.
+
+    python -m indexer.index_all                    # every repo in repos.json
+    python -m indexer.index_all --repo a --repo b  # a selection
+
+Each repo is indexed by its own ``python -m indexer.index_repo`` child
+(``index_repo`` binds REPO/OUTDIR/COLLECTION at import time), at most
+INDEX_PARALLEL_REPOS at a time. Running several repos side by side is what
+interleaves the work: one child is chunking (CPU) while another waits on the
+embedding API or on Qdrant uploads (I/O).
+
+The machine-wide budgets are split between the children that run
+concurrently instead of being multiplied by them: INDEX_WORKERS (chunking
+processes), EMBED_THREADS (local model threads), EMBED_CONCURRENCY /
+EMBED_TPM / EMBED_RPM (embedding API) and QDRANT_UPSERT_PARALLEL. Each child
+gets ``total // n`` (at least 1) where ``n`` is the number of repos that will
+share the budget while it runs, so the last repos of a run get a bigger slice.
+
+A failing repo is logged and, with ``--retries``, re-queued; it never stops
+the others. Progress is written to ``<out base>/index_all_status.json`` and
+each child's output to ``<out>/<repo>/index.log``.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from common.config_loader import list_repos, out_base_dir, out_dir
+
+STATUS_NAME = 'index_all_status.json'
+
+# Budgets split across concurrently running children; None = leave unset
+# (the child uses its own default).
+_BUDGETS = {
+    'INDEX_WORKERS': lambda: os.cpu_count() or 1,
+    'EMBED_THREADS': lambda: os.cpu_count() or 1,
+    'EMBED_CONCURRENCY': lambda: 4,
+    'QDRANT_UPSERT_PARALLEL': lambda: 4,
+    'EMBED_TPM': lambda: None,
+    'EMBED_RPM': lambda: None,
+}
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def status_path() -> str:
+    return os.path.join(out_base_dir(), STATUS_NAME)
+
+
+def read_status() -> Dict:
+    try:
+        with open(status_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def parallel_repos(n_repos: int) -> int:
+    try:
+        n = int(os.getenv('INDEX_PARALLEL_REPOS', '3') or 3)
+    except ValueError:
+        n = 3
+    return max(1, min(n, n_repos or 1))
+
+
+def budget_totals() -> Dict[str, int]:
+    """Machine-wide totals: the env value if set, else the default above."""
+    out = {}
+    for key, default in _BUDGETS.items():
+        raw = (os.getenv(key, '') or '').strip()
+        try:
+            v = int(raw) if raw else default()
+        except ValueError:
+            v = default()
+        if v:  # 0 / unset rate limits stay unlimited
+            out[key] = v
+    return out
+
+
+def share_env(totals: Dict[str, int], sharing: int) -> Dict[str, str]:
+    """Per-child slice of each budget when ``sharing`` children run at once."""
+    sharing = max(1, sharing)
+    return {k: str(max(1, v // sharing)) for k, v in totals.items()}
+
+
+class Orchestrator:
+    def __init__(self, repos: List[str], parallel: Optional[int] = None, retries: int = 0,
+                 extra_env: Optional[Dict[str, str]] = None):
+        self.repos = list(dict.fromkeys(repos))
+        self.parallel = parallel or parallel_repos(len(self.repos))
+        self.retries = max(0, retries)
+        self.extra_env = dict(extra_env or {})
+        self.totals = budget_totals()
+        self.queue: deque = deque(self.repos)
+        self.running: Dict[str, subprocess.Popen] = {}
+        self.readers: Dict[str, threading.Thread] = {}
+        self.t0: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.state: Dict = {
+            'started': _now(),
+            'finished': None,
+            'parallel': self.parallel,
+            'budgets': self.totals,
+            'repos': {r: {'state': 'queued', 'attempts': 0} for r in self.repos},
+        }
+
+    def _save(self) -> None:
+        path = status_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.tmp'
+            with self.lock:
+                data = json.dumps(self.state, indent=2)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            pass
+
+    def _pump(self, name: str, proc: subprocess.Popen, log_path: str) -> None:
+        """Forward a child's output with a ``[repo]`` prefix, tee it to its
+        index.log and keep the last line as the repo's progress."""
+        try:
+            with open(log_path, 'w', encoding='utf-8') as log:
+                for line in proc.stdout:  # type: ignore[union-attr]
+                    log.write(line)
+                    log.flush()
+                    line = line.rstrip()
+                    if not line:
+                        continue
+                    print(f'[{name}] {line}', flush=True)
+                    with self.lock:
+                        self.state['repos'][name]['last_line'] = line[-300:]
+        except Exception:
+            pass
+
+    def _spawn(self, name: str) -> None:
+        sharing = min(self.parallel, len(self.running) + 1 + len(self.queue))
+        child = share_env(self.totals, sharing)
+        env = dict(os.environ)
+        env.update(self.extra_env)
+        env.update(child)
+        env.update(REPO=name, PYTHONUNBUFFERED='1')
+        os.makedirs(out_dir(name), exist_ok=True)
+        log_path = os.path.join(out_dir(name), 'index.log')
+        proc = subprocess.Popen([sys.executable, '-m', 'indexer.index_repo'], env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self.running[name] = proc
+        t = threading.Thread(target=self._pump, args=(name, proc, log_path), daemon=True)
+        t.start()
+        self.readers[name] = t
+        with self.lock:
+            r = self.state['repos'][name]
+            r.update({'state': 'running', 'pid': proc.pid, 'started': _now(), 'finished': None,
+                      'returncode': None, 'budget': child, 'log': log_path})
+            r['attempts'] += 1
+        self.t0[name] = time.time()
+
+    def _reap(self, name: str, rc: int) -> None:
+        del self.running[name]
+        self.readers.pop(name).join(timeout=5)
+        with self.lock:
+            r = self.state['repos'][name]
+            r['secs'] = round(time.time() - self.t0.pop(name, time.time()), 1)
+            r.update({'returncode': rc, 'finished': _now()})
+            if rc == 0:
+                r['state'] = 'ok'
+            elif r['attempts'] <= self.retries:
+                r['state'] = 'queued'
+                self.queue.append(name)
+            else:
+                r['state'] = 'failed'
+        print(f'[index_all] {name}: {"done" if rc == 0 else f"exited with {rc}"} in {r["secs"]}s '
+              f'({len(self.queue)} queued, {len(self.running)} running)', flush=True)
+
+    def run(self) -> int:
+        print(f'[index_all] {len(self.repos)} repos, {self.parallel} at a time; budgets {self.totals}', flush=True)
+        self._save()
+        try:
+            while self.queue or self.running:
+                while self.queue and len(self.running) < self.parallel:
+                    self._spawn(self.queue.popleft())
+                    self._save()
+                time.sleep(0.5)
+                for name, p in list(self.running.items()):
+                    rc = p.poll()
+                    if rc is not None:
+                        self._reap(name, rc)
+                        self._save()
+        except KeyboardInterrupt:
+            for name, p in self.running.items():
+                p.terminate()
+                self.state['repos'][name]['state'] = 'cancelled'
+            for p in self.running.values():
+                try:
+                    p.wait(timeout=10)
+                except Exception:
+                    p.kill()
+        self.state['finished'] = _now()
+        self._save()
+        failed = [r for r, s in self.state['repos'].items() if s['state'] != 'ok']
+        ok = len(self.repos) - len(failed)
+        print(f'[index_all] finished: {ok} ok' + (f', failed: {", ".join(failed)}' if failed else ''), flush=True)
+        return 1 if failed else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description='Index several repos in parallel with a shared worker budget.')
+    ap.add_argument('--repo', action='append', help='repo name from repos.json (repeatable; default: all)')
+    ap.add_argument('--parallel', type=int, default=None, help='repos indexed at once (default INDEX_PARALLEL_REPOS)')
+    ap.add_argument('--retries', type=int, default=0, help='re-queue a failed repo this many times')
+    args = ap.parse_args()
+    repos = args.repo or list_repos()
+    if not repos:
+        print('[index_all] no repos configured in repos.json')
+        return 1
+    return Orchestrator(repos, parallel=args.parallel, retries=args.retries).run()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,51 +1,43 @@
 import os
 import json
+import time
 import hashlib
+import numpy as np
 from typing import List, Dict
 from pathlib import Path
 from dotenv import load_dotenv, find_dotenv
-from common.config_loader import get_repo_paths, out_dir
+from common.config_loader import get_repo_paths, out_dir, prefix_dim
 from common.paths import data_dir
-from retrieval.ast_chunker import lang_from_path, collect_files, chunk_code
-import bm25s  # type: ignore
-from bm25s.tokenization import Tokenizer  # type: ignore
-from Stemmer import Stemmer  # type: ignore
+from common.walker import GlobMatcher
+from retrieval.ast_chunker import collect_files, filter_collectable, hierarchy_enabled, lang_from_path
 from qdrant_client import QdrantClient, models
 import uuid
 from openai import OpenAI
 from retrieval.embed_cache import EmbeddingCache
+from retrieval.embed_scheduler import clip_tokens, embed_texts_scheduled, openai_embed_call
+from retrieval.local_models import encode_bucketed
+from retrieval.bm25_sparse import SPARSE_NAME, doc_vectors
+from indexer.bm25_stream import build_bm25_streaming
+from indexer.bm25_shards import build_bm25_shards, rebuild_requested, remove_shards, shard_mode, shard_of
+from indexer.build_report import BuildProfiler
+from common.tokens import chunk_token_budget, tokenizer_name
+from common.blob_store import blobs_dir, gc_blobs, reader as blob_reader, store_mode, strip_code
+from indexer.chunk_pool import chunk_workers, content_skip_reason, ingest_file, iter_ingested_files
+from indexer.qdrant_upload import BulkUploader, make_client
+from indexer.git_changes import changed_since, snapshot as git_snapshot
+from indexer.near_dup import NearDupIndex, alt_locations, settings as near_dup_settings, simhash
+from indexer.manifest import (
+    chunk_ids_digest, dense_backlog, empty_manifest, entry_digest, load_manifest, make_entry,
+    plan_changes, plan_from_changed, save_manifest,
+)
 import tiktoken
-from sentence_transformers import SentenceTransformer
-import fnmatch
 import pathlib
-import common.qdrant_utils as qdrant_recreate_fallback  # make recreate_collection 404-safe
+from common.qdrant_utils import (
+    PREFIX_NAME, create_versioned_collection, gc_versions, quantization_config, quantization_mode, resolve_alias,
+    shard_number, swap_alias,
+)
 from datetime import datetime
 
-# --- global safe filters (avoid indexing junk) ---
-from common.filtering import _prune_dirs_in_place, _should_index_file, PRUNE_DIRS
-
-# Patch os.walk to prune noisy dirs and skip junk file types
-_os_walk = os.walk
-def _filtered_os_walk(top, *args, **kwargs):
-    for root, dirs, files in _os_walk(top, *args, **kwargs):
-        _prune_dirs_in_place(dirs)
-        files[:] = [f for f in files if _should_index_file(f)]
-        yield root, dirs, files
-os.walk = _filtered_os_walk  # type: ignore
-
-# Patch Path.rglob as well (if code uses it)
-_Path_rglob = Path.rglob
-def _filtered_rglob(self, pattern):
-    for p in _Path_rglob(self, pattern):
-        # skip if any pruned dir appears in the path
-        if any(part in PRUNE_DIRS for part in p.parts):
-            continue
-        if not _should_index_file(p.name):
-            continue
-        yield p
-Path.rglob = _filtered_rglob  # type: ignore
-# --- end filters ---
-
 
 # Load local env and also repo-root .env if present (no hard-coded paths)
 try:
@@ -92,30 +84,28 @@ def _load_exclude_globs() -> list[str]:
     return [ln.strip() for ln in p.read_text().splitlines() if ln.strip() and not ln.startswith("#")]
 
 _EXCLUDE_GLOBS = _load_exclude_globs()
+_EXCLUDE_MATCHER = GlobMatcher(_EXCLUDE_GLOBS)
 
-def should_index_file(path: str) -> bool:
+def path_allowed(path: str) -> bool:
+    """Path-only part of the indexing gate (no file I/O)."""
     p = pathlib.Path(path)
     # 1) fast deny: extension must look like source
     if p.suffix.lower() not in SOURCE_EXTS:
         return False
     # 2) glob excludes (vendor, caches, images, minified, etc.)
-    as_posix = p.as_posix()
-    for pat in _EXCLUDE_GLOBS:
-        if fnmatch.fnmatch(as_posix, pat):
-            return False
+    return not _EXCLUDE_MATCHER.match(p.as_posix())
+
+def should_index_file(path: str) -> bool:
+    if not path_allowed(path):
+        return False
     # 3) quick heuristic to skip huge/minified one-liners
+    # (the indexer applies the same check inside the ingestion pool, on the
+    # buffer it already read, rather than calling this)
     try:
-        text = p.read_text(errors="ignore")
-        if len(text) > 2_000_000:  # ~2MB
-            return False
-        lines = text.splitlines()
-        if lines:
-            avg = sum(len(x) for x in lines) / max(1, len(lines))
-            if avg > 2500:
-                return False
+        text = pathlib.Path(path).read_text(errors="ignore")
     except Exception:
         return False
-    return True
+    return content_skip_reason(text) is None
 
 
 # --- Repo-aware layer tagging ---
@@ -154,14 +144,17 @@ VENDOR_MARKERS = (
     "/vendor/","/third_party/","/external/","/deps/","/node_modules/",
     "/Pods/","/Godeps/","/.bundle/","/bundle/"
 )
-def detect_origin(fp: str) -> str:
+def detect_origin(fp: str, head: str | None = None) -> str:
+    """Tag a file as vendor/first_party. ``head`` is the file's first lines
+    when the caller already has them (the indexer reads each file once)."""
     low = (fp or '').lower()
     for m in VENDOR_MARKERS:
         if m in low:
             return 'vendor'
     try:
-        with open(fp, 'r', encoding='utf-8', errors='ignore') as f:
-            head = ''.join([next(f) for _ in range(12)])
+        if head is None:
+            with open(fp, 'r', encoding='utf-8', errors='ignore') as f:
+                head = ''.join([next(f) for _ in range(12)])
         if any(k in head.lower() for k in (
             'apache license','mit license','bsd license','mozilla public license'
         )):
@@ -171,185 +164,270 @@ def detect_origin(fp: str) -> str:
     return 'first_party'
 os.makedirs(OUTDIR, exist_ok=True)
 
-def _clip_for_openai(text: str, enc, max_tokens: int = 8000) -> str:
-    toks = enc.encode(text)
-    if len(toks) <= max_tokens:
-        return text
-    return enc.decode(toks[:max_tokens])
-
-def embed_texts(client: OpenAI, texts: List[str], batch: int = 64) -> List[List[float]]:
-    embs = []
+def embed_texts(client: OpenAI, texts: List[str], batch: int = 64, counts: List[int | None] | None = None) -> np.ndarray:
     enc = tiktoken.get_encoding('cl100k_base')
-    for i in range(0, len(texts), batch):
-        sub = [_clip_for_openai(t, enc) for t in texts[i:i+batch]]
-        r = client.embeddings.create(model='text-embedding-3-large', input=sub)
-        for d in r.data:
-            embs.append(d.embedding)
-    return embs
+    clipped, counts = clip_tokens(texts, enc, counts=counts)
+    return embed_texts_scheduled(clipped, openai_embed_call(client, 'text-embedding-3-large'), batch=batch, costs=counts)
 
-def embed_texts_local(texts: List[str], model_name: str = 'BAAI/bge-small-en-v1.5', batch: int = 128) -> List[List[float]]:
-    model = SentenceTransformer(model_name)
-    out = []
-    for i in range(0, len(texts), batch):
-        sub = texts[i:i+batch]
-        v = model.encode(sub, normalize_embeddings=True, show_progress_bar=False)
-        out.extend(v.tolist())
-    return out
+def embed_texts_local(texts: List[str], model_name: str = 'BAAI/bge-small-en-v1.5', batch: int = 128) -> np.ndarray:
+    return encode_bucketed(model_name, texts, batch=batch)
 
-def _renorm_truncate(vecs: List[List[float]], dim: int) -> List[List[float]]:
-    out: List[List[float]] = []
-    import math as _m
-    for v in vecs:
-        w = v[:dim] if dim and dim < len(v) else v
-        n = _m.sqrt(sum(x*x for x in w)) or 1.0
-        out.append([x / n for x in w])
-    return out
+def _renorm_truncate(vecs: np.ndarray, dim: int) -> np.ndarray:
+    # Matryoshka truncation: keep the first ``dim`` components and re-normalize,
+    # as one vectorized op over the whole (n, d) float32 matrix.
+    w = np.asarray(vecs, dtype=np.float32)
+    if w.ndim != 2 or not len(w):
+        return w
+    if dim and dim < w.shape[1]:
+        w = w[:, :dim]
+    n = np.linalg.norm(w, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    return np.ascontiguousarray(w / n, dtype=np.float32)
 
-def embed_texts_mxbai(texts: List[str], dim: int = 512, batch: int = 128) -> List[List[float]]:
-    model = SentenceTransformer('mixedbread-ai/mxbai-embed-large-v1')
-    out: List[List[float]] = []
-    for i in range(0, len(texts), batch):
-        sub = texts[i:i+batch]
-        v = model.encode(sub, normalize_embeddings=True, show_progress_bar=False)
-        out.extend(v.tolist())
+def embed_texts_mxbai(texts: List[str], dim: int = 512, batch: int = 128) -> np.ndarray:
+    out = encode_bucketed('mixedbread-ai/mxbai-embed-large-v1', texts, batch=batch)
     return _renorm_truncate(out, dim)
 
-def embed_texts_voyage(texts: List[str], batch: int = 128, output_dimension: int = 512) -> List[List[float]]:
+def embed_texts_voyage(texts: List[str], batch: int = 128, output_dimension: int = 512,
+                       counts: List[int | None] | None = None) -> np.ndarray:
     import voyageai  # type: ignore
     client = voyageai.Client(api_key=os.getenv('VOYAGE_API_KEY'))
-    out: List[List[float]] = []
-    for i in range(0, len(texts), batch):
-        sub = texts[i:i+batch]
-        r = client.embed(sub, model='voyage-code-3', input_type='document', output_dimension=output_dimension)
-        out.extend(r.embeddings)
-    return out
 
-def main() -> None:
-    files = collect_files(BASES)
-    print(f'Discovered {len(files)} source files.')
-    all_chunks: List[Dict] = []
-    for fp in files:
-        if not should_index_file(fp):
-            continue
-        lang = lang_from_path(fp)
-        if not lang:
-            continue
-        try:
-            with open(fp, 'r', encoding='utf-8', errors='ignore') as f:
-                src = f.read()
-        except Exception:
-            continue
-        ch = chunk_code(src, fp, lang, target=900)
-        all_chunks.extend(ch)
+    def call(sub: List[str]) -> List[List[float]]:
+        return client.embed(sub, model='voyage-code-3', input_type='document', output_dimension=output_dimension).embeddings
+    # Stored token counts feed the TPM budget; ~4 chars per token where unknown.
+    costs = [n if n is not None else len(t) // 4 + 1 for t, n in zip(texts, counts)] if counts is not None else None
+    return embed_texts_scheduled(texts, call, batch=batch, costs=costs)
+
+def _embedding_type() -> str:
+    return (os.getenv('EMBEDDING_TYPE','openai') or 'openai').lower()
+
+def _dense_signature() -> Dict:
+    et = _embedding_type()
+    dim_hint = os.getenv('VOYAGE_EMBED_DIM','512') if et == 'voyage' else os.getenv('EMBEDDING_DIM', '')
+    sparse = SPARSE_NAME if (os.getenv('QDRANT_SPARSE', '0') or '0').strip() == '1' else 'none'
+    return {'embedding_type': et, 'collection': COLLECTION, 'dim_hint': dim_hint, 'quantization': quantization_mode(),
+            'sparse': sparse, 'prefix_dim': prefix_dim(REPO), 'shard_number': shard_number()}
 
-    seen, chunks = set(), []
-    for c in all_chunks:
+def _dense_matches(dense: Dict, sig: Dict) -> bool:
+    """Whether the collection described by manifest ``dense`` was built with
+    signature ``sig`` (so it can be updated incrementally)."""
+    defaults = {'quantization': 'none', 'sparse': 'none', 'prefix_dim': 0, 'shard_number': 1}
+    return bool(dense) and all(dense.get(k, defaults.get(k)) == v for k, v in sig.items())
+
+def _prefix_dim(sig: Dict, dim: int | None) -> int:
+    """Effective prefix dimension: 0 unless shorter than the embedding."""
+    p = int(sig.get('prefix_dim') or 0)
+    return p if dim and 0 < p < dim else 0
+
+def _point_id(cid: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, str(cid)))
+
+def _tag_chunks(chunks: List[Dict], origin: str) -> List[Dict]:
+    for c in chunks:
         c['repo'] = REPO
         try:
             c['layer'] = detect_layer(c.get('file_path',''))
         except Exception:
             c['layer'] = 'server'
-        try:
-            c['origin'] = detect_origin(c.get('file_path',''))
-        except Exception:
-            c['origin'] = 'first_party'
-        h = hashlib.md5(c['code'].encode()).hexdigest()
-        if h in seen:
+        c['origin'] = origin
+        if 'hash' not in c:
+            c['hash'] = hashlib.md5(c['code'].encode()).hexdigest()
+    return chunks
+
+def _iter_jsonl(path: str):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except Exception:
+                continue
+
+def _iter_chunks(path: str):
+    """Rows of chunks.jsonl / parents.jsonl with ``code`` (sliced from the
+    blob store for CHUNK_STORE=blob rows)."""
+    return blob_reader(OUTDIR).iter_hydrated(_iter_jsonl(path))
+
+def _prev_chunk_digests(paths: set) -> Dict[str, str]:
+    """Per-file digest of chunk ids found in the previous chunks.jsonl."""
+    acc: Dict[str, list] = {}
+    for o in _iter_jsonl(os.path.join(OUTDIR, 'chunks.jsonl')):
+        fp = o.get('file_path')
+        if fp not in paths:
             continue
-        seen.add(h)
-        c['hash'] = h
-        chunks.append(c)
-    print(f'Prepared {len(chunks)} chunks.')
+        cid = str(o.get('id'))
+        if fp in acc:
+            acc[fp][0].update(('\n' + cid).encode('utf-8'))
+        else:
+            acc[fp] = [hashlib.sha1(cid.encode('utf-8'))]
+    return {fp: h[0].hexdigest() for fp, h in acc.items()}
 
-    ENRICH = (os.getenv('ENRICH_CODE_CHUNKS', 'false') or 'false').lower() == 'true'
-    enrich = None  # type: ignore[assignment]
-    if ENRICH:
-        try:
-            from common.metadata import enrich  # type: ignore
-        except Exception:
-            pass
-        if enrich is not None:
-            for c in chunks:
-                try:
-                    meta = enrich(c.get('file_path',''), c.get('language',''), c.get('code',''))
-                    c['summary'] = meta.get('summary','')
-                    c['keywords'] = meta.get('keywords', [])
-                except Exception:
-                    c['summary'] = ''
-                    c['keywords'] = []
-
-    corpus: List[str] = []
-    for c in chunks:
-        pre = []
-        if c.get('name'):
-            pre += [c['name']]*2
-        if c.get('imports'):
-            pre += [i[0] or i[1] for i in c['imports'] if isinstance(i, (list, tuple))]
-        body = c['code']
-        corpus.append((' '.join(pre)+'\n'+body).strip())
-
-    stemmer = Stemmer('english')
-    tokenizer = Tokenizer(stemmer=stemmer, stopwords='en')
-    corpus_tokens = tokenizer.tokenize(corpus)
-    retriever = bm25s.BM25(method='lucene', k1=1.2, b=0.65)
-    retriever.index(corpus_tokens)
-    os.makedirs(os.path.join(OUTDIR, 'bm25_index'), exist_ok=True)
+def _reuse_map(prev_entry: Dict, kept: List[Dict]) -> Dict[str, str]:
+    """New chunk id -> old chunk id for chunks of a re-chunked file whose hash
+    is unchanged. Old ids that are reused by a different chunk are skipped:
+    that point gets overwritten during the same upload."""
+    old = {h: cid for cid, h in prev_entry.get('chunks', [])}
+    new_ids = {str(c['id']) for c in kept}
+    out = {}
+    for c in kept:
+        cid = old.get(c['hash'])
+        if cid is not None and (cid == str(c['id']) or cid not in new_ids):
+            out[str(c['id'])] = cid
+    return out
+
+def _reused_vectors(q: QdrantClient, coll: str, batch: List[Dict], files: Dict, dim: int) -> Dict[str, np.ndarray]:
+    """Dense vectors already in ``coll`` for the batch's unchanged chunks
+    (manifest ``reuse``), keyed by new chunk id. Missing points are embedded."""
+    want = {}
+    for c in batch:
+        old = (files.get(c.get('file_path'), {}).get('reuse') or {}).get(str(c['id']))
+        if old:
+            want[_point_id(old)] = str(c['id'])
+    if not want:
+        return {}
     try:
-        retriever.vocab_dict = {str(k): v for k, v in retriever.vocab_dict.items()}
-    except Exception:
-        pass
-    retriever.save(os.path.join(OUTDIR, 'bm25_index'), corpus=corpus)
-    tokenizer.save_vocab(save_dir=os.path.join(OUTDIR, 'bm25_index'))
-    tokenizer.save_stopwords(save_dir=os.path.join(OUTDIR, 'bm25_index'))
-    with open(os.path.join(OUTDIR, 'bm25_index', 'corpus.txt'), 'w', encoding='utf-8') as f:
-        for doc in corpus:
-            f.write(doc.replace('\n','\\n')+'\n')
-    chunk_ids = [str(c['id']) for c in chunks]
-    with open(os.path.join(OUTDIR, 'bm25_index', 'chunk_ids.txt'), 'w', encoding='utf-8') as f:
-        for cid in chunk_ids:
-            f.write(cid+'\n')
-    import json as _json
-    _json.dump({str(i): cid for i, cid in enumerate(chunk_ids)}, open(os.path.join(OUTDIR,'bm25_index','bm25_map.json'),'w'))
-    with open(os.path.join(OUTDIR,'chunks.jsonl'),'w',encoding='utf-8') as f:
-        for c in chunks:
-            f.write(json.dumps(c, ensure_ascii=False)+'\n')
-    print('BM25 index saved.')
+        points = q.retrieve(coll, ids=list(want), with_vectors=['dense'], with_payload=False)
+    except Exception as e:
+        print(f'Could not fetch vectors for unchanged chunks ({e}); re-embedding them.')
+        return {}
+    out = {}
+    for p in points:
+        v = p.vector.get('dense') if isinstance(p.vector, dict) else p.vector
+        if v is not None and len(v) == dim:
+            out[want[str(p.id)]] = np.asarray(v, dtype=np.float32)
+    return out
+
+def _bm25_doc(c: Dict) -> str:
+    pre = []
+    if c.get('name'):
+        pre += [c['name']]*2
+    if c.get('imports'):
+        pre += [i[0] or i[1] for i in c['imports'] if isinstance(i, (list, tuple))]
+    return (' '.join(pre)+'\n'+c['code']).strip()
+
+class _ChunkSink:
+    """Streams chunks to chunks.jsonl, the BM25 corpus and the id maps as they
+    are produced, so the build never holds the whole corpus in memory.
+    Parent records (CHUNK_HIERARCHY=1) go to parents.jsonl, which is neither
+    embedded nor BM25-indexed; hydration reads it to expand a hit.
+    With CHUNK_STORE=blob, rows that have blob offsets are written without
+    their code and the unused corpus.txt copy is skipped; on close, blobs
+    no row refers to any more are deleted."""
+
+    def __init__(self, outdir: str, store: str = 'inline'):
+        self.idx_dir = os.path.join(outdir, 'bm25_index')
+        os.makedirs(self.idx_dir, exist_ok=True)
+        self.chunks_path = os.path.join(outdir, 'chunks.jsonl')
+        self.parents_path = os.path.join(outdir, 'parents.jsonl')
+        self.corpus_path = os.path.join(self.idx_dir, 'corpus.txt')
+        self._chunks = open(self.chunks_path + '.tmp', 'w', encoding='utf-8')
+        self._corpus = open(self.corpus_path + '.tmp', 'w', encoding='utf-8')
+        self._ids = open(os.path.join(self.idx_dir, 'chunk_ids.txt.tmp'), 'w', encoding='utf-8')
+        self._parents = open(self.parents_path + '.tmp', 'w', encoding='utf-8')
+        self.count = 0
+        self.parent_count = 0
+        self.tokens = 0  # indexed tokens (token_count of every chunk)
+        self.outdir = outdir
+        self.store = store
+        self.blobs: set = set()
 
+    def _row(self, c: Dict) -> Dict:
+        if self.store == 'blob' and c.get('blob'):
+            self.blobs.add(c['blob'])
+            return strip_code(c)
+        # Inline store: rows carried over from a blob-mode build get their code back.
+        return {k: v for k, v in blob_reader(self.outdir).hydrate(c).items() if k not in ('blob', 'byte_range')}
+
+    def write(self, c: Dict) -> None:
+        self._chunks.write(json.dumps(self._row(c), ensure_ascii=False)+'\n')
+        if self.store != 'blob':
+            self._corpus.write(_bm25_doc(c).replace('\n','\\n')+'\n')
+        self._ids.write(str(c['id'])+'\n')
+        self.count += 1
+        self.tokens += int(c.get('token_count') or 0)
+
+    def write_parent(self, c: Dict) -> None:
+        self._parents.write(json.dumps(self._row(c), ensure_ascii=False)+'\n')
+        self.parent_count += 1
+
+    def close(self) -> None:
+        for f in (self._chunks, self._corpus, self._ids, self._parents):
+            f.close()
+        os.replace(self.chunks_path + '.tmp', self.chunks_path)
+        gc_blobs(self.outdir, self.blobs)
+        if self.parent_count:
+            os.replace(self.parents_path + '.tmp', self.parents_path)
+        else:
+            os.remove(self.parents_path + '.tmp')
+            if os.path.exists(self.parents_path):
+                os.remove(self.parents_path)
+        if self.store == 'blob':
+            os.remove(self.corpus_path + '.tmp')
+            if os.path.exists(self.corpus_path):
+                os.remove(self.corpus_path)
+        else:
+            os.replace(self.corpus_path + '.tmp', self.corpus_path)
+        ids_path = os.path.join(self.idx_dir, 'chunk_ids.txt')
+        os.replace(ids_path + '.tmp', ids_path)
+        # bm25_map.json / bm25_point_ids.json: index -> chunk id / point id.
+        # Point ids derive from chunk ids, so the map stays aligned with the
+        # BM25 corpus even when the dense stage is skipped.
+        with open(ids_path, 'r', encoding='utf-8') as src, \
+                open(os.path.join(self.idx_dir, 'bm25_map.json'), 'w') as m1, \
+                open(os.path.join(self.idx_dir, 'bm25_point_ids.json'), 'w') as m2:
+            m1.write('{'); m2.write('{')
+            for i, line in enumerate(src):
+                cid = line.strip()
+                sep = ', ' if i else ''
+                m1.write(f'{sep}"{i}": {json.dumps(cid)}')
+                m2.write(f'{sep}"{i}": "{_point_id(cid)}"')
+            m1.write('}'); m2.write('}')
+
+def _enrich_chunks(chunks: List[Dict]) -> None:
+    ENRICH = (os.getenv('ENRICH_CODE_CHUNKS', 'false') or 'false').lower() == 'true'
+    if not ENRICH or not chunks:
+        return
+    enrich = None  # type: ignore[assignment]
     try:
-        meta = {
-            'repo': REPO,
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
-            'chunks_path': os.path.join(OUTDIR, 'chunks.jsonl'),
-            'bm25_index_dir': os.path.join(OUTDIR, 'bm25_index'),
-            'chunk_count': len(chunks),
-            'collection_name': COLLECTION,
-        }
-        with open(os.path.join(OUTDIR, 'last_index.json'), 'w', encoding='utf-8') as mf:
-            json.dump(meta, mf, indent=2)
+        from common.metadata import enrich  # type: ignore
     except Exception:
         pass
-
-    if (os.getenv('SKIP_DENSE','0') or '0').strip() == '1':
-        print('Skipping dense embeddings and Qdrant upsert (SKIP_DENSE=1).')
+    if enrich is None:
         return
+    for c in chunks:
+        try:
+            meta = enrich(c.get('file_path',''), c.get('language',''), c.get('code',''))
+            c['summary'] = meta.get('summary','')
+            c['keywords'] = meta.get('keywords', [])
+        except Exception:
+            c['summary'] = ''
+            c['keywords'] = []
 
+def _embed_chunks(chunks: List[Dict], cache: EmbeddingCache | None = None) -> np.ndarray:
+    """Embed a batch of chunks into an (n, dim) float32 matrix (rows follow ``chunks``).
+    ``cache`` is the dense stage's OpenAI embedding cache (loaded once per run)."""
     client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-    texts = []
+    texts, counts = [], []
     for c in chunks:
         if c.get('summary') or c.get('keywords'):
             kw = ' '.join(c.get('keywords', []))
             texts.append(f"{c.get('file_path','') }\n{c.get('summary','')}\n{kw}\n{c.get('code','')}")
+            counts.append(None)
         else:
             texts.append(c['code'])
-    embs: List[List[float]] = []
-    et = (os.getenv('EMBEDDING_TYPE','openai') or 'openai').lower()
+            counts.append(c.get('token_count'))
+    embs = None
+    et = _embedding_type()
     if et == 'voyage':
         try:
-            embs = embed_texts_voyage(texts, batch=64, output_dimension=int(os.getenv('VOYAGE_EMBED_DIM','512')))
+            embs = embed_texts_voyage(texts, batch=64, output_dimension=int(os.getenv('VOYAGE_EMBED_DIM','512')),
+                                      counts=counts)
         except Exception as e:
             print(f"Voyage embedding failed ({e}); falling back to local embeddings.")
-            embs = []
-        if not embs:
+            embs = None
+        if embs is None or not len(embs):
             embs = embed_texts_local(texts)
     elif et == 'mxbai':
         try:
@@ -363,66 +441,651 @@ def main() -> None:
     else:
         if client is not None:
             try:
-                cache = EmbeddingCache(OUTDIR)
+                cache = cache or EmbeddingCache(OUTDIR)
                 hashes = [c['hash'] for c in chunks]
-                embs = cache.embed_texts(client, texts, hashes, model='text-embedding-3-large', batch=64)
-                pruned = cache.prune(set(hashes))
-                if pruned > 0:
-                    print(f'Pruned {pruned} orphaned embeddings from cache.')
-                cache.save()
+                embs = cache.embed_texts(client, texts, hashes, model='text-embedding-3-large', batch=64, counts=counts)
             except Exception as e:
                 print(f'Embedding via OpenAI failed ({e}); falling back to local embeddings.')
-        if not embs:
+                embs = None
+        if embs is None or not len(embs):
             embs = embed_texts_local(texts)
-    point_ids: List[str] = []
+    return embs
+
+def _point_batch(chunks: List[Dict]):
+    """Point ids and slim payloads for a batch of chunks."""
+    ids, payloads = [], []
+    for c in chunks:
+        slim_payload = {
+            'id': c.get('id'),
+            'file_path': c.get('file_path'),
+            'start_line': c.get('start_line'),
+            'end_line': c.get('end_line'),
+            'layer': c.get('layer'),
+            'repo': c.get('repo'),
+            'origin': c.get('origin'),
+            'hash': c.get('hash'),
+            'language': c.get('language'),
+            'parent_id': c.get('parent_id'),
+            'token_count': c.get('token_count'),
+        }
+        ids.append(_point_id(c['id']))
+        payloads.append({k: v for k, v in slim_payload.items() if v is not None})
+    return ids, payloads
+
+def _collection_dim(q: QdrantClient, name: str | None) -> int | None:
+    if not name:
+        return None
+    try:
+        info = q.get_collection(name)
+        vecs = info.config.params.vectors
+        dense = vecs.get('dense') if isinstance(vecs, dict) else None
+        return int(dense.size) if dense is not None else None
+    except Exception:
+        return None
+
+def _write_last_index(chunk_count: int, extra: Dict | None = None) -> None:
     try:
-        q = QdrantClient(url=QDRANT_URL)
-        qdrant_recreate_fallback.recreate_collection(
-            q,
-            collection_name=COLLECTION,
-            vectors_config={'dense': models.VectorParams(size=len(embs[0]), distance=models.Distance.COSINE)}
-        )
-        points = []
-        for c, v in zip(chunks, embs):
-            cid = str(c['id'])
-            pid = str(uuid.uuid5(uuid.NAMESPACE_DNS, cid))
-            slim_payload = {
-                'id': c.get('id'),
-                'file_path': c.get('file_path'),
-                'start_line': c.get('start_line'),
-                'end_line': c.get('end_line'),
-                'layer': c.get('layer'),
-                'repo': c.get('repo'),
-                'origin': c.get('origin'),
-                'hash': c.get('hash'),
-                'language': c.get('language')
-            }
-            slim_payload = {k: v for k, v in slim_payload.items() if v is not None}
-            points.append(models.PointStruct(id=pid, vector={'dense': v}, payload=slim_payload))
-            point_ids.append(pid)
-            if len(points) == 64:
-                q.upsert(COLLECTION, points=points)
-                points = []
-        if points:
-            q.upsert(COLLECTION, points=points)
-        import json as _json
-        _json.dump({str(i): pid for i, pid in enumerate(point_ids)}, open(os.path.join(OUTDIR,'bm25_index','bm25_point_ids.json'),'w'))
-        print(f'Indexed {len(chunks)} chunks to Qdrant (embeddings: {len(embs[0])} dims).')
+        meta = {
+            'repo': REPO,
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'chunks_path': os.path.join(OUTDIR, 'chunks.jsonl'),
+            'bm25_index_dir': os.path.join(OUTDIR, 'bm25_index'),
+            'chunk_count': chunk_count,
+            'collection_name': COLLECTION,
+        }
+        meta.update(extra or {})
+        with open(os.path.join(OUTDIR, 'last_index.json'), 'w', encoding='utf-8') as mf:
+            json.dump(meta, mf, indent=2)
+    except Exception:
+        pass
+
+def _iter_batches(pred, size: int):
+    """Stream chunks.jsonl in batches of ``size`` chunks matching ``pred``."""
+    batch: List[Dict] = []
+    for c in _iter_chunks(os.path.join(OUTDIR, 'chunks.jsonl')):
+        if not pred(c):
+            continue
+        batch.append(c)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _checkpoint_secs() -> float:
+    try:
+        return max(0.0, float(os.getenv('DENSE_CHECKPOINT_SECS', '30') or 30))
+    except ValueError:
+        return 30.0
+
+def _openai_cache(all_hashes: set) -> EmbeddingCache | None:
+    """The OpenAI embedding cache, loaded and pruned once per dense stage."""
+    if _embedding_type() in ('voyage', 'mxbai', 'local') or not OPENAI_API_KEY:
+        return None
+    try:
+        cache = EmbeddingCache(OUTDIR)
+        pruned = cache.prune(all_hashes)
+        if pruned > 0:
+            print(f'Pruned {pruned} orphaned embeddings from cache.')
+        return cache
+    except Exception:
+        return None
+
+def _dense_stage(manifest: Dict, incremental: bool, all_hashes: set, chunk_count: int, extra: Dict,
+                 prof: BuildProfiler) -> None:
+    # COLLECTION is an alias. Incremental runs upsert into the live collection;
+    # full rebuilds fill a new versioned collection and swap the alias when
+    # done, so searches keep hitting complete dense results meanwhile.
+    q = make_client(QDRANT_URL)
+    sig = _dense_signature()
+    live = resolve_alias(q, COLLECTION)
+    coll_dim = _collection_dim(q, live)
+    incremental = incremental and coll_dim is not None and _dense_matches(manifest['dense'], sig)
+    # Checkpoints: every DENSE_CHECKPOINT_SECS the uploads are drained and
+    # files whose chunks are all in Qdrant get their manifest ``dense`` flag,
+    # so a rerun after a crash only embeds what is left. A full rebuild that
+    # died records its versioned collection in ``dense_build`` and is resumed
+    # rather than started over.
+    build = manifest.get('dense_build') or {}
+    resume_dim = _collection_dim(q, build.get('target')) if not incremental and build.get('signature') == sig else None
+    cache = _openai_cache(all_hashes)
+    every = _checkpoint_secs()
+    batch_size = int(os.getenv('EMBED_STREAM_BATCH', '512') or 512)
+    files = manifest['files']
+    while True:
+        resumed = not incremental and resume_dim is not None
+        if not incremental and not resumed:
+            for e in files.values():
+                e['dense'] = False
+                e.pop('reuse', None)  # nothing to copy from in a new collection
+            manifest['dense'] = {}
+            manifest['dense_build'] = None
+            save_manifest(OUTDIR, manifest)
+        pred = (lambda c: not files.get(c.get('file_path'), {}).get('dense')) if incremental or resumed else (lambda c: True)
+        if incremental:
+            dim, target = coll_dim, live
+        elif resumed:
+            dim, target = resume_dim, build['target']
+            print(f'Resuming full rebuild into {target} '
+                  f'({sum(1 for e in files.values() if e.get("dense"))}/{len(files)} files already uploaded).')
+        else:
+            dim, target = None, None
+        n, n_reused, restart = 0, 0, False
+        # Uploads run in the background (QDRANT_UPSERT_PARALLEL requests in
+        # flight, wait=False) while the next batch is being embedded.
+        uploader = BulkUploader(q, target) if target else None
+        # Chunks still to upload per file; finished files are flagged at the next checkpoint.
+        left = {fp: len(e.get('chunks', [])) for fp, e in files.items() if not e.get('dense')}
+        done: List[str] = []
+
+        def checkpoint() -> None:
+            if uploader is not None:
+                uploader.drain()
+            for fp in done:
+                files[fp]['dense'] = True
+                files[fp].pop('reuse', None)
+            done.clear()
+            if cache is not None:
+                cache.flush()
+            save_manifest(OUTDIR, manifest)
+
+        embed_secs = 0.0
+        last_ckpt = time.time()
         try:
-            meta = {
-                'repo': REPO,
-                'timestamp': datetime.utcnow().isoformat() + 'Z',
-                'chunks_path': os.path.join(OUTDIR, 'chunks.jsonl'),
-                'bm25_index_dir': os.path.join(OUTDIR, 'bm25_index'),
-                'chunk_count': len(chunks),
-                'collection_name': COLLECTION,
-                'embedding_type': (os.getenv('EMBEDDING_TYPE','openai') or 'openai').lower(),
-                'embedding_dim': len(embs[0]) if embs and embs[0] else None,
-            }
-            with open(os.path.join(OUTDIR, 'last_index.json'), 'w', encoding='utf-8') as mf:
-                json.dump(meta, mf, indent=2)
-        except Exception:
-            pass
+            for batch in _iter_batches(pred, batch_size):
+                # Unchanged chunks copy their vector within the live collection only.
+                reused = _reused_vectors(q, target, batch, files, dim) if incremental and target == live else {}
+                fresh = [c for c in batch if str(c['id']) not in reused] if reused else batch
+                t0 = time.time()
+                with prof.stage('embed') as st:
+                    embs = _embed_chunks(fresh, cache) if fresh else np.zeros((0, dim), dtype=np.float32)
+                    st['items'] = len(fresh)
+                    st['bytes'] = sum(len(c.get('code', '')) for c in fresh)
+                embed_secs += time.time() - t0
+                if reused:
+                    # Fresh rows first, then the copied ones; the batch follows.
+                    batch = fresh + [c for c in batch if str(c['id']) in reused]
+                    embs = np.vstack([np.asarray(embs, dtype=np.float32).reshape(len(fresh), -1) if fresh
+                                      else np.zeros((0, dim), dtype=np.float32)]
+                                     + [reused[str(c['id'])][None, :] for c in batch[len(fresh):]])
+                bdim = int(embs.shape[1]) if embs.ndim == 2 and len(embs) else None
+                if dim is None:
+                    dim = bdim
+                    pdim = _prefix_dim(sig, dim)
+                    # With quantization the int8/binary codes stay in RAM and
+                    # the float32 originals go to disk (used for rescoring).
+                    # Same with a Matryoshka prefix: the short vector is
+                    # searched, the full one only rescores.
+                    quant = quantization_config(sig['quantization'])
+                    vectors = {'dense': models.VectorParams(size=dim, distance=models.Distance.COSINE,
+                                                            on_disk=True if quant or pdim else None)}
+                    if pdim:
+                        vectors[PREFIX_NAME] = models.VectorParams(size=pdim, distance=models.Distance.COSINE)
+                    target = create_versioned_collection(
+                        q, COLLECTION,
+                        vectors_config=vectors,
+                        quantization_config=quant,
+                        shard_number=sig['shard_number'] if sig['shard_number'] > 1 else None,
+                        sparse_vectors_config={SPARSE_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+                        if sig['sparse'] != 'none' else None,
+                    )
+                    uploader = BulkUploader(q, target)
+                    manifest['dense_build'] = {'target': target, 'signature': sig}
+                    save_manifest(OUTDIR, manifest)
+                elif bdim != dim:
+                    print(f'Embedding dim changed ({dim} -> {bdim}); rebuilding collection.')
+                    restart = True
+                    break
+                ids, payloads = _point_batch(batch)
+                # QDRANT_SPARSE=1: BM25 term weights ride along on the same points.
+                sparse = doc_vectors([_bm25_doc(c) for c in batch], extra.get('bm25_avgdl') or 1.0) \
+                    if sig['sparse'] != 'none' else None
+                pdim = _prefix_dim(sig, dim)
+                uploader.add(ids, embs, payloads, sparse,
+                             named={PREFIX_NAME: _renorm_truncate(embs, pdim)} if pdim else None)
+                n += len(batch)
+                n_reused += len(reused)
+                for c in batch:
+                    fp = c.get('file_path')
+                    if fp in left:
+                        left[fp] -= 1
+                        if left[fp] <= 0:
+                            del left[fp]
+                            done.append(fp)
+                if time.time() - last_ckpt >= every:
+                    checkpoint()
+                    last_ckpt = time.time()
+            upload = uploader.finish() if uploader else {}
+            if upload.get('points'):
+                # Uploads overlap embedding: wall_s is the time with requests in flight.
+                prof.add('upload', upload['busy_seconds'], items=upload['points'],
+                         nbytes=upload['points'] * (dim or 0) * 4, parallel=upload['parallel'],
+                         blocked_s=upload['blocked_seconds'])
+        except BaseException:
+            # Keep whatever Qdrant already accepted for the next run.
+            try:
+                checkpoint()
+            except BaseException:
+                pass
+            if uploader:
+                uploader.abort()
+            raise
+        if restart and incremental:
+            incremental = False
+            continue
+        if restart and resumed:
+            q.delete_collection(target)
+            resume_dim = None
+            continue
+        if restart:
+            # Never publish a half-built version; the alias keeps serving the old one.
+            q.delete_collection(target)
+            manifest['dense_build'] = None
+            save_manifest(OUTDIR, manifest)
+            raise RuntimeError('embedding dimension changed during a full rebuild')
+        break
+    if cache is not None:
+        cache.flush()
+    if (incremental or resumed) and manifest['dense_pending_deletes']:
+        pids = [_point_id(cid) for cid in manifest['dense_pending_deletes']]
+        for i in range(0, len(pids), 256):
+            q.delete(target, points_selector=models.PointIdsList(points=pids[i:i+256]), wait=True)
+    if dim is None:
+        print('No chunks to embed.')
+        return
+    if not incremental:
+        swap_alias(q, COLLECTION, target)
+        dropped = gc_versions(q, COLLECTION, keep=int(os.getenv('QDRANT_KEEP_VERSIONS', '0') or 0))
+        print(f'Alias {COLLECTION} -> {target}' + (f' (dropped {len(dropped)} old version(s))' if dropped else '') + '.')
+    for e in files.values():
+        e['dense'] = True
+        e.pop('reuse', None)
+    manifest['dense_pending_deletes'] = []
+    manifest['dense_build'] = None
+    manifest['dense'] = dict(sig, dim=dim)
+    save_manifest(OUTDIR, manifest)
+    mode = 'incremental' if incremental else 'full'
+    pdim = _prefix_dim(sig, dim)
+    print(f'Indexed {n} chunks to Qdrant ({mode}{", resumed" if resumed else ""}; {chunk_count} total, embeddings: {dim} dims'
+          + (f', {pdim}-dim prefix' if pdim else '') + (f'; {n_reused} vectors reused' if n_reused else '') + ').')
+    if upload.get('points'):
+        print(f"Upload: {upload['points']} points at {upload['points_per_sec']} points/s "
+              f"(embedding {embed_secs:.1f}s, waited on upload {upload['blocked_seconds']:.1f}s).")
+    _write_last_index(chunk_count, dict(extra, dense_mode=mode, embedding_type=_embedding_type(), embedding_dim=dim,
+                                        dense_backlog=0, dense_timestamp=datetime.utcnow().isoformat() + 'Z',
+                                        dense_collection=target, quantization=sig['quantization'], sparse=sig['sparse'],
+                                        prefix_dim=pdim, vectors_reused=n_reused,
+                                        upload=dict(upload, embed_seconds=round(embed_secs, 3))))
+
+def _skip_dense() -> bool:
+    return (os.getenv('SKIP_DENSE', '0') or '0').strip() == '1'
+
+def _size_key(cs: Dict | None) -> Dict | None:
+    # Builds before chunk_tokenizer existed kept the tokenizer in chunk_size.
+    return {k: v for k, v in cs.items() if k != 'tokenizer'} if cs else cs
+
+def _chunk_size(prev: Dict | None) -> Dict:
+    """Chunk sizing for this build (manifest ``chunk_size``). The token budget
+    follows the embedding model the collection is built with. A SKIP_DENSE
+    run (the git hooks export EMBEDDING_TYPE=local SKIP_DENSE=1) doesn't
+    build it, so it keeps the recorded sizing, or the recorded embedding
+    type's budget, and never re-chunks on its own."""
+    et = _embedding_type()
+    if _skip_dense():
+        if prev is not None and prev.get('chunk_size'):
+            return _size_key(prev['chunk_size'])
+        et = ((prev or {}).get('dense') or {}).get('embedding_type') or et
+    budget = chunk_token_budget(et)
+    return {'tokens': budget} if budget else {'chars': 900}
+
+def _discoverable(paths) -> List[str]:
+    """Paths that a full collect_files() walk would yield."""
+    return filter_collectable(BASES, paths, abs_excludes=_EXCLUDE_GLOBS)
+
+def _git_change_set(prev: Dict) -> set | None:
+    """Union of git-reported changes for every base since the indexed HEADs."""
+    states = prev.get('git') or {}
+    changed: set = set()
+    for base in BASES:
+        got = changed_since(base, states.get(base))
+        if got is None:
+            return None
+        changed |= got
+    return changed
+
+def _prev_last_index() -> Dict:
+    try:
+        with open(os.path.join(OUTDIR, 'last_index.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def main(changed_paths: List[str] | None = None) -> None:
+    """Build or update the index for REPO.
+
+    ``changed_paths`` is an explicit change set (the file watcher passes the
+    paths it saw change); only those are re-read, everything else is carried
+    over from the manifest. Per-stage timings go to build_report.json next to
+    last_index.json, also when the build fails.
+    """
+    prof = BuildProfiler()
+    prof.info = {'repo': REPO, 'ok': False}
+    try:
+        _build(changed_paths, prof)
+        prof.info['ok'] = True
+    finally:
+        prof.write(OUTDIR)
+        print(f'Build profile: {prof.summary()} (build_report.json).')
+
+def _build(changed_paths: List[str] | None, prof: BuildProfiler) -> None:
+    # Incremental mode: compare against the per-file manifest of the last run.
+    # FULL_REINDEX=1 (or a missing/unreadable manifest) forces a clean rebuild.
+    full = (os.getenv('FULL_REINDEX', '0') or '0').strip() == '1'
+    prev = None if full else load_manifest(OUTDIR)
+    if prev is not None and not os.path.exists(os.path.join(OUTDIR, 'chunks.jsonl')):
+        prev = None
+    # Snapshot HEAD + dirty paths before reading anything so edits made during
+    # the run are picked up next time.
+    git_state = {base: snap for base in BASES if (snap := git_snapshot(base))}
+    # NEAR_DUP=1 collapses near-identical chunks; switching it (or its
+    # thresholds) re-chunks every file so the collapsing is consistent.
+    near_cfg = near_dup_settings()
+    rechunk = prev is not None and prev.get('near_dup') != near_cfg
+    if rechunk:
+        print('Near-duplicate settings changed; re-chunking every file.')
+    # CHUNK_HIERARCHY=1 indexes leaf units and stores enclosing definitions
+    # as parents; switching it re-chunks every file too.
+    hierarchy = hierarchy_enabled()
+    if prev is not None and not rechunk and bool(prev.get('hierarchy')) != hierarchy:
+        rechunk = True
+        print('Chunk hierarchy setting changed; re-chunking every file.')
+    # Chunks are sized to the embedding model's token budget (CHUNK_TOKENS)
+    # and carry their token_count; a new budget re-chunks too.
+    chunk_size = _chunk_size(prev)
+    if prev is not None and not rechunk and _size_key(prev.get('chunk_size')) != chunk_size:
+        rechunk = True
+        print('Chunk size budget changed; re-chunking every file.')
+    tokenizer = tokenizer_name()
+    if prev is not None and prev.get('chunk_tokenizer') not in (None, tokenizer):
+        print(f"Warning: token counts now use {tokenizer}, the index was sized with {prev['chunk_tokenizer']}; "
+              f"files are re-sized as they change (FULL_REINDEX=1 re-sizes all of them).")
+    # INDEX_SHARDS splits BM25 into per-directory / hash shards (unset: keep
+    # the layout of the last build, even across FULL_REINDEX); REBUILD_SHARDS
+    # re-chunks, re-embeds and re-indexes just the named shards.
+    recorded = (prev if prev is not None else load_manifest(OUTDIR)) or {}
+    shard_cfg = shard_mode((recorded.get('bm25') or {}).get('shards'))
+    rebuild = rebuild_requested() if shard_cfg else set()
+    if rebuild:
+        print(f"Rebuilding shard(s): {', '.join(sorted(rebuild))}.")
+
+    def in_rebuild(fp: str) -> bool:
+        return bool(rebuild) and shard_of(fp, BASES, shard_cfg) in rebuild
+
+    with prof.stage('discover') as st:
+        # GIT_DIFF_INDEX=1: take the change set from git instead of walking and
+        # stat()ing the whole tree; falls back to the walk if git can't answer.
+        plan = None
+        if prev is not None and changed_paths is not None and not rechunk and not rebuild:
+            changed = sorted(set(changed_paths))
+            plan = plan_from_changed(prev, changed, _discoverable(changed))
+            print(f'Watcher change set: {len(changed)} paths.')
+        elif prev is not None and not rechunk and not rebuild and (os.getenv('GIT_DIFF_INDEX', '0') or '0').strip() == '1':
+            changed = _git_change_set(prev)
+            if changed is not None:
+                plan = plan_from_changed(prev, sorted(changed), _discoverable(sorted(changed)))
+                print(f'Git diff since last index: {len(changed)} changed paths.')
+        if plan is None:
+            files = collect_files(BASES, abs_excludes=_EXCLUDE_GLOBS)
+            print(f'Discovered {len(files)} source files.')
+            plan = plan_changes(prev or empty_manifest(), files)
+        st['items'] = len(plan['fresh']) + len(plan['stale'])
+    if rechunk:
+        plan['stale'], plan['fresh'] = sorted(plan['stale'] + plan['fresh']), []
+    prev_files: Dict[str, Dict] = (prev or {}).get('files', {})
+    digests = _prev_chunk_digests(set(plan['fresh']) | set(plan['stale'])) if prev_files else {}
+
+    def carried_ok(fp: str) -> bool:
+        e = prev_files[fp]
+        return digests.get(fp, chunk_ids_digest([])) == entry_digest(e)
+
+    manifest = empty_manifest()
+    manifest['dense'] = dict((prev or {}).get('dense') or {})
+    manifest['dense_build'] = (prev or {}).get('dense_build')
+    manifest['near_dup'] = near_cfg
+    manifest['hierarchy'] = hierarchy
+    manifest['chunk_size'] = chunk_size
+    manifest['chunk_tokenizer'] = tokenizer
+    manifest['git'] = git_state
+    seen: set = set()
+    carry: set = set()
+    counts = {'carried': 0, 'added': 0, 'changed': 0, 'deleted': len(plan['deleted'])}
+    near_idx = NearDupIndex(near_cfg['bits']) if near_cfg else None
+    near_count = 0
+
+    def index_near(fp: str, e: Dict) -> None:
+        # Carried-over chunks can be the representative for new copies.
+        if near_idx is None:
+            return
+        for (cid, h), sig in zip(e.get('chunks', []), e.get('simhash', [])):
+            if sig:
+                near_idx.add(int(sig, 16), lang_from_path(fp), (cid, h))
+
+    stale = list(plan['stale'])
+    for fp in plan['fresh']:
+        if in_rebuild(fp) or not carried_ok(fp):
+            stale.append(fp)
+            continue
+        e = prev_files[fp]
+        seen.update(h for _cid, h in e.get('chunks', []))
+        carry.add(fp)
+        manifest['files'][fp] = e
+        index_near(fp, e)
+        counts['carried'] += 1
+
+    to_ingest: List = []
+    for fp in stale:
+        if not path_allowed(fp):
+            manifest['files'][fp] = make_entry(plan['stats'][fp], None, [], [])
+            continue
+        pe = prev_files.get(fp)
+        # A matching content hash lets the worker skip chunking (touched files,
+        # branch round-trips); it is only trusted if the old chunks are intact.
+        # Files that dropped duplicates are always re-chunked: they may be here
+        # because the surviving copy went away and must re-emit those chunks.
+        expected = pe.get('sha1') if pe is not None and carried_ok(fp) and not rechunk and not pe.get('dups') \
+            and not in_rebuild(fp) else None
+        to_ingest.append((fp, expected))
+
+    # Streaming build: files flow ingestion pool -> dedupe -> enrich ->
+    # chunks.jsonl / corpus.txt, then carried-over chunks are copied from the
+    # previous chunks.jsonl, without accumulating the corpus in memory.
+    # CHUNK_STORE=blob: workers put each file's text in the blob store once
+    # and chunks.jsonl keeps byte offsets into it instead of the code.
+    store = store_mode()
+    blobs = blobs_dir(OUTDIR) if store == 'blob' else None
+    sink = _ChunkSink(OUTDIR, store)
+    final_ids: set = set()
+    new_count = 0
+    reused_count = 0
+    # Vectors can only be carried over within an unchanged collection. A
+    # SKIP_DENSE run records them for whichever run updates that collection;
+    # the dense stage drops them if it has to build a new one instead.
+    can_reuse = bool(manifest['dense']) if _skip_dense() else _dense_matches(manifest['dense'], _dense_signature())
+    try:
+        # Ingestion fans out to a process pool (INDEX_WORKERS); each file is
+        # read once there and results come back in discovery order so dedup
+        # and chunks.jsonl stay deterministic.
+        workers = chunk_workers()
+        prof.info.update(workers=workers, files_ingested=len(to_ingest))
+        for rec in prof.timed('ingest', iter_ingested_files(to_ingest, workers=workers, target=900, blobs=blobs,
+                                                                  tokens=chunk_size.get('tokens', 0))):
+            fp = rec['path']
+            # Read and chunk happen in the pool: summed worker time.
+            prof.add('read', rec['read_s'], items=1, nbytes=rec['bytes'], parallel=workers)
+            if rec['chunks']:
+                prof.add('chunk', rec['chunk_s'], items=len(rec['chunks']), parallel=workers)
+            st = plan['stats'][fp]
+            pe = prev_files.get(fp)
+            if rec['unchanged']:
+                old_hashes = [h for _cid, h in pe.get('chunks', [])]
+                if not any(h in seen for h in old_hashes):
+                    # Content unchanged (e.g. touched or checked out again): carry over.
+                    seen.update(old_hashes)
+                    carry.add(fp)
+                    manifest['files'][fp] = dict(pe, size=st['size'], mtime=st['mtime'])
+                    index_near(fp, pe)
+                    counts['carried'] += 1
+                    continue
+                # Its chunks now collide with a file processed earlier: re-chunk.
+                rec = ingest_file(fp, 900, blobs=blobs, tokens=chunk_size.get('tokens', 0))
+                prof.add('read', rec['read_s'], items=1, nbytes=rec['bytes'])
+                prof.add('chunk', rec['chunk_s'], items=len(rec['chunks']))
+            if rec['skip']:
+                if rec['skip'] != 'unreadable':
+                    manifest['files'][fp] = make_entry(st, rec['sha1'], [], [])
+                continue
+            try:
+                origin = detect_origin(fp, rec['head'])
+            except Exception:
+                origin = 'first_party'
+            kept, dups, sigs, near, parents = [], [], [], [], []
+            lang = lang_from_path(fp)
+            with prof.stage('dedupe') as ds:
+                for c in _tag_chunks(rec['chunks'], origin):
+                    if c.get('type') == 'parent':
+                        parents.append(c)
+                        continue
+                    if c['hash'] in seen:
+                        dups.append(c['hash'])
+                        continue
+                    sig = simhash(c.get('code', ''), near_cfg['min_tokens']) if near_idx is not None else None
+                    if sig is not None:
+                        rep = near_idx.find(sig, lang)
+                        if rep is not None:
+                            # Collapsed into a near-identical chunk; listing its hash
+                            # in dups re-chunks this file if that chunk goes away.
+                            dups.append(rep[1])
+                            near.append([rep[0], c.get('start_line'), c.get('end_line')])
+                            continue
+                        near_idx.add(sig, lang, (str(c['id']), c['hash']))
+                    seen.add(c['hash'])
+                    kept.append(c)
+                    sigs.append(sig)
+                ds['items'] = len(rec['chunks'])
+            with prof.stage('enrich') as es:
+                _enrich_chunks(kept)
+                es['items'] = len(kept)
+            with prof.stage('write') as ws:
+                for c in kept:
+                    sink.write(c)
+                    final_ids.add(str(c['id']))
+                for c in parents:
+                    sink.write_parent(c)
+                ws['items'] = len(kept)
+            new_count += len(kept)
+            near_count += len(near)
+            manifest['files'][fp] = make_entry(st, rec['sha1'], kept, dups,
+                                               simhashes=sigs if near_idx is not None else None, near_dups=near)
+            if can_reuse and pe is not None and pe.get('dense') and kept:
+                # Chunks whose code didn't change keep their Qdrant vector:
+                # the dense stage copies it to the new id instead of embedding.
+                reuse = _reuse_map(pe, kept)
+                if reuse:
+                    manifest['files'][fp]['reuse'] = reuse
+                    reused_count += len(reuse)
+            counts['changed' if pe is not None else 'added'] += 1
+        if carry:
+            with prof.stage('carry') as cs:
+                for c in _iter_jsonl(sink.chunks_path):
+                    if c.get('file_path') in carry:
+                        sink.write(c)
+                        final_ids.add(str(c['id']))
+                        cs['items'] += 1
+                for c in _iter_jsonl(sink.parents_path):
+                    if c.get('file_path') in carry:
+                        sink.write_parent(c)
+    finally:
+        sink.close()
+
+    dropped = set()
+    for fp in stale + plan['deleted']:
+        for cid, _h in prev_files.get(fp, {}).get('chunks', []):
+            dropped.add(cid)
+    dropped -= final_ids
+    manifest['dense_pending_deletes'] = sorted((set((prev or {}).get('dense_pending_deletes', [])) - final_ids) | dropped)
+    del final_ids
+    print(f"Prepared {sink.count} chunks "
+          f"({counts['carried']} files unchanged, {counts['added']} added, {counts['changed']} changed, {counts['deleted']} deleted; "
+          f"{new_count} chunks to (re)embed"
+          + (f", {reused_count} of them unchanged (vector reused)" if reused_count else '')
+          + (f"; {near_count} near-duplicates collapsed" if near_count else '')
+          + (f"; {sink.parent_count} parents" if sink.parent_count else '') + ").")
+    # near_dups.json: representative chunk id -> collapsed copies, so search
+    # results can still point at every location.
+    near_path = os.path.join(OUTDIR, 'near_dups.json')
+    if near_cfg:
+        with open(near_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(alt_locations(manifest['files']), f)
+        os.replace(near_path + '.tmp', near_path)
+    elif os.path.exists(near_path):
+        os.remove(near_path)
+
+    # The manifest is saved only after BM25 is built, so a recorded build with
+    # the same chunk set (e.g. a rerun after the dense stage died) is intact.
+    prev_bm25 = (prev or {}).get('bm25') or {}
+    n_shards = 0
+    if shard_cfg:
+        # Only shards whose chunks changed are re-tokenized, in parallel.
+        state = build_bm25_shards(_iter_chunks(sink.chunks_path), OUTDIR, BASES, shard_cfg, _bm25_doc,
+                                  force=rebuild, workers=chunk_workers(), profiler=prof, save_corpus=store != 'blob')
+        avgdl = state['avgdl'] or 1.0
+        n_shards = len(state['shards'])
+        rebuilt = state['rebuilt']
+        print(f'BM25 index: {n_shards} shards ({shard_cfg}), {len(rebuilt)} rebuilt'
+              + (f": {', '.join(rebuilt[:8])}{', ...' if len(rebuilt) > 8 else ''}" if rebuilt else '') + '.')
+    elif not new_count and not dropped and prev_bm25.get('chunks') == sink.count and not prev_bm25.get('shards') \
+            and os.path.isdir(sink.idx_dir):
+        avgdl = float(prev_bm25.get('avgdl') or 1.0)
+        print('BM25 index unchanged.')
+    else:
+        remove_shards(OUTDIR)
+        _n, avgdl = build_bm25_streaming(lambda: (_bm25_doc(c) for c in _iter_chunks(sink.chunks_path)), sink.idx_dir,
+                                         profiler=prof, save_corpus=store != 'blob')
+        print('BM25 index saved.')
+    manifest['bm25'] = {'chunks': sink.count, 'avgdl': round(avgdl, 4), 'shards': shard_cfg}
+
+    changes = {'files_' + k: v for k, v in counts.items()}
+    changes['chunks_new'] = new_count
+    changes['chunks_reused'] = reused_count
+    changes['chunks_near_dup'] = near_count
+    # dense_backlog: chunks whose Qdrant points lag behind BM25 (reported in
+    # the freshness trace); dense_timestamp is when Qdrant last caught up.
+    extra = {'incremental': prev is not None, 'changes': changes,
+             'git': {base: st['head'] for base, st in git_state.items()},
+             'dense_backlog': dense_backlog(manifest),
+             'bm25_avgdl': round(avgdl, 4),
+             'bm25_shards': n_shards,
+             'parent_count': sink.parent_count,
+             'chunk_size': chunk_size,
+             'token_count': sink.tokens}
+    # Until the dense stage rewrites them, keep describing the collection
+    # that is actually being served (search reads quantization/sparse here).
+    prev_meta = _prev_last_index()
+    for k in ('dense_timestamp', 'dense_mode', 'embedding_type', 'embedding_dim', 'dense_collection', 'quantization', 'sparse',
+              'prefix_dim'):
+        if k in prev_meta:
+            extra[k] = prev_meta[k]
+    _write_last_index(sink.count, extra)
+    save_manifest(OUTDIR, manifest)
+
+    if _skip_dense():
+        print('Skipping dense embeddings and Qdrant upsert (SKIP_DENSE=1).')
+        return
+    if not sink.count:
+        print('No chunks to embed.')
+        return
+    try:
+        _dense_stage(manifest, prev is not None, seen, sink.count, extra, prof)
     except Exception as e:
         print(f"Qdrant unavailable or failed to index ({e}); continuing with BM25-only index. Dense retrieval will be disabled.")
 
@@ -0,0 +1,191 @@
+"""Per-file content manifest for incremental indexing.
+
+The manifest lives next to chunks.jsonl as ``manifest.json`` and records, for
+every file the indexer looked at, its size, mtime, content hash and the chunks
+it produced. ``index_repo.main()`` uses it to re-chunk only files that were
+added or changed, carry the rest over from the previous chunks.jsonl and
+upsert/delete Qdrant points by id instead of recreating the collection.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def manifest_path(outdir: str) -> str:
+    return os.path.join(outdir, MANIFEST_NAME)
+
+
+def empty_manifest() -> Dict[str, Any]:
+    # dense_build: versioned collection of a full rebuild still in progress;
+    # bm25: chunk count / avgdl of the last completed BM25 build;
+    # near_dup: NEAR_DUP settings the chunks were collapsed with (None = off);
+    # hierarchy: whether the chunks were built with CHUNK_HIERARCHY=1;
+    # chunk_size: token budget the chunks were sized with (chunk_tokenizer
+    # counted the tokens; switching it only warns).
+    return {"version": MANIFEST_VERSION, "dense": {}, "dense_pending_deletes": [], "dense_build": None,
+            "bm25": {}, "near_dup": None, "hierarchy": False, "chunk_size": None, "chunk_tokenizer": None,
+            "git": {}, "files": {}}
+
+
+def load_manifest(outdir: str) -> Optional[Dict[str, Any]]:
+    p = manifest_path(outdir)
+    if not os.path.exists(p):
+        return None
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return None
+    data.setdefault("dense", {})
+    data.setdefault("dense_pending_deletes", [])
+    data.setdefault("dense_build", None)
+    data.setdefault("bm25", {})
+    data.setdefault("near_dup", None)
+    data.setdefault("hierarchy", False)
+    data.setdefault("chunk_size", None)
+    data.setdefault("chunk_tokenizer", (data["chunk_size"] or {}).get("tokenizer"))
+    data.setdefault("files", {})
+    data.setdefault("git", {})
+    return data
+
+
+def save_manifest(outdir: str, manifest: Dict[str, Any]) -> None:
+    p = manifest_path(outdir)
+    tmp = p + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, p)
+
+
+def file_stat(fp: str) -> Optional[Dict[str, Any]]:
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return None
+    return {"size": int(st.st_size), "mtime": int(st.st_mtime_ns)}
+
+
+def stat_matches(entry: Dict[str, Any], st: Optional[Dict[str, Any]]) -> bool:
+    return bool(st) and entry.get("size") == st["size"] and entry.get("mtime") == st["mtime"]
+
+
+def make_entry(st: Dict[str, Any], sha: Optional[str], chunks: List[Dict], dups: List[str], dense: bool = False,
+               simhashes: Optional[List[Optional[int]]] = None, near_dups: Optional[List[list]] = None) -> Dict[str, Any]:
+    """Build a manifest entry. ``chunks`` are the kept chunks of the file;
+    ``dups`` are hashes it produced that were dropped as duplicates of another
+    file's chunk (so the file is re-chunked if that other copy goes away).
+    With NEAR_DUP=1, ``simhashes`` runs parallel to ``chunks`` and
+    ``near_dups`` lists ``[representative chunk id, start_line, end_line]``
+    for chunks collapsed into a near-identical one (whose hash is in ``dups``)."""
+    entry = {
+        "size": st["size"],
+        "mtime": st["mtime"],
+        "sha1": sha,
+        "chunks": [[str(c["id"]), c["hash"]] for c in chunks],
+        "dups": sorted(set(dups)),
+        "dense": bool(dense),
+    }
+    if simhashes is not None:
+        entry["simhash"] = [None if h is None else f"{h:016x}" for h in simhashes]
+    if near_dups:
+        entry["near_dups"] = near_dups
+    return entry
+
+
+def chunk_ids_digest(ids) -> str:
+    """Order-sensitive digest of a file's chunk ids (cheap carry-over check)."""
+    return hashlib.sha1("\n".join(str(i) for i in ids).encode("utf-8")).hexdigest()
+
+
+def entry_digest(entry: Dict[str, Any]) -> str:
+    return chunk_ids_digest(cid for cid, _h in entry.get("chunks", []))
+
+
+def plan_changes(prev: Dict[str, Any], files: List[str]) -> Dict[str, Any]:
+    """Classify discovered files against the previous manifest.
+
+    Returns a dict with:
+      - ``fresh``: paths whose size+mtime match the manifest (carried over)
+      - ``stale``: paths that are new or whose stat changed (must be read)
+      - ``deleted``: manifest paths no longer discovered
+      - ``stats``: path -> stat dict for every discovered file
+    Files whose dropped duplicates pointed at a chunk of a stale/deleted file
+    are moved from ``fresh`` to ``stale`` so the surviving copy is re-emitted.
+    """
+    prev_files: Dict[str, Any] = prev.get("files", {})
+    discovered = set(files)
+    stats: Dict[str, Any] = {}
+    fresh: List[str] = []
+    stale: List[str] = []
+    for fp in files:
+        st = file_stat(fp)
+        if st is None:
+            continue
+        stats[fp] = st
+        e = prev_files.get(fp)
+        if e is not None and stat_matches(e, st):
+            fresh.append(fp)
+        else:
+            stale.append(fp)
+    deleted = [fp for fp in prev_files if fp not in discovered or fp not in stats]
+    fresh = _release_dups(prev_files, fresh, stale, deleted)
+    return {"fresh": fresh, "stale": stale, "deleted": deleted, "stats": stats}
+
+
+def plan_from_changed(prev: Dict[str, Any], changed: List[str], collectable: List[str]) -> Dict[str, Any]:
+    """Like ``plan_changes`` but driven by an explicit change set (git diff).
+
+    ``changed`` are all candidate paths reported as changed; ``collectable``
+    is the subset that still exists and passes the discovery filters. Every
+    other manifest entry is carried over without touching the filesystem.
+    """
+    prev_files: Dict[str, Any] = prev.get("files", {})
+    changed_set = set(changed)
+    stats: Dict[str, Any] = {}
+    stale: List[str] = []
+    for fp in collectable:
+        st = file_stat(fp)
+        if st is None:
+            continue
+        stats[fp] = st
+        stale.append(fp)
+    deleted = [fp for fp in changed_set if fp in prev_files and fp not in stats]
+    fresh = [fp for fp in prev_files if fp not in changed_set]
+    fresh = _release_dups(prev_files, fresh, stale, deleted)
+    return {"fresh": fresh, "stale": stale, "deleted": deleted, "stats": stats}
+
+
+def _release_dups(prev_files: Dict[str, Any], fresh: List[str], stale: List[str], deleted: List[str]) -> List[str]:
+    """Move fresh files whose dropped duplicates pointed at a chunk of a
+    stale/deleted file into ``stale`` (in place); return the remaining fresh."""
+    released = set()
+    for fp in stale + deleted:
+        for _cid, h in prev_files.get(fp, {}).get("chunks", []):
+            released.add(h)
+    if not released:
+        return fresh
+    keep: List[str] = []
+    for fp in fresh:
+        if released.intersection(prev_files[fp].get("dups", [])):
+            stale.append(fp)
+        else:
+            keep.append(fp)
+    return keep
+
+
+def dense_backlog(manifest: Dict[str, Any]) -> int:
+    """Chunks whose Qdrant points are not in sync yet (to embed + to delete)."""
+    n = len(manifest.get("dense_pending_deletes") or [])
+    for e in manifest.get("files", {}).values():
+        if not e.get("dense"):
+            n += len(e.get("chunks", []))
+    return n
@@ -0,0 +1,97 @@
+"""Index-time near-duplicate chunk detection (NEAR_DUP=1).
+
+Exact duplicates are already dropped by content hash. This catches the
+copy-pasted variants that hash differently: generated clients, migrations,
+vendored forks that differ in whitespace or a few identifiers.
+
+Each chunk gets a 64-bit SimHash over its token 3-shingles (whitespace and
+indentation produce no tokens, so reformatting moves no bits). Two
+chunks are near-duplicates when their SimHashes differ in at most
+NEAR_DUP_BITS bits. Lookups use the pigeonhole trick: the hash is split into
+NEAR_DUP_BITS + 1 blocks, any match within the threshold agrees exactly on at
+least one block, so only chunks sharing a block are compared. Chunks shorter
+than NEAR_DUP_MIN_TOKENS are never collapsed (tiny getters legitimately look
+alike).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import hashlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+BITS = 64
+_TOKEN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+|[^\s\w]')
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)) or default)
+    except ValueError:
+        return default
+
+
+def settings() -> Optional[Dict[str, int]]:
+    """Active near-dup settings, or None when NEAR_DUP is off. Stored in the
+    manifest so a change re-chunks every file."""
+    if (os.getenv('NEAR_DUP', '0') or '0').strip() != '1':
+        return None
+    return {'bits': max(0, min(16, _env_int('NEAR_DUP_BITS', 3))),
+            'min_tokens': max(3, _env_int('NEAR_DUP_MIN_TOKENS', 40))}
+
+
+def simhash(code: str, min_tokens: int = 40) -> Optional[int]:
+    toks = _TOKEN.findall(code or '')
+    if len(toks) < max(3, min_tokens):
+        return None
+    shingles = {' '.join(toks[i:i + 3]) for i in range(len(toks) - 2)}
+    h = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little') for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    bits = np.unpackbits(h.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    major = bits.sum(axis=0, dtype=np.int64) * 2 > len(h)
+    return int(np.packbits(major, bitorder='little').view('<u8')[0])
+
+
+class NearDupIndex:
+    """SimHash lookup table; ``find`` returns the payload of a stored chunk
+    within ``max_bits`` of the query (same language only)."""
+
+    def __init__(self, max_bits: int = 3):
+        self.max_bits = max_bits
+        n = max_bits + 1
+        step = BITS // n
+        self._blocks: List[Tuple[int, int]] = [
+            (i * step, (BITS - i * step) if i == n - 1 else step) for i in range(n)
+        ]
+        self._tables: List[Dict[tuple, List[Tuple[int, tuple]]]] = [defaultdict(list) for _ in self._blocks]
+
+    def _keys(self, sig: int, lang: str):
+        for t, (shift, width) in enumerate(self._blocks):
+            yield t, (lang, (sig >> shift) & ((1 << width) - 1))
+
+    def add(self, sig: int, lang: str, payload: tuple) -> None:
+        for t, key in self._keys(sig, lang):
+            self._tables[t][key].append((sig, payload))
+
+    def find(self, sig: int, lang: str) -> Optional[tuple]:
+        for t, key in self._keys(sig, lang):
+            for other, payload in self._tables[t].get(key, ()):
+                if bin(sig ^ other).count('1') <= self.max_bits:
+                    return payload
+        return None
+
+
+def alt_locations(files: Dict[str, Dict]) -> Dict[str, List[Dict]]:
+    """representative chunk id -> locations of the copies collapsed into it,
+    gathered from the manifest's ``near_dups`` entries."""
+    out: Dict[str, List[Dict]] = defaultdict(list)
+    for fp in sorted(files):
+        for rep_id, start, end in files[fp].get('near_dups', []):
+            out[rep_id].append({'file_path': fp, 'start_line': start, 'end_line': end})
+    return dict(out)
@@ -0,0 +1,175 @@
+"""Bulk point upload for the dense stage.
+
+``BulkUploader`` splits float32 vector matrices into QDRANT_UPSERT_BATCH-sized
+upserts and keeps up to QDRANT_UPSERT_PARALLEL of them in flight with
+``wait=False``, so embedding the next batch overlaps with uploading the
+previous one. Vectors are converted to plain lists only when each request is
+built. ``finish()`` drains the queue, re-sends the last round of batches with
+``wait=True`` and then counts the uploaded ids (``exact=True``) until Qdrant
+reports every one of them, within QDRANT_VERIFY_SECS. A ``wait=False`` upsert
+is only acknowledged, not applied, and with several shards (QDRANT_SHARD_NUMBER)
+nothing orders them, so the count is what makes the collection safe to
+alias-swap or query.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from retrieval.bm25_sparse import SPARSE_NAME
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default)) or default))
+    except ValueError:
+        return default
+
+
+def make_client(url: str) -> QdrantClient:
+    """REST client, or gRPC when QDRANT_PREFER_GRPC=1 (QDRANT_GRPC_PORT, default 6334)."""
+    if (os.getenv('QDRANT_PREFER_GRPC', '0') or '0').strip() == '1':
+        return QdrantClient(url=url, prefer_grpc=True, grpc_port=_env_int('QDRANT_GRPC_PORT', 6334))
+    return QdrantClient(url=url)
+
+
+class BulkUploader:
+    def __init__(self, client: QdrantClient, collection: str, batch_size: Optional[int] = None,
+                 parallel: Optional[int] = None, vector_name: str = 'dense'):
+        self.client = client
+        self.collection = collection
+        self.batch_size = batch_size or _env_int('QDRANT_UPSERT_BATCH', 256)
+        self.parallel = parallel or _env_int('QDRANT_UPSERT_PARALLEL', 4)
+        if type(getattr(client, '_client', None)).__name__ == 'QdrantLocal':
+            self.parallel = 1  # embedded (path / :memory:) mode is not thread-safe
+        self.vector_name = vector_name
+        self.points = 0
+        self.requests = 0
+        self.busy_seconds = 0.0     # wall time with at least one request in flight
+        self.blocked_seconds = 0.0  # time the caller waited on uploads
+        self._inflight = 0
+        self._busy_since = 0.0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.parallel)
+        self._pending: deque = deque()
+        self._tail: deque = deque(maxlen=self.parallel)  # the last round of batches
+        self._ids: set = set()
+
+    def _send(self, ids: List[str], vecs: np.ndarray, payloads: List[Dict], sparse: Optional[List],
+              named: Optional[Dict[str, np.ndarray]], wait: bool) -> None:
+        with self._lock:
+            if self._inflight == 0:
+                self._busy_since = time.time()
+            self._inflight += 1
+        try:
+            vectors = {self.vector_name: vecs.tolist()}
+            for name, v in (named or {}).items():
+                vectors[name] = v.tolist()
+            if sparse is not None:
+                vectors[SPARSE_NAME] = [models.SparseVector(indices=i, values=v) for i, v in sparse]
+            self.client.upsert(
+                self.collection,
+                points=models.Batch(ids=ids, vectors=vectors, payloads=payloads),
+                wait=wait,
+            )
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                if self._inflight == 0:
+                    self.busy_seconds += time.time() - self._busy_since
+
+    def _wait_oldest(self) -> None:
+        t = time.time()
+        self._pending.popleft().result()
+        self.blocked_seconds += time.time() - t
+
+    def add(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict], sparse: Optional[List] = None,
+            named: Optional[Dict[str, np.ndarray]] = None) -> None:
+        """Queue points; blocks only when ``parallel`` requests are already in flight.
+        ``sparse`` holds optional ``(indices, values)`` BM25 vectors per point,
+        ``named`` extra dense vectors by name (e.g. the Matryoshka prefix)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        for s in range(0, len(ids), self.batch_size):
+            while len(self._pending) >= self.parallel:
+                self._wait_oldest()
+            part = (ids[s:s + self.batch_size], vectors[s:s + self.batch_size], payloads[s:s + self.batch_size],
+                    sparse[s:s + self.batch_size] if sparse is not None else None,
+                    {k: v[s:s + self.batch_size] for k, v in named.items()} if named else None)
+            self._pending.append(self._pool.submit(self._send, *part, False))
+            self._tail.append(part)
+            self._ids.update(part[0])
+            self.points += len(part[0])
+            self.requests += 1
+
+    def drain(self) -> None:
+        """Block until every queued upsert has been accepted by Qdrant."""
+        while self._pending:
+            self._wait_oldest()
+
+    def _missing(self) -> int:
+        """Uploaded ids Qdrant does not report yet (exact count)."""
+        ids = list(self._ids)
+        found = 0
+        for s in range(0, len(ids), 1000):
+            flt = models.Filter(must=[models.HasIdCondition(has_id=ids[s:s + 1000])])
+            found += self.client.count(self.collection, count_filter=flt, exact=True).count
+        return len(ids) - found
+
+    def verify(self, timeout: Optional[float] = None) -> None:
+        """Block until every uploaded point is visible; RuntimeError after
+        ``timeout`` seconds (QDRANT_VERIFY_SECS, default 120)."""
+        if timeout is None:
+            timeout = float(_env_int('QDRANT_VERIFY_SECS', 120))
+        deadline = time.time() + timeout
+        delay = 0.1
+        while True:
+            missing = self._missing()
+            if not missing:
+                return
+            if time.time() >= deadline:
+                raise RuntimeError(f'{self.collection}: {missing} of {len(self._ids)} uploaded points '
+                                   f'not visible after {timeout:g}s')
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    def finish(self) -> Dict:
+        """Wait for every queued upsert, apply the consistency barrier and
+        return throughput stats for last_index.json."""
+        try:
+            self.drain()
+            t = time.time()
+            for part in self._tail:
+                self._send(*part, True)
+            self._tail.clear()
+            if self._ids:
+                self.verify()
+            self.blocked_seconds += time.time() - t
+        finally:
+            self._pool.shutdown(wait=True)
+        return self.stats()
+
+    def abort(self) -> None:
+        for f in self._pending:
+            f.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        return {
+            'points': self.points,
+            'requests': self.requests,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'blocked_seconds': round(self.blocked_seconds, 3),
+            'points_per_sec': round(self.points / self.busy_seconds, 1) if self.busy_seconds > 0 else None,
+            'batch_size': self.batch_size,
+            'parallel': self.parallel,
+            'grpc': (os.getenv('QDRANT_PREFER_GRPC', '0') or '0').strip() == '1',
+        }
@@ -0,0 +1,439 @@
+"""Filesystem watcher for near-real-time incremental indexing.
+
+    python -m indexer.watch                 # every repo in repos.json
+    python -m indexer.watch --repo agro     # a single repo, in-process
+
+Each repo gets its own process (``index_repo`` binds REPO/OUTDIR/COLLECTION at
+import time, and a crash in one repo must not stop the others). Inside it,
+edits are collected with inotify where available (Linux, via libc; no extra
+dependency) or by polling mtimes, debounced for WATCH_DEBOUNCE_MS and then
+handed to ``index_repo.main(changed_paths)`` as an explicit change set: only
+those files are re-chunked, the BM25 shards holding them are rebuilt and the
+changed chunks are upserted to / deleted from Qdrant. BM25 is sharded by
+top-level directory (INDEX_SHARDS=dir) when the repo has no index yet, because
+a single bm25s index has to be re-tokenized in full for every batch, which on
+a large repo costs far more than the edit itself. An existing index keeps the
+layout recorded in its manifest, which manual builds reuse as well; set
+INDEX_SHARDS (``dir``, ``hash:N`` or ``off``) to switch, which rebuilds BM25
+once. The embedding model stays
+loaded between batches, the last syntax tree of recently edited files is kept
+for incremental tree-sitter re-parsing (TREE_CACHE_FILES, default 256 here),
+and chunks of an edited file whose code did not change keep their vectors.
+
+Progress is written to ``<out>/<repo>/watch_state.json`` (pending files, last
+run, errors); ``last_index.json`` carries the dense backlog, which the
+``freshness.status`` trace event reports.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import errno
+import select
+import struct
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from common.config_loader import get_repo_paths, list_repos, out_dir
+from common.filtering import PRUNE_DIRS
+from common.walker import RepoWalker
+from indexer.manifest import load_manifest
+from retrieval.ast_chunker import SKIP_DIRS, _load_exclude_patterns, _skip_dir, lang_from_path
+
+WATCH_STATE_NAME = 'watch_state.json'
+MAX_BATCH_DELAY = 10.0  # apply at least this often while edits keep coming
+HEALTHY_UPTIME = 300.0  # a child up this long restarts without its old backoff
+MAX_BACKOFF = 60.0
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except ValueError:
+        return default
+
+
+def _debounce_secs() -> float:
+    return max(0.0, _env_float('WATCH_DEBOUNCE_MS', 750) / 1000.0)
+
+
+def _poll_secs() -> float:
+    return max(0.2, _env_float('WATCH_POLL_SECS', 2))
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def state_path(outdir: str) -> str:
+    return os.path.join(outdir, WATCH_STATE_NAME)
+
+
+def read_state(outdir: str) -> Dict:
+    try:
+        with open(state_path(outdir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def write_state(outdir: str, state: Dict) -> None:
+    p = state_path(outdir)
+    try:
+        os.makedirs(outdir, exist_ok=True)
+        with open(p + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(p + '.tmp', p)
+    except Exception:
+        pass
+
+
+def _walk_dirs(root: str) -> Iterable[str]:
+    # Same pruning as indexing (skip dirs, exclude globs, .gitignore), so
+    # ignored build output doesn't get watches or trigger rescans.
+    return RepoWalker(root, prune=SKIP_DIRS | PRUNE_DIRS, skip_dir=_skip_dir,
+                      excludes=_load_exclude_patterns([root])).dirs()
+
+
+# ---------------- polling backend ----------------
+
+class PollWatcher:
+    """Detects changes by re-stat()ing every candidate file each interval."""
+
+    backend = 'poll'
+
+    def __init__(self, roots: List[str], ignore: Optional[str] = None):
+        self.roots = roots
+        self.ignore = ignore
+        self.interval = _poll_secs()
+        self._snap = self._scan()
+
+    def _scan(self) -> Dict[str, tuple]:
+        snap: Dict[str, tuple] = {}
+        for root in self.roots:
+            for dp in _walk_dirs(root):
+                if self.ignore and (dp + os.sep).startswith(self.ignore):
+                    continue
+                try:
+                    entries = list(os.scandir(dp))
+                except OSError:
+                    continue
+                for e in entries:
+                    if not lang_from_path(e.name):
+                        continue
+                    try:
+                        if e.is_file():
+                            st = e.stat()
+                            snap[e.path] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        return snap
+
+    def poll(self, timeout: float) -> Optional[Set[str]]:
+        time.sleep(min(timeout, self.interval))
+        cur = self._scan()
+        prev, self._snap = self._snap, cur
+        changed = {p for p, v in cur.items() if prev.get(p) != v}
+        changed.update(p for p in prev if p not in cur)
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+# ---------------- inotify backend ----------------
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Recursive inotify watch (one watch descriptor per directory).
+
+    ``poll`` returns the changed paths, or ``None`` when the kernel queue
+    overflowed and the caller must fall back to a full stat-based pass.
+    Deleted/moved directories are reported as the directory path itself.
+    """
+
+    backend = 'inotify'
+
+    def __init__(self, roots: List[str], ignore: Optional[str] = None):
+        import ctypes
+        import ctypes.util
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is Linux-only')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.ignore = ignore
+        self._dirs: Dict[int, str] = {}
+        try:
+            for root in roots:
+                self._add_tree(root)
+        except Exception:
+            self.close()
+            raise
+
+    def _add(self, path: str) -> None:
+        import ctypes
+        if self.ignore and (path + os.sep).startswith(self.ignore):
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, 'inotify watch limit reached (fs.inotify.max_user_watches)')
+            return  # vanished or unreadable; ignore
+        self._dirs[wd] = path
+
+    def _add_tree(self, root: str) -> List[str]:
+        """Watch ``root`` and its subdirectories; return the files found."""
+        files: List[str] = []
+        for dp in _walk_dirs(root):
+            self._add(dp)
+            try:
+                files.extend(e.path for e in os.scandir(dp) if e.is_file() and lang_from_path(e.name))
+            except OSError:
+                pass
+        return files
+
+    def poll(self, timeout: float) -> Optional[Set[str]]:
+        changed: Set[str] = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+        while True:
+            try:
+                buf = os.read(self.fd, 256 * 1024)
+            except BlockingIOError:
+                break
+            off = 0
+            while off + _EVENT.size <= len(buf):
+                wd, mask, _cookie, ln = _EVENT.unpack_from(buf, off)
+                name = buf[off + _EVENT.size:off + _EVENT.size + ln].rstrip(b'\0')
+                off += _EVENT.size + ln
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                base = self._dirs.get(wd)
+                if base is None or not name:
+                    continue
+                path = os.path.join(base, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if _skip_dir(os.path.basename(path)):
+                        continue
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed.update(self._add_tree(path))
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        changed.add(path)
+                    continue
+                if lang_from_path(path):
+                    changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def make_watcher(roots: List[str], ignore: Optional[str] = None):
+    """WATCH_BACKEND=auto|inotify|poll (auto tries inotify, then polls)."""
+    backend = (os.getenv('WATCH_BACKEND', 'auto') or 'auto').strip().lower()
+    if backend in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(roots, ignore)
+        except Exception as e:
+            if backend == 'inotify':
+                raise
+            print(f'[watch] inotify unavailable ({e}); polling every {_poll_secs():g}s.')
+    return PollWatcher(roots, ignore)
+
+
+# ---------------- per-repo loop ----------------
+
+def _expand(paths: Set[str], manifest_files: Iterable[str]) -> Set[str]:
+    """Replace directory paths (deleted or moved away) by the indexed files under them."""
+    out: Set[str] = set()
+    dirs: List[str] = []
+    for p in paths:
+        if os.path.isfile(p) or (not os.path.exists(p) and lang_from_path(p)):
+            out.add(p)
+        else:
+            dirs.append(p.rstrip(os.sep) + os.sep)
+    if dirs:
+        out.update(fp for fp in manifest_files if any(fp.startswith(d) for d in dirs))
+    return out
+
+
+def watch_repo(repo: str) -> None:
+    """Watch one repo and keep its index current. Must run with REPO=<repo>."""
+    os.environ['REPO'] = repo
+    # Keep each file's last syntax tree so a save re-parses only the edited
+    # region (small batches are chunked in this process).
+    os.environ.setdefault('TREE_CACHE_FILES', '256')
+    # A new index is sharded so a batch rebuilds only the BM25 shards it
+    # touches; an existing one keeps its recorded layout (see bm25_shards).
+    if not (os.getenv('INDEX_SHARDS', '') or '').strip() and load_manifest(out_dir(repo)) is None:
+        os.environ['INDEX_SHARDS'] = 'dir'
+    from indexer import index_repo  # binds REPO / OUTDIR / COLLECTION
+
+    roots = get_repo_paths(repo)
+    outdir = out_dir(repo)
+    watcher = make_watcher(roots, ignore=os.path.dirname(outdir) + os.sep)
+    debounce = _debounce_secs()
+    state = {'repo': repo, 'pid': os.getpid(), 'backend': watcher.backend, 'started': _now(),
+             'pending_files': 0, 'indexing': False, 'runs': 0, 'last_event': None,
+             'last_applied': None, 'last_error': None}
+    print(f'[watch] {repo}: watching {len(roots)} path(s) via {watcher.backend} (debounce {debounce * 1000:.0f}ms).')
+
+    def run(paths: Optional[List[str]]) -> None:
+        state.update(indexing=True)
+        write_state(outdir, state)
+        t0 = time.time()
+        try:
+            index_repo.main(paths)
+            state.update(last_error=None)
+        except Exception as e:
+            state.update(last_error=f'{type(e).__name__}: {e}')
+            print(f'[watch] {repo}: indexing failed: {e}')
+        state.update(indexing=False, runs=state['runs'] + 1, last_applied=_now(),
+                     last_duration_s=round(time.time() - t0, 3))
+
+    # Catch up on anything that changed while nobody was watching.
+    run(None)
+    pending: Set[str] = set()
+    rescan = False
+    first = last = 0.0
+    state.update(pending_files=0)
+    write_state(outdir, state)
+    try:
+        while True:
+            got = watcher.poll(debounce if (pending or rescan) else 1.0)
+            now = time.time()
+            if got is None:
+                rescan = True
+                last = now
+                first = first or now
+            elif got:
+                pending |= got
+                last = now
+                first = first or now
+                state.update(pending_files=len(pending), last_event=_now())
+                write_state(outdir, state)
+            if not (pending or rescan):
+                continue
+            if now - last < debounce and now - first < MAX_BATCH_DELAY:
+                continue
+            batch, pending = pending, set()
+            first = last = 0.0
+            if rescan:
+                rescan = False
+                print(f'[watch] {repo}: event queue overflowed; full incremental pass.')
+                run(None)
+            else:
+                files = (load_manifest(outdir) or {}).get('files', {})
+                paths = sorted(_expand(batch, files))
+                print(f'[watch] {repo}: {len(paths)} changed file(s).')
+                if paths:
+                    run(paths)
+            state.update(pending_files=len(pending))
+            write_state(outdir, state)
+    finally:
+        watcher.close()
+
+
+# ---------------- supervisor ----------------
+
+def _restart_delay(prev: Optional[float], uptime: float) -> float:
+    """Pause before restarting a child that exited after ``uptime`` seconds:
+    doubles on every quick crash, starts over after a healthy run."""
+    if prev is None or uptime >= HEALTHY_UPTIME:
+        prev = 1.0
+    return min(MAX_BACKOFF, prev * 2)
+
+
+def _supervise(repos: List[str]) -> int:
+    """One child process per repo; restart a child that dies, after a pause."""
+    procs: Dict[str, subprocess.Popen] = {}
+    backoff: Dict[str, float] = {}
+    restart_at: Dict[str, float] = {}
+    started: Dict[str, float] = {}
+
+    def spawn(name: str) -> None:
+        env = dict(os.environ, REPO=name, PYTHONUNBUFFERED='1')
+        procs[name] = subprocess.Popen([sys.executable, '-m', 'indexer.watch', '--repo', name], env=env)
+        started[name] = time.time()
+
+    for name in repos:
+        spawn(name)
+    try:
+        while True:
+            time.sleep(1.0)
+            now = time.time()
+            for name, p in list(procs.items()):
+                if name in restart_at:
+                    if now >= restart_at[name]:
+                        del restart_at[name]
+                        spawn(name)
+                    continue
+                rc = p.poll()
+                if rc is None:
+                    continue
+                wait = _restart_delay(backoff.get(name), now - started[name])
+                backoff[name] = wait
+                restart_at[name] = now + wait
+                print(f'[watch] {name}: exited with {rc}; restarting in {wait:.0f}s.')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs.values():
+            if p.poll() is None:
+                p.terminate()
+        for p in procs.values():
+            try:
+                p.wait(timeout=10)
+            except Exception:
+                p.kill()
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description='Watch repos and keep their indexes current.')
+    ap.add_argument('--repo', action='append', help='repo name from repos.json (repeatable; default: all)')
+    args = ap.parse_args()
+    repos = args.repo or list_repos()
+    if not repos:
+        print('[watch] no repos configured in repos.json')
+        return 1
+    if len(repos) == 1:
+        try:
+            watch_repo(repos[0])
+        except KeyboardInterrupt:
+            pass
+        return 0
+    return _supervise(repos)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
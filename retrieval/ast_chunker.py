@@ -1,7 +1,13 @@
 import os
 import re
 import hashlib
-from typing import Dict, List, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from common.filtering import PRUNE_DIRS, _should_index_file
+from common.tokens import chunk_token_budget, count_tokens
+from common.walker import RepoWalker
 
 try:
     from tree_sitter_languages import get_parser as _ts_get_parser  # type: ignore
@@ -18,6 +24,7 @@ LANG_MAP = {
 }
 
 OVERLAP_LINES = 20
+MODULE_MIN_CHARS = 80  # hierarchy mode: smallest top-level remainder worth a chunk
 
 FUNC_NODES = {
     "python": {"function_definition", "class_definition"},
@@ -42,6 +49,17 @@ IMPORT_NODES = {
     "bash": {"command"},  # bash uses 'source' or '.' for imports
 }
 
+# Comment / decorator lines that belong to the definition below them.
+_LEAD_IN = {
+    "python": ("@", "#"), "bash": ("#",), "rust": ("//", "/*", "*", "#["),
+}
+_LEAD_IN_DEFAULT = ("//", "/*", "*", "@")
+
+def hierarchy_enabled()->bool:
+    """CHUNK_HIERARCHY=1: only leaf definitions are chunked (no overlap);
+    enclosing classes/impls become ``parent`` records the leaves point at."""
+    return (os.getenv("CHUNK_HIERARCHY", "0") or "0").strip() == "1"
+
 def lang_from_path(path:str)->Optional[str]:
     _, ext = os.path.splitext(path)
     return LANG_MAP.get(ext.lower())
@@ -49,66 +67,204 @@ def lang_from_path(path:str)->Optional[str]:
 def nonws_len(s:str)->int:
     return len(re.sub(r"\s+", "", s))
 
+# One parser per language per thread (tree-sitter parsers are not
+# thread-safe); pool workers are processes, so each keeps its own.
+_TLS = threading.local()
+
+def _parser(lang:str):
+    if _ts_get_parser is None:
+        raise RuntimeError("tree_sitter_languages not available")
+    cache = getattr(_TLS, "parsers", None)
+    if cache is None:
+        cache = _TLS.parsers = {}
+    p = cache.get(lang)
+    if p is None:
+        p = cache[lang] = _ts_get_parser(lang)
+    return p
+
+# Last tree per file for incremental re-parsing (TREE_CACHE_FILES files, LRU;
+# 0 = off). Only useful in long-lived processes such as the watcher.
+_TREES: "OrderedDict[str, Tuple[str, bytes, object]]" = OrderedDict()
+_TREES_LOCK = threading.Lock()
+PARSE_STATS = {"cold": 0, "incremental": 0, "unchanged": 0}
+
+def tree_cache_size()->int:
+    try:
+        return max(0, int(os.getenv("TREE_CACHE_FILES", "0") or 0))
+    except ValueError:
+        return 0
+
+def _common_prefix(a:bytes, b:bytes)->int:
+    ma, mb = memoryview(a), memoryview(b)
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if ma[:mid] == mb[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _common_suffix(a:bytes, b:bytes, limit:int)->int:
+    ma, mb = memoryview(a), memoryview(b)
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if ma[len(a)-mid:] == mb[len(b)-mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _point_at(data:bytes, offset:int)->Tuple[int, int]:
+    return (data.count(b"\n", 0, offset), offset - (data.rfind(b"\n", 0, offset) + 1))
+
+def _parse(fpath:str, lang:str, data:bytes):
+    """Parse ``data``. With TREE_CACHE_FILES the file's previous tree is
+    edited to the new text (one edit spanning everything between the common
+    prefix and suffix) and handed to tree-sitter, which re-parses only the
+    changed region and reuses the rest of the tree."""
+    parser = _parser(lang)
+    size = tree_cache_size()
+    if not size:
+        PARSE_STATS["cold"] += 1
+        return parser.parse(data)
+    with _TREES_LOCK:
+        prev = _TREES.pop(fpath, None)
+    if prev is not None and prev[0] == lang and prev[1] == data:
+        PARSE_STATS["unchanged"] += 1
+        tree = prev[2]
+    elif prev is not None and prev[0] == lang:
+        old, tree = prev[1], prev[2]
+        start = _common_prefix(old, data)
+        tail = _common_suffix(old, data, min(len(old), len(data)) - start)
+        old_end, new_end = len(old) - tail, len(data) - tail
+        tree.edit(start_byte=start, old_end_byte=old_end, new_end_byte=new_end,
+                  start_point=_point_at(old, start), old_end_point=_point_at(old, old_end),
+                  new_end_point=_point_at(data, new_end))
+        tree = parser.parse(data, tree)
+        if tree.root_node.has_error:
+            # Error recovery may differ from a fresh parse; keep output stable.
+            tree = parser.parse(data)
+            PARSE_STATS["cold"] += 1
+        else:
+            PARSE_STATS["incremental"] += 1
+    else:
+        tree = parser.parse(data)
+        PARSE_STATS["cold"] += 1
+    with _TREES_LOCK:
+        _TREES[fpath] = (lang, data, tree)
+        while len(_TREES) > size:
+            _TREES.popitem(last=False)
+    return tree
+
+def _scan(tree, data:bytes, lang:str):
+    """One walk over the tree of ``data``: the chunkable nodes (in the
+    chunker's historical stack order, which chunk ids depend on) and the
+    import statements as ``(line, text)`` in document order."""
+    wanted = FUNC_NODES.get(lang, set())
+    import_types = IMPORT_NODES.get(lang, set())
+    nodes, imports = [], []
+    stack = [tree.root_node]
+    while stack:
+        n = stack.pop()
+        t = n.type
+        if t in wanted:
+            nodes.append(n)
+        if t in import_types:
+            imports.append((n.start_byte, -n.end_byte, n.start_point[0],
+                            data[n.start_byte:n.end_byte].decode("utf-8", "ignore")))
+        stack.extend(n.children)
+    imports.sort()
+    return nodes, [(row, text) for _b, _e, row, text in imports]
+
+def _regex_imports(src:str, lang:str)->List[str]:
+    if lang == "python":
+        return re.findall(r"^(?:from\s+[^\n]+|import\s+[^\n]+)$", src, flags=re.M)
+    if lang in {"javascript","typescript"}:
+        return re.findall(r"^import\s+[^\n]+;$", src, flags=re.M)
+    return []
+
 def extract_imports(src:str, lang:str)->List[str]:
     try:
-        if _ts_get_parser is None:
-            raise RuntimeError("tree_sitter_languages not available")
-        parser = _ts_get_parser(lang)
-        tree = parser.parse(bytes(src, "utf-8"))
-        imports = []
-        def walk(n):
-            if n.type in IMPORT_NODES.get(lang, set()):
-                imports.append(src[n.start_byte:n.end_byte])
-            for c in n.children:
-                walk(c)
-        walk(tree.root_node)
-        return imports
+        data = bytes(src, "utf-8")
+        return [text for _row, text in _scan(_parser(lang).parse(data), data, lang)[1]]
     except Exception:
-        if lang == "python":
-            return re.findall(r"^(?:from\s+[^\n]+|import\s+[^\n]+)$", src, flags=re.M)
-        if lang in {"javascript","typescript"}:
-            return re.findall(r"^import\s+[^\n]+;$", src, flags=re.M)
-        return []
+        return _regex_imports(src, lang)
+
+def _imports_between(imports:List[Tuple[int, str]], first:int, last:int)->List[str]:
+    """Texts of the parsed imports starting on lines ``first..last`` (0-based)."""
+    return [text for row, text in imports if first <= row <= last]
 
-def greedy_fallback(src:str, fpath:str, lang:str, target:int)->List[Dict]:
+def greedy_fallback(src:str, fpath:str, lang:str, target:int,
+                    imports:Optional[List[Tuple[int, str]]]=None, line0:int=0, size=nonws_len)->List[Dict]:
+    """Size-based chunks of about ``target`` as measured by ``size``.
+    ``imports`` are the file's parsed imports (with ``src`` starting on
+    0-based line ``line0`` of the file); without them ``src`` is parsed once
+    on its own."""
     sep = r"(?:\nclass\s+|\ndef\s+)" if lang=="python" else r"(?:\nclass\s+|\nfunction\s+)"
+    if imports is None:
+        try:
+            data = bytes(src, "utf-8")
+            imports = _scan(_parser(lang).parse(data), data, lang)[1]
+            line0 = 0
+        except Exception:
+            imports = None
     parts = re.split(sep, src)
     if len(parts) < 2:
         out, cur, acc = [], [], 0
         for line in src.splitlines(True):
             cur.append(line)
-            acc += nonws_len(line)
+            acc += size(line)
             if acc >= target:
                 out.append("".join(cur))
                 cur, acc = [], 0
         if cur:
             out.append("".join(cur))
+        if imports is None:
+            src_imports = _regex_imports(src, lang)
+        else:
+            src_imports = _imports_between(imports, line0, line0 + src.count("\n"))
         return [{
             "id": hashlib.md5((fpath+str(i)+s[:80]).encode()).hexdigest()[:12],
             "file_path": fpath, "language": lang, "type":"blob","name":None,
-            "start_line": 1, "end_line": s.count("\n")+1, "imports": extract_imports(src, lang), "code": s
+            "start_line": 1, "end_line": s.count("\n")+1, "imports": list(src_imports), "code": s
         } for i,s in enumerate(out)]
     else:
+        # Line span of every part in src (re.split drops the separators).
+        spans, pos = [], 0
+        for m in re.finditer(sep, src):
+            spans.append((pos, m.start()))
+            pos = m.end()
+        spans.append((pos, len(src)))
         rejoined, buf, acc = [], [], 0
-        for p in parts:
-            if acc + nonws_len(p) > target and buf:
-                s = "".join(buf)
-                rejoined.append(s)
+        for p, span in zip(parts, spans):
+            if acc + size(p) > target and buf:
+                rejoined.append(("".join(x for x, _ in buf), buf[0][1][0], buf[-1][1][1]))
                 buf, acc = [], 0
-            buf.append(p)
-            acc += nonws_len(p)
+            buf.append((p, span))
+            acc += size(p)
         if buf:
-            rejoined.append("".join(buf))
-        return [{
-            "id": hashlib.md5((fpath+str(i)+s[:80]).encode()).hexdigest()[:12],
-            "file_path": fpath, "language": lang, "type":"section","name":None,
-            "start_line": 1, "end_line": s.count("\n")+1, "imports": extract_imports(s, lang), "code": s
-        } for i,s in enumerate(rejoined)]
+            rejoined.append(("".join(x for x, _ in buf), buf[0][1][0], buf[-1][1][1]))
+        out = []
+        for i, (s, a, b) in enumerate(rejoined):
+            if imports is None:
+                sec_imports = _regex_imports(s, lang)
+            else:
+                sec_imports = _imports_between(imports, line0 + src.count("\n", 0, a), line0 + src.count("\n", 0, b))
+            out.append({
+                "id": hashlib.md5((fpath+str(i)+s[:80]).encode()).hexdigest()[:12],
+                "file_path": fpath, "language": lang, "type":"section","name":None,
+                "start_line": 1, "end_line": s.count("\n")+1, "imports": sec_imports, "code": s
+            })
+        return out
 
-def collect_files(roots:List[str])->List[str]:
-    import fnmatch
-    out=[]
-    skip_dirs = {".git","node_modules",".venv","venv","dist","build","__pycache__",".next",".turbo",".parcel-cache",".pytest_cache","vendor","third_party",".bundle","Pods"}
+SKIP_DIRS = {".git","node_modules",".venv","venv","dist","build","__pycache__",".next",".turbo",".parcel-cache",".pytest_cache","vendor","third_party",".bundle","Pods"}
+
+def _skip_dir(d:str)->bool:
+    return d in SKIP_DIRS or d.startswith('.venv') or d.startswith('venv')
+
+def _load_exclude_patterns(roots:List[str])->List[str]:
     exclude_patterns = []
     for root in roots:
         parent_dir = os.path.dirname(root) if os.path.isfile(root) else root
@@ -120,18 +276,42 @@ def collect_files(roots:List[str])->List[str]:
                     exclude_patterns.extend(patterns)
             except Exception:
                 pass
+    return exclude_patterns
+
+def _walker(root:str, exclude_patterns:List[str], abs_excludes:Optional[List[str]]=None)->RepoWalker:
+    # Directory pruning and filename filters happen inside the walker; no
+    # os.walk / Path.rglob patching needed.
+    return RepoWalker(
+        root, prune=SKIP_DIRS | PRUNE_DIRS, skip_dir=_skip_dir,
+        excludes=exclude_patterns, abs_excludes=abs_excludes or (),
+        file_ok=lambda name: bool(lang_from_path(name)) and _should_index_file(name),
+    )
+
+def collect_files(roots:List[str], abs_excludes:Optional[List[str]]=None)->List[str]:
+    """Indexable files under ``roots``: pruned dirs, each root's
+    data/exclude_globs.txt, ``abs_excludes`` (matched on the absolute path)
+    and .gitignore files are applied while walking."""
+    out=[]
+    exclude_patterns = _load_exclude_patterns(roots)
     for root in roots:
-        for dp, dns, fns in os.walk(root):
-            dns[:] = [d for d in dns if d not in skip_dirs and not d.startswith('.venv') and not d.startswith('venv')]
-            for fn in fns:
-                p = os.path.join(dp, fn)
-                skip = False
-                for pattern in exclude_patterns:
-                    if fnmatch.fnmatch(p, pattern) or fnmatch.fnmatch(os.path.relpath(p, root), pattern):
-                        skip = True
-                        break
-                if not skip and lang_from_path(p):
-                    out.append(p)
+        out.extend(_walker(root, exclude_patterns, abs_excludes).walk())
+    return out
+
+def filter_collectable(roots:List[str], paths, abs_excludes:Optional[List[str]]=None)->List[str]:
+    """Subset of ``paths`` (existing files) that ``collect_files(roots)`` would
+    return, without walking the trees. Used for git-diff driven indexing."""
+    out=[]
+    exclude_patterns = _load_exclude_patterns(roots)
+    walkers = [_walker(root, exclude_patterns, abs_excludes) for root in roots]
+    for p in paths:
+        if not lang_from_path(p) or not os.path.isfile(p):
+            continue
+        for w in walkers:
+            if os.path.relpath(p, w.root).startswith('..'):
+                continue
+            if not w.ignored(p):
+                out.append(p)
+            break
     return out
 
 def _guess_name(lang:str, text:str)->Optional[str]:
@@ -143,28 +323,170 @@ def _guess_name(lang:str, text:str)->Optional[str]:
         return m.group(1) if m else None
     return None
 
-def chunk_code(src:str, fpath:str, lang:str, target:int=900)->List[Dict]:
+def _lead_in(lines:List[str], row:int, lang:str, floor:int)->int:
+    """First row of the comments/decorators directly above ``row`` (at most
+    OVERLAP_LINES of them, never above ``floor``)."""
+    pre = _LEAD_IN.get(lang, _LEAD_IN_DEFAULT)
+    stop = max(floor, row - OVERLAP_LINES)
+    while row > stop and lines[row-1].lstrip().startswith(pre):
+        row -= 1
+    return row
+
+def _skeleton(lines:List[str], first:int, last:int, spans:List[Tuple[int, int]])->str:
+    """Lines ``first..last`` with every child span cut down to its first line."""
+    out, row = [], first
+    for s, e in sorted(spans):
+        out.extend(lines[row:s+1])
+        if e > max(s, row - 1):
+            body = lines[s+1] if s + 1 < len(lines) else ""
+            out.append(body[:len(body) - len(body.lstrip())] + "...")
+        row = max(row, e + 1)
+    out.extend(lines[row:last+1])
+    return "\n".join(out)
+
+def _chunk_tree(src:str, data:bytes, fpath:str, lang:str, target:int, nodes, imports, size=nonws_len)->List[Dict]:
+    """Hierarchical chunks without overlap. A definition that fits in
+    ``target`` is one leaf ``unit`` (nested definitions included, with its
+    leading comments/decorators). A larger one that contains definitions
+    becomes a ``parent`` record holding its full text (stored, not indexed)
+    plus one ``unit`` for its own lines with the children cut down to their
+    signatures; the children are chunked the same way. Every chunk below a
+    parent carries its ``parent_id``. The file's own top-level lines
+    (constants, tables, module code) get the same signatures-only ``unit``
+    when there are at least MODULE_MIN_CHARS of them."""
+    order = sorted(range(len(nodes)), key=lambda i: (nodes[i].start_byte, -nodes[i].end_byte))
+    parent: List[Optional[int]] = [None] * len(nodes)
+    stack: List[int] = []
+    for i in order:
+        while stack and nodes[stack[-1]].end_byte < nodes[i].end_byte:
+            stack.pop()
+        parent[i] = stack[-1] if stack else None
+        stack.append(i)
+    texts = [data[n.start_byte:n.end_byte].decode("utf-8", "ignore") for n in nodes]
+    children: Dict[int, List[int]] = {}
+    for i, p in enumerate(parent):
+        if p is not None:
+            children.setdefault(p, []).append(i)
+    kids: Dict[int, List[int]] = {}  # parent node -> its child nodes
+    inside = set()  # nested in a leaf: part of its text, not chunked
+    for i in order:  # outer nodes first
+        p = parent[i]
+        if p is not None and p not in kids:
+            inside.add(i)
+        elif i in children and size(texts[i]) > target:
+            kids[i] = children[i]
+    pids = {i: hashlib.md5((fpath+f"#p{i}"+texts[i][:80]).encode()).hexdigest()[:12] for i in kids}
+    file_imports = [text for _row, text in imports]
+    lines = src.split("\n")
+    chunks: List[Dict] = []
+
+    def emit(key:str, seed:str, name, first:int, last:int, code:str, parent_id):
+        if size(code) > target:
+            for j, sub in enumerate(greedy_fallback(code, fpath, lang, target, imports=imports, line0=first,
+                                                    size=size)):
+                sub["id"] = hashlib.md5((fpath+f"/{key}:{j}"+sub["code"][:80]).encode()).hexdigest()[:12]
+                sub["start_line"] = first + 1
+                sub["end_line"] = sub["start_line"] + sub["code"].count("\n")
+                sub["parent_id"] = parent_id
+                chunks.append(sub)
+            return
+        chunks.append({
+            "id": hashlib.md5((fpath+key+seed[:80]).encode()).hexdigest()[:12],
+            "file_path": fpath, "language": lang, "type": "unit", "name": name,
+            "start_line": first + 1, "end_line": last + 1,
+            "imports": list(file_imports), "parent_id": parent_id, "code": code,
+        })
+
+    for i, n in enumerate(nodes):
+        if i in inside:
+            continue
+        s, e = n.start_point[0], n.end_point[0]
+        up = parent[i]
+        first = _lead_in(lines, s, lang, nodes[up].start_point[0] + 1 if up is not None else 0)
+        name = _guess_name(lang, texts[i])
+        if i not in kids:
+            emit(str(i), texts[i], name, first, e, "\n".join(lines[first:e+1]), pids.get(up))
+            continue
+        chunks.append({
+            "id": pids[i], "file_path": fpath, "language": lang, "type": "parent", "name": name,
+            "start_line": first + 1, "end_line": e + 1, "imports": [], "parent_id": pids.get(up),
+            "code": "\n".join(lines[first:e+1]),
+        })
+        spans = [(nodes[k].start_point[0], nodes[k].end_point[0]) for k in kids[i]]
+        emit(f"/s{i}", texts[i], name, first, e, _skeleton(lines, first, e, spans), pids[i])
+    spans = [(n.start_point[0], n.end_point[0]) for i, n in enumerate(nodes) if parent[i] is None]
+    covered = set()
+    for s, e in spans:
+        covered.update(range(s, e + 1))
+    if sum(nonws_len(x) for r, x in enumerate(lines) if r not in covered) >= MODULE_MIN_CHARS:
+        emit("/m", src, None, 0, len(lines) - 1, _skeleton(lines, 0, len(lines) - 1, spans), None)
+    return chunks
+
+def _split_to_budget(c:Dict, budget:int)->List[Dict]:
+    """Line-wise pieces of a chunk over the token budget (a greedy section can
+    hold a single definition larger than the budget)."""
+    groups, buf, acc, first = [], [], 0, 0
+    for r, line in enumerate(c["code"].split("\n")):
+        n = count_tokens(line) + 1
+        if buf and acc + n > budget:
+            groups.append((first, buf))
+            buf, acc, first = [], 0, r
+        buf.append(line)
+        acc += n
+    if buf:
+        groups.append((first, buf))
+    out = []
+    for k, (r, buf) in enumerate(groups):
+        code = "\n".join(buf)
+        out.append(dict(c, id=hashlib.md5((str(c["id"])+f":{k}"+code[:80]).encode()).hexdigest()[:12],
+                        start_line=c["start_line"] + r, end_line=c["start_line"] + r + len(buf) - 1, code=code))
+    return out
+
+def chunk_code(src:str, fpath:str, lang:str, target:int=900, hierarchy:Optional[bool]=None,
+               tokens:Optional[int]=None)->List[Dict]:
+    """Chunk one file: a single parse and a single tree walk yield both the
+    function/class nodes and the file's imports. ``hierarchy`` (default:
+    CHUNK_HIERARCHY) switches to leaf/parent chunks, see ``_chunk_tree``.
+    With TREE_CACHE_FILES the parse is incremental against the file's last
+    version, see ``_parse``.
+
+    Chunks are sized to ``tokens`` (default: the embedding model's budget,
+    see ``chunk_token_budget``); with 0, to ``target`` non-whitespace
+    characters. Every chunk gets its ``token_count``."""
+    budget = chunk_token_budget() if tokens is None else tokens
+    if budget > 0:
+        out = []
+        for c in _chunk_code(src, fpath, lang, budget, hierarchy, count_tokens, True):
+            if c["type"] != "parent" and count_tokens(c["code"]) > budget:
+                out.extend(_split_to_budget(c, budget))
+            else:
+                out.append(c)
+    else:
+        out = _chunk_code(src, fpath, lang, target, hierarchy, nonws_len, False)
+    for c in out:
+        c["token_count"] = count_tokens(c["code"])
+    return out
+
+def _chunk_code(src:str, fpath:str, lang:str, target:int, hierarchy:Optional[bool], size, fit_overlap:bool)->List[Dict]:
+    try:
+        data = bytes(src, "utf-8")
+        nodes, imports = _scan(_parse(fpath, lang, data), data, lang)
+    except Exception:
+        return greedy_fallback(src, fpath, lang, target, size=size)
     try:
-        if _ts_get_parser is None:
-            raise RuntimeError("tree_sitter_languages not available")
-        parser = _ts_get_parser(lang)
-        tree = parser.parse(bytes(src, "utf-8"))
-        wanted = FUNC_NODES.get(lang, set())
-        nodes = []
-        stack = [tree.root_node]
-        while stack:
-            n = stack.pop()
-            if n.type in wanted:
-                nodes.append(n)
-            stack.extend(n.children)
         if not nodes:
-            return greedy_fallback(src, fpath, lang, target)
+            return greedy_fallback(src, fpath, lang, target, imports=imports, size=size)
+        if hierarchy if hierarchy is not None else hierarchy_enabled():
+            return _chunk_tree(src, data, fpath, lang, target, nodes, imports, size)
+        file_imports = [text for _row, text in imports]
         chunks: List[Dict] = []
         all_lines = src.splitlines()
         for i, n in enumerate(nodes):
             text = src[n.start_byte:n.end_byte]
-            if nonws_len(text) > target:
-                for j, sub in enumerate(greedy_fallback(text, fpath, lang, target)):
+            n_size = size(text)
+            if n_size > target:
+                for j, sub in enumerate(greedy_fallback(text, fpath, lang, target, imports=imports,
+                                                        line0=n.start_point[0], size=size)):
                     sub["id"] = hashlib.md5((fpath+f"/{i}:{j}"+sub["code"][:80]).encode()).hexdigest()[:12]
                     sub["start_line"] = n.start_point[0]+1
                     sub["end_line"] = sub["start_line"] + sub["code"].count("\n")
@@ -174,6 +496,13 @@ def chunk_code(src:str, fpath:str, lang:str, target:int=900)->List[Dict]:
                 start_line = n.start_point[0] + 1
                 end_line = n.end_point[0] + 1
                 actual_start = max(1, start_line - OVERLAP_LINES) if OVERLAP_LINES > 0 else start_line
+                if fit_overlap:
+                    # Token budgets are hard limits: drop overlap lines that don't fit.
+                    room = target - n_size
+                    lead = [size(x) + 1 for x in all_lines[actual_start-1:start_line-1]]
+                    while lead and sum(lead) > room:
+                        lead.pop(0)
+                        actual_start += 1
                 chunk_text = "\n".join(all_lines[actual_start-1:end_line])
                 chunks.append({
                     "id": hashlib.md5((fpath+str(i)+text[:80]).encode()).hexdigest()[:12],
@@ -183,10 +512,9 @@ def chunk_code(src:str, fpath:str, lang:str, target:int=900)->List[Dict]:
                     "name": name,
                     "start_line": actual_start,
                     "end_line": end_line,
-                    "imports": extract_imports(src, lang),
+                    "imports": list(file_imports),
                     "code": chunk_text,
                 })
         return chunks
     except Exception:
-        return greedy_fallback(src, fpath, lang, target)
-
+        return greedy_fallback(src, fpath, lang, target, imports=imports, size=size)
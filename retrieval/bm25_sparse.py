@@ -0,0 +1,55 @@
+"""BM25 as Qdrant sparse vectors (QDRANT_SPARSE=1).
+
+Documents are tokenized exactly like the bm25s index (English stemmer +
+stopwords) and each term is mapped to a stable sparse index with crc32, so no
+vocabulary has to be shared between the indexer and API workers. Document
+values carry the BM25 term-frequency part,
+
+    tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+
+and the collection's sparse vector uses ``Modifier.IDF``, so Qdrant supplies
+the IDF factor at query time and the dot product with a query of term counts
+is the Lucene BM25 score. ``avgdl`` is taken from the last BM25 build;
+incremental runs reuse it for new points until the next full rebuild.
+"""
+
+from __future__ import annotations
+
+import zlib
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+from bm25s.tokenization import Tokenizer  # type: ignore
+from Stemmer import Stemmer  # type: ignore
+
+SPARSE_NAME = 'bm25'
+K1 = 1.2   # same parameters as the bm25s index
+B = 0.65
+
+
+def _tokenize(texts: List[str]) -> List[List[str]]:
+    tok = Tokenizer(stemmer=Stemmer('english'), stopwords='en')
+    return tok.tokenize(texts, return_as='string', show_progress=False)
+
+
+def _term_counts(tokens: Iterable[str]) -> Counter:
+    # Hash collisions simply merge two terms' counts.
+    return Counter(zlib.crc32(t.encode('utf-8')) for t in tokens)
+
+
+def doc_vectors(texts: List[str], avgdl: float) -> List[Tuple[List[int], List[float]]]:
+    """``(indices, values)`` per document."""
+    avgdl = avgdl or 1.0
+    out = []
+    for tokens in _tokenize(texts):
+        counts = _term_counts(tokens)
+        norm = K1 * (1 - B + B * len(tokens) / avgdl)
+        idx = sorted(counts)
+        out.append((idx, [counts[i] * (K1 + 1) / (counts[i] + norm) for i in idx]))
+    return out
+
+
+def query_vector(query: str) -> Tuple[List[int], List[float]]:
+    counts = _term_counts(_tokenize([query])[0])
+    idx = sorted(counts)
+    return idx, [float(counts[i]) for i in idx]
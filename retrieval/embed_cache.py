@@ -1,17 +1,21 @@
 import os, json
+import numpy as np
 import tiktoken
 
+from retrieval.embed_scheduler import clip_tokens, embed_texts_scheduled, openai_embed_call
+
 class EmbeddingCache:
     def __init__(self, outdir: str):
         os.makedirs(outdir, exist_ok=True)
         self.path = os.path.join(outdir, "embed_cache.jsonl")
         self.cache = {}
+        self._unsaved = []  # hashes added since the last save/flush
         if os.path.exists(self.path):
             with open(self.path, "r", encoding="utf-8") as f:
                 for line in f:
                     try:
                         o = json.loads(line)
-                        self.cache[o["hash"]] = o["vec"]
+                        self.cache[o["hash"]] = np.asarray(o["vec"], dtype=np.float32)
                     except Exception:
                         pass
 
@@ -19,12 +23,27 @@ class EmbeddingCache:
         return self.cache.get(h)
 
     def put(self, h: str, v):
+        if h not in self.cache:
+            self._unsaved.append(h)
         self.cache[h] = v
 
     def save(self):
         with open(self.path, "w", encoding="utf-8") as f:
             for h, v in self.cache.items():
-                f.write(json.dumps({"hash": h, "vec": v}) + "\n")
+                f.write(json.dumps({"hash": h, "vec": np.asarray(v, dtype=np.float32).tolist()}) + "\n")
+        self._unsaved = []
+
+    def flush(self):
+        """Append entries added since the last save/flush (cheap checkpoint;
+        the file is only rewritten by save())."""
+        if not self._unsaved:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for h in self._unsaved:
+                v = self.cache.get(h)
+                if v is not None:
+                    f.write(json.dumps({"hash": h, "vec": np.asarray(v, dtype=np.float32).tolist()}) + "\n")
+        self._unsaved = []
 
     def prune(self, valid_hashes: set):
         before = len(self.cache)
@@ -35,31 +54,30 @@ class EmbeddingCache:
             self.save()
         return pruned
 
-    def embed_texts(self, client, texts, hashes, model="text-embedding-3-large", batch=64):
-        embs = [None] * len(texts)
-        to_embed, idx_map = [], []
+    def embed_texts(self, client, texts, hashes, model="text-embedding-3-large", batch=64, counts=None):
+        """Return an ``(len(texts), dim)`` float32 matrix, embedding only cache misses.
+        ``counts`` are known token counts of the texts (None where unknown)."""
+        hits, to_embed, idx_map = {}, [], []
         for i, (t, h) in enumerate(zip(texts, hashes)):
             v = self.get(h)
             if v is None:
                 idx_map.append(i)
                 to_embed.append(t)
             else:
-                embs[i] = v
-        enc = tiktoken.get_encoding('cl100k_base')
-
-        def _clip_for_openai(text: str, max_tokens: int = 8000) -> str:
-            toks = enc.encode(text)
-            if len(toks) <= max_tokens:
-                return text
-            return enc.decode(toks[:max_tokens])
-
-        for i in range(0, len(to_embed), batch):
-            sub = [_clip_for_openai(t) for t in to_embed[i:i + batch]]
-            r = client.embeddings.create(model=model, input=sub)
-            for j, d in enumerate(r.data):
-                orig = idx_map[i + j]
-                vec = d.embedding
-                embs[orig] = vec
-                self.put(hashes[orig], vec)
+                hits[i] = v
+        vecs = None
+        if to_embed:
+            # Batches go out concurrently under the EMBED_* rate budgets.
+            enc = tiktoken.get_encoding('cl100k_base')
+            known = [counts[i] for i in idx_map] if counts is not None else None
+            clipped, tok = clip_tokens(to_embed, enc, counts=known)
+            vecs = embed_texts_scheduled(clipped, openai_embed_call(client, model), batch=batch, costs=tok)
+        dim = vecs.shape[1] if vecs is not None else len(next(iter(hits.values()))) if hits else 0
+        embs = np.empty((len(texts), dim), dtype=np.float32)
+        for i, v in hits.items():
+            embs[i] = v
+        if vecs is not None:
+            embs[idx_map] = vecs
+            for row, orig in enumerate(idx_map):
+                self.put(hashes[orig], vecs[row])
         return embs
-
@@ -0,0 +1,222 @@
+"""Concurrent, rate-limit aware embedding scheduler.
+
+Remote embedding APIs are latency bound when batches go out one at a time.
+``embed_batches`` keeps up to EMBED_CONCURRENCY batches in flight, holds them
+to the EMBED_TPM / EMBED_RPM budgets (sliding 60s window, 0 = unlimited),
+retries 429 / 5xx / connection errors with exponential backoff (honouring
+Retry-After; every worker pauses while a 429 cools down) and returns results
+in input order as one contiguous float32 matrix.
+
+Point OPENAI_BASE_URL at ``scripts/fake_embeddings_server.py`` to exercise it
+offline.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import base64
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+WINDOW_SECS = 60.0
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)) or default)
+    except ValueError:
+        return default
+
+
+def embed_concurrency() -> int:
+    return max(1, _env_int('EMBED_CONCURRENCY', 4))
+
+
+class RateBudget:
+    """Sliding-window token/request budget shared by all workers."""
+
+    def __init__(self, tpm: int = 0, rpm: int = 0):
+        self.tpm = max(0, tpm)
+        self.rpm = max(0, rpm)
+        self._events: deque = deque()  # (time, tokens)
+        self._tokens = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'RateBudget':
+        return cls(_env_int('EMBED_TPM', 0), _env_int('EMBED_RPM', 0))
+
+    def pause(self, secs: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + secs)
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request costing ``tokens`` fits in the window."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= WINDOW_SECS:
+                    self._tokens -= self._events.popleft()[1]
+                wait = self._paused_until - now
+                if wait <= 0:
+                    fits_rpm = not self.rpm or len(self._events) < self.rpm
+                    # A single request larger than the whole budget goes out alone.
+                    fits_tpm = not self.tpm or not self._events or self._tokens + tokens <= self.tpm
+                    if fits_rpm and fits_tpm:
+                        self._events.append((now, tokens))
+                        self._tokens += tokens
+                        return
+                    wait = WINDOW_SECS - (now - self._events[0][0])
+            time.sleep(min(max(wait, 0.01), 1.0))
+
+
+def _status(e: Exception) -> Optional[int]:
+    for obj in (e, getattr(e, 'response', None)):
+        code = getattr(obj, 'status_code', None) or getattr(obj, 'http_status', None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+    try:
+        v = headers.get('retry-after-ms')
+        if v is not None:
+            return float(v) / 1000.0
+        v = headers.get('retry-after')
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(e: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying ``e``, or None if it isn't transient."""
+    status = _status(e)
+    name = type(e).__name__
+    rate_limited = status == 429 or 'RateLimit' in name
+    transient = rate_limited or (status is not None and status >= 500) \
+        or any(k in name for k in ('Timeout', 'Connection', 'ServiceUnavailable'))
+    if not transient:
+        return None
+    hinted = _retry_after(e)
+    if hinted is not None:
+        return min(hinted, 120.0)
+    return min(60.0, 0.5 * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+
+def embed_batches(
+    batches: Sequence[List[str]],
+    call: Callable[[List[str]], List],
+    costs: Optional[Sequence[int]] = None,
+    concurrency: Optional[int] = None,
+    budget: Optional[RateBudget] = None,
+    max_retries: Optional[int] = None,
+) -> List[List]:
+    """Run ``call(batch)`` for every batch with bounded concurrency.
+
+    ``costs`` are per-batch token counts for the TPM budget (default: chars/4).
+    Returns the per-batch results in input order; the first non-retryable
+    error (or one that exhausts its retries) is raised.
+    """
+    n = len(batches)
+    if n == 0:
+        return []
+    if costs is None:
+        costs = [sum(len(t) for t in b) // 4 + 1 for b in batches]
+    workers = min(n, concurrency or embed_concurrency())
+    budget = budget or RateBudget.from_env()
+    retries = _env_int('EMBED_MAX_RETRIES', 6) if max_retries is None else max_retries
+    failed = threading.Event()
+
+    def work(i: int):
+        attempt = 0
+        while True:
+            if failed.is_set():
+                return None
+            budget.acquire(costs[i])
+            try:
+                out = call(list(batches[i]))
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt >= retries:
+                    failed.set()
+                    raise
+                attempt += 1
+                if _status(e) == 429 or 'RateLimit' in type(e).__name__:
+                    budget.pause(delay)
+                time.sleep(delay)
+                continue
+            if len(out) != len(batches[i]):
+                failed.set()
+                raise RuntimeError(f'embedding batch {i}: expected {len(batches[i])} vectors, got {len(out)}')
+            return out
+
+    if workers == 1:
+        return [work(i) for i in range(n)]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(work, i) for i in range(n)]
+        try:
+            return [f.result() for f in futures]
+        except BaseException:
+            failed.set()
+            for f in futures:
+                f.cancel()
+            raise
+
+
+def embed_texts_scheduled(texts: Sequence[str], call: Callable[[List[str]], List], batch: int = 64,
+                          costs: Optional[Sequence[int]] = None, **kwargs) -> np.ndarray:
+    """Flat convenience wrapper: split ``texts`` into batches and return an
+    ``(len(texts), dim)`` float32 matrix. ``costs`` here are per-text token counts.
+    """
+    batches = [list(texts[i:i + batch]) for i in range(0, len(texts), batch)]
+    bcosts = None
+    if costs is not None:
+        bcosts = [sum(costs[i:i + batch]) for i in range(0, len(texts), batch)]
+    parts = embed_batches(batches, call, costs=bcosts, **kwargs)
+    if not parts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.concatenate([np.asarray(p, dtype=np.float32) for p in parts])
+
+
+def clip_tokens(texts: Sequence[str], enc, max_tokens: int = 8000, counts: Optional[Sequence[Optional[int]]] = None):
+    """Clip each text to ``max_tokens`` and return ``(texts, token_counts)``;
+    the counts feed the TPM budget without a second encode. ``counts`` are
+    stored chunk token counts: a text whose count is well under the limit
+    (half, leaving room for an estimated count) is not encoded again."""
+    out, tok_counts = [], []
+    for i, t in enumerate(texts):
+        known = counts[i] if counts is not None else None
+        if known is not None and known <= max_tokens // 2:
+            out.append(t)
+            tok_counts.append(int(known))
+            continue
+        toks = enc.encode(t)
+        if len(toks) > max_tokens:
+            toks = toks[:max_tokens]
+            t = enc.decode(toks)
+        out.append(t)
+        tok_counts.append(len(toks))
+    return out, tok_counts
+
+
+def openai_embed_call(client, model: str) -> Callable[[List[str]], np.ndarray]:
+    """Batch call for the OpenAI embeddings API. Vectors are requested as
+    base64 float32 and decoded straight into an array (no JSON float lists)."""
+    def call(sub: List[str]) -> np.ndarray:
+        r = client.embeddings.create(model=model, input=sub, encoding_format='base64')
+        rows = sorted(r.data, key=lambda d: d.index)
+        return np.stack([
+            np.frombuffer(base64.b64decode(d.embedding), dtype='<f4') if isinstance(d.embedding, str)
+            else np.asarray(d.embedding, dtype=np.float32)
+            for d in rows
+        ]) if rows else np.zeros((0, 0), dtype=np.float32)
+    return call
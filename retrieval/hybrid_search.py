@@ -1,9 +1,14 @@
 import os
 import json
+import math
 import collections
 from typing import List, Dict
 from pathlib import Path
+import numpy as np
+from common.blob_store import reader as blob_reader
 from common.config_loader import choose_repo_from_query, get_default_repo, out_dir
+from common.qdrant_utils import PREFIX_NAME, prefix_oversampling, quantization_search_params
+from retrieval.bm25_sparse import SPARSE_NAME, query_vector
 from dotenv import load_dotenv, find_dotenv
 
 # Load any existing env ASAP so downstream imports (e.g., rerank backend) see them
@@ -152,9 +157,6 @@ def _lazy_import_voyage():
     return voyageai.Client(api_key=os.getenv("VOYAGE_API_KEY"))
 
 
-_local_embed_model = None
-
-
 def _get_embedding(text: str, kind: str = "query") -> list[float]:
     et = (os.getenv("EMBEDDING_TYPE", "openai") or "openai").lower()
     if et == "voyage":
@@ -162,11 +164,8 @@ def _get_embedding(text: str, kind: str = "query") -> list[float]:
         out = vo.embed([text], model="voyage-code-3", input_type=kind, output_dimension=512)
         return out.embeddings[0]
     if et == "local":
-        global _local_embed_model
-        if _local_embed_model is None:
-            from sentence_transformers import SentenceTransformer
-            _local_embed_model = SentenceTransformer('BAAI/bge-small-en-v1.5')
-        return _local_embed_model.encode([text], normalize_embeddings=True, show_progress_bar=False)[0].tolist()
+        from retrieval.local_models import get_model
+        return get_model('BAAI/bge-small-en-v1.5').encode([text], normalize_embeddings=True, show_progress_bar=False)[0].tolist()
     client = _lazy_import_openai()
     resp = client.embeddings.create(input=text, model="text-embedding-3-large")
     return resp.data[0].embedding
@@ -212,6 +211,104 @@ def _load_bm25_map(idx_dir: str):
     return None
 
 
+def _query_tokens(idx_dir: str, query: str):
+    """Tokenize a query with the vocabulary saved next to a BM25 index.
+
+    Token ids must match the ids assigned at index time, so the tokenizer
+    vocab is loaded from ``idx_dir`` and never extended by the query.
+    """
+    tokenizer = Tokenizer(stemmer=Stemmer('english'), stopwords='en')
+    try:
+        tokenizer.load_vocab(idx_dir)
+        return tokenizer.tokenize([query], update_vocab=False, show_progress=False)
+    except Exception:
+        return tokenizer.tokenize([query], show_progress=False)
+
+
+_SHARD_CACHE: Dict[str, tuple] = {}
+
+
+def _load_bm25_shard(shard_dir: str):
+    """(retriever, tokenizer, chunk ids) of one BM25 shard, cached until the
+    shard directory is swapped by a rebuild."""
+    st = os.stat(shard_dir)
+    key = (st.st_ino, st.st_mtime_ns)
+    hit = _SHARD_CACHE.get(shard_dir)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    retriever = bm25s.BM25.load(shard_dir)
+    tokenizer = Tokenizer(stemmer=Stemmer('english'), stopwords='en')
+    tokenizer.load_vocab(shard_dir)
+    with open(os.path.join(shard_dir, 'chunk_ids.txt'), 'r', encoding='utf-8') as f:
+        ids = [line.strip() for line in f if line.strip()]
+    _SHARD_CACHE[shard_dir] = (key, (retriever, tokenizer, ids))
+    return retriever, tokenizer, ids
+
+
+def _idf(n: int, df: int) -> float:
+    # bm25s 'lucene' IDF
+    return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+
+def _sparse_from_shards(repo: str, query: str, k: int) -> List[tuple]:
+    """Top ``k`` (score, chunk id) over every BM25 shard (INDEX_SHARDS builds).
+
+    Each shard's index carries its own IDF, so raw scores from different
+    shards aren't comparable (a rare term in a small shard would dominate).
+    Shards are scored per query term in parallel; each term's document
+    frequency is summed over all shards and every per-term score is rescaled
+    from the shard's IDF to that corpus-wide IDF before the top ``k`` merge.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    root = os.path.join(out_dir(repo), 'bm25_shards')
+    try:
+        with open(os.path.join(root, 'shards.json'), 'r', encoding='utf-8') as f:
+            names = sorted(json.load(f).get('shards', {}))
+    except Exception:
+        return []
+
+    def term_scores(name: str):
+        # (chunk ids, {term: (per-doc scores, document frequency, repeats in query)}).
+        try:
+            retriever, tokenizer, ids = _load_bm25_shard(os.path.join(root, name))
+            if not ids:
+                return None
+            vocab = tokenizer.get_vocab_dict()
+            terms = tokenizer.tokenize([query], update_vocab=False, return_as='string', show_progress=False)[0]
+            out = {}
+            for t, reps in collections.Counter(terms).items():
+                if t not in vocab:
+                    continue
+                sc = np.asarray(retriever.get_scores_from_ids([vocab[t]]), dtype=np.float32)[:len(ids)]
+                out[t] = (sc, int(np.count_nonzero(sc)), reps)
+            return ids, out
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(names)))) as ex:
+        parts = [p for p in ex.map(term_scores, names) if p is not None]
+    n_all = sum(len(ids) for ids, _ in parts)
+    df_all: Dict[str, int] = collections.Counter()
+    for _ids, terms in parts:
+        for t, (_sc, df, _reps) in terms.items():
+            df_all[t] += df
+    hits: List[tuple] = []
+    for ids, terms in parts:
+        total = None
+        for t, (sc, df, reps) in terms.items():
+            if not df:
+                continue
+            w = reps * _idf(n_all, df_all[t]) / _idf(len(ids), df)
+            total = sc * w if total is None else total + sc * w
+        if total is None:
+            continue
+        kk = min(k, len(ids))
+        top = np.argpartition(-total, kk - 1)[:kk] if kk < len(total) else np.arange(len(total))
+        hits.extend((float(total[i]), ids[int(i)]) for i in top if total[i] > 0)
+    hits.sort(key=lambda x: x[0], reverse=True)
+    return hits[:k]
+
+
 def _load_cards_bm25(repo: str):
     idx_dir = os.path.join(out_dir(repo), 'bm25_cards')
     try:
@@ -239,64 +336,154 @@ def _load_cards_map(repo: str) -> Dict:
         return {'by_idx': {}, 'by_chunk_id': {}}
 
 
-def search(query: str, repo: str, topk_dense: int = 75, topk_sparse: int = 75, final_k: int = 10, trace: object | None = None) -> List[Dict]:
-    chunks = _load_chunks(repo)
-    if not chunks:
+def _index_meta(repo: str) -> Dict:
+    """last_index.json of ``repo`` (how its Qdrant collection was built)."""
+    try:
+        with open(os.path.join(out_dir(repo), 'last_index.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _attach_alt_locations(repo: str, docs: List[Dict]) -> None:
+    """Add ``alt_locations`` (copies collapsed at index time with NEAR_DUP=1)."""
+    p = os.path.join(out_dir(repo), 'near_dups.json')
+    if not docs or not os.path.exists(p):
+        return
+    try:
+        with open(p, 'r', encoding='utf-8') as f:
+            alts = json.load(f)
+    except Exception:
+        return
+    for d in docs:
+        locs = alts.get(str(d.get('id', '') or ''))
+        if locs:
+            d['alt_locations'] = locs
+
+
+def _search_params(meta: Dict):
+    """Rescoring params when the collection was built quantized."""
+    return quantization_search_params(meta.get('quantization') or 'none')
+
+
+def _dense_prefetch(e: list, meta: Dict, limit: int) -> models.Prefetch:
+    """Dense candidates. Collections with a Matryoshka prefix vector are
+    searched on the prefix and the oversampled hits rescored with the full
+    vector."""
+    pdim = int(meta.get('prefix_dim') or 0)
+    if pdim and len(e) > pdim:
+        p = np.asarray(e[:pdim], dtype=np.float32)
+        n = float(np.linalg.norm(p)) or 1.0
+        first = models.Prefetch(query=(p / n).tolist(), using=PREFIX_NAME,
+                                limit=int(limit * prefix_oversampling()), params=_search_params(meta))
+        return models.Prefetch(prefetch=[first], query=e, using='dense', limit=limit)
+    return models.Prefetch(query=e, using='dense', limit=limit, params=_search_params(meta))
+
+
+_PAYLOAD_FIELDS = ['file_path', 'start_line', 'end_line', 'language', 'layer', 'repo', 'hash', 'id', 'parent_id',
+                   'token_count']
+
+
+def _qdrant_fused(qc: QdrantClient, coll: str, e: list, query: str, meta: Dict, topk_dense: int, topk_sparse: int, limit: int) -> List:
+    """Dense + BM25 sparse candidates fused with RRF inside Qdrant, in one
+    round trip (collections indexed with QDRANT_SPARSE=1)."""
+    idx, vals = query_vector(query)
+    prefetch = []
+    if len(e):
+        prefetch.append(_dense_prefetch(e, meta, topk_dense))
+    if idx:
+        prefetch.append(models.Prefetch(query=models.SparseVector(indices=idx, values=vals), using=SPARSE_NAME, limit=topk_sparse))
+    if not prefetch:
         return []
+    res = qc.query_points(
+        collection_name=coll,
+        prefetch=prefetch,
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=limit,
+        with_payload=models.PayloadSelectorInclude(include=_PAYLOAD_FIELDS),
+    )
+    return [(str(p.id), dict(p.payload)) for p in getattr(res, 'points', res)]
+
+
+def search(query: str, repo: str, topk_dense: int = 75, topk_sparse: int = 75, final_k: int = 10, trace: object | None = None) -> List[Dict]:
+    index_meta = _index_meta(repo)
+    backend = (os.getenv('VECTOR_BACKEND','qdrant') or 'qdrant').lower()
     dense_pairs = []
+    sparse_pairs = []
     qc = QdrantClient(url=QDRANT_URL)
     coll = os.getenv('COLLECTION_NAME', f'code_chunks_{repo}')
     try:
         e = _get_embedding(query, kind="query")
     except Exception:
         e = []
-    try:
-        backend = (os.getenv('VECTOR_BACKEND','qdrant') or 'qdrant').lower()
-        if backend == 'faiss':
-            # Experimental FAISS backend (offline). If not present, fall back to sparse-only.
+
+    # Sparse mode: Qdrant returns the fused dense+BM25 list; the local bm25s
+    # index is only used if that query fails.
+    fused_pairs = None
+    if backend != 'faiss' and index_meta.get('sparse') == SPARSE_NAME:
+        try:
+            fused_pairs = _qdrant_fused(qc, coll, e, query, index_meta, topk_dense, topk_sparse, max(final_k, 2 * final_k))
+        except Exception:
+            fused_pairs = None
+
+    if fused_pairs is None:
+        chunks = _load_chunks(repo)
+        if not chunks:
+            return []
+        try:
+            if backend == 'faiss':
+                # Experimental FAISS backend (offline). If not present, fall back to sparse-only.
+                dense_pairs = []
+            else:
+                dp = _dense_prefetch(e, index_meta, topk_dense)
+                dres = qc.query_points(
+                    collection_name=coll,
+                    prefetch=dp.prefetch,
+                    query=dp.query,
+                    using=dp.using,
+                    limit=dp.limit,
+                    search_params=dp.params,
+                    with_payload=models.PayloadSelectorInclude(include=_PAYLOAD_FIELDS)
+                )
+                points = getattr(dres, 'points', dres)
+                dense_pairs = [(str(p.id), dict(p.payload)) for p in points]
+        except Exception:
             dense_pairs = []
-        else:
-            dres = qc.query_points(
-                collection_name=coll,
-                query=e,
-                using='dense',
-                limit=topk_dense,
-                with_payload=models.PayloadSelectorInclude(include=['file_path', 'start_line', 'end_line', 'language', 'layer', 'repo', 'hash', 'id'])
-            )
-            points = getattr(dres, 'points', dres)
-            dense_pairs = [(str(p.id), dict(p.payload)) for p in points]
-    except Exception:
-        dense_pairs = []
 
-    idx_dir = os.path.join(out_dir(repo), 'bm25_index')
-    retriever = bm25s.BM25.load(idx_dir)
-    tokenizer = Tokenizer(stemmer=Stemmer('english'), stopwords='en')
-    tokens = tokenizer.tokenize([query])
-    ids, _ = retriever.retrieve(tokens, k=topk_sparse)
-    ids = ids.tolist()[0] if hasattr(ids, 'tolist') else list(ids[0])
-    id_map = _load_bm25_map(idx_dir)
-    by_chunk_id = {str(c['id']): c for c in chunks}
-    sparse_pairs = []
-    for i in ids:
-        if id_map is not None:
-            if 0 <= i < len(id_map):
-                pid_or_cid = id_map[i]
-                key = str(pid_or_cid)
-                if key in by_chunk_id:
-                    sparse_pairs.append((key, by_chunk_id[key]))
+        idx_dir = os.path.join(out_dir(repo), 'bm25_index')
+        if index_meta.get('bm25_shards'):
+            # INDEX_SHARDS builds: one bm25s index per shard, merged by score.
+            by_chunk_id = {str(c['id']): c for c in chunks}
+            for _score, cid in _sparse_from_shards(repo, query, topk_sparse):
+                if cid in by_chunk_id:
+                    sparse_pairs.append((cid, by_chunk_id[cid]))
+        else:
+            retriever = bm25s.BM25.load(idx_dir)
+            tokens = _query_tokens(idx_dir, query)
+            ids, _ = retriever.retrieve(tokens, k=topk_sparse)
+            ids = ids.tolist()[0] if hasattr(ids, 'tolist') else list(ids[0])
+            id_map = _load_bm25_map(idx_dir)
+            by_chunk_id = {str(c['id']): c for c in chunks}
+            for i in ids:
+                if id_map is not None:
+                    if 0 <= i < len(id_map):
+                        pid_or_cid = id_map[i]
+                        key = str(pid_or_cid)
+                        if key in by_chunk_id:
+                            sparse_pairs.append((key, by_chunk_id[key]))
+                        else:
+                            if 0 <= i < len(chunks):
+                                sparse_pairs.append((str(chunks[i]['id']), chunks[i]))
                 else:
                     if 0 <= i < len(chunks):
                         sparse_pairs.append((str(chunks[i]['id']), chunks[i]))
-        else:
-            if 0 <= i < len(chunks):
-                sparse_pairs.append((str(chunks[i]['id']), chunks[i]))
 
     card_chunk_ids: set = set()
     cards_retr = _load_cards_bm25(repo)
     if cards_retr is not None:
         try:
             cards_map = _load_cards_map(repo)
-            tokens = tokenizer.tokenize([query])
+            tokens = _query_tokens(os.path.join(out_dir(repo), 'bm25_cards'), query)
             c_ids, _ = cards_retr.retrieve(tokens, k=min(topk_sparse, 30))
             c_ids_flat = c_ids[0] if hasattr(c_ids, '__getitem__') else c_ids
             for card_idx in c_ids_flat:
@@ -308,7 +495,11 @@ def search(query: str, repo: str, topk_dense: int = 75, topk_sparse: int = 75, f
 
     dense_ids = [pid for pid, _ in dense_pairs]
     sparse_ids = [pid for pid, _ in sparse_pairs]
-    fused = rrf(dense_ids, sparse_ids, k=max(final_k, 2 * final_k)) if dense_pairs else sparse_ids[:final_k]
+    if fused_pairs is not None:
+        fused = [pid for pid, _ in fused_pairs]
+        dense_pairs, dense_ids = fused_pairs, fused
+    else:
+        fused = rrf(dense_ids, sparse_ids, k=max(final_k, 2 * final_k)) if dense_pairs else sparse_ids[:final_k]
     by_id = {pid: p for pid, p in (dense_pairs + sparse_pairs)}
     docs = [by_id[pid] for pid in fused if pid in by_id]
     HYDRATION_MODE = (os.getenv('HYDRATION_MODE', 'lazy') or 'lazy').lower()
@@ -364,7 +555,83 @@ def search(query: str, repo: str, topk_dense: int = 75, topk_sparse: int = 75, f
         score += _feature_bonus(query, fp, d.get('code', '') or '')
         d['rerank_score'] = score
     docs.sort(key=lambda x: x.get('rerank_score', 0.0), reverse=True)
-    return docs[:final_k]
+    docs = docs[:final_k]
+    if HYDRATION_MODE != 'none':
+        docs = _expand_parents(repo, docs)
+    _attach_alt_locations(repo, docs)
+    return docs
+
+
+def _load_parents(repo: str, wanted: set[str]) -> dict[str, dict]:
+    found: dict[str, dict] = {}
+    try:
+        with open(os.path.join(out_dir(repo), 'parents.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    o = json.loads(line)
+                except Exception:
+                    continue
+                pid = str(o.get('id', '') or '')
+                if pid in wanted:
+                    found[pid] = o
+                    if len(found) >= len(wanted):
+                        break
+    except FileNotFoundError:
+        pass
+    return found
+
+
+def _expand_parents(repo: str, docs: list[dict]) -> list[dict]:
+    """Expand hits to their parent definition (CHUNK_HIERARCHY=1 indexes).
+
+    HYDRATION_PARENT=auto (default) expands when two or more hits share a
+    parent, ``always`` expands every hit that has one, ``off`` never does.
+    The parent takes the place of its best-ranked child; ``expanded_from``
+    lists the child chunk ids it replaced.
+    """
+    mode = (os.getenv('HYDRATION_PARENT', 'auto') or 'auto').lower()
+    if mode not in ('auto', 'always'):
+        return docs
+    hits: dict[str, int] = {}
+    for d in docs:
+        pid = str(d.get('parent_id') or '')
+        if pid:
+            hits[pid] = hits.get(pid, 0) + 1
+    wanted = {pid for pid, n in hits.items() if mode == 'always' or n >= 2}
+    if not wanted:
+        return docs
+    parents = _load_parents(repo, wanted)
+    blobs = blob_reader(out_dir(repo))
+    max_chars = int(os.getenv('HYDRATION_MAX_CHARS', '2000') or '2000')
+    out: list[dict] = []
+    expanded: dict[str, dict] = {}
+    for d in docs:
+        pid = str(d.get('parent_id') or '')
+        p = parents.get(pid)
+        if p is None:
+            out.append(d)
+            continue
+        if pid in expanded:
+            expanded[pid]['expanded_from'].append(str(d.get('id', '')))
+            continue
+        code = blobs.text(p, max_chars)
+        e = dict(d, id=p.get('id'), type='parent', name=p.get('name'), start_line=p.get('start_line'),
+                 end_line=p.get('end_line'), parent_id=p.get('parent_id'), hash=p.get('hash'),
+                 code=code, token_count=_shown_tokens(p, code), expanded_from=[str(d.get('id', ''))])
+        expanded[pid] = e
+        out.append(e)
+    return out
+
+
+def _shown_tokens(row: dict, code: str) -> int | None:
+    """Stored ``token_count`` of ``row``, scaled down when hydration
+    truncated its code to ``code`` (HYDRATION_MAX_CHARS)."""
+    n = row.get('token_count')
+    if n is None:
+        return None
+    full = len(row['code']) if row.get('code') is not None else \
+        (row['byte_range'][1] - row['byte_range'][0] if row.get('byte_range') else len(code))
+    return max(1, -(-int(n) * len(code) // full)) if code and full > len(code) else int(n)
 
 
 def _hydrate_docs_inplace(repo: str, docs: list[dict]) -> None:
@@ -382,9 +649,12 @@ def _hydrate_docs_inplace(repo: str, docs: list[dict]) -> None:
     if not needed_ids and not needed_hashes:
         return
     jl = os.path.join(out_dir(repo), 'chunks.jsonl')
+    # CHUNK_STORE=blob rows carry byte offsets instead of code; only the
+    # hits are sliced out of the (mmapped) file blobs.
+    blobs = blob_reader(out_dir(repo))
     max_chars = int(os.getenv('HYDRATION_MAX_CHARS', '2000') or '2000')
-    found_by_id: dict[str, str] = {}
-    found_by_hash: dict[str, str] = {}
+    found_by_id: dict[str, tuple] = {}
+    found_by_hash: dict[str, tuple] = {}
     try:
         with open(jl, 'r', encoding='utf-8') as f:
             for line in f:
@@ -394,13 +664,16 @@ def _hydrate_docs_inplace(repo: str, docs: list[dict]) -> None:
                     continue
                 cid = str(o.get('id', '') or '')
                 h = o.get('hash')
-                code = (o.get('code') or '')
-                if max_chars > 0 and code:
-                    code = code[:max_chars]
-                if cid and cid in needed_ids and cid not in found_by_id:
-                    found_by_id[cid] = code
-                if h and h in needed_hashes and h not in found_by_hash:
-                    found_by_hash[h] = code
+                want_id = bool(cid) and cid in needed_ids and cid not in found_by_id
+                want_hash = bool(h) and h in needed_hashes and h not in found_by_hash
+                if not (want_id or want_hash):
+                    continue
+                code = blobs.text(o, max_chars)
+                hit = (code, _shown_tokens(o, code))
+                if want_id:
+                    found_by_id[cid] = hit
+                if want_hash:
+                    found_by_hash[h] = hit
                 if len(found_by_id) >= len(needed_ids) and len(found_by_hash) >= len(needed_hashes):
                     break
     except FileNotFoundError:
@@ -409,7 +682,10 @@ def _hydrate_docs_inplace(repo: str, docs: list[dict]) -> None:
         if not d.get('code'):
             cid = str(d.get('id', '') or '')
             h = d.get('hash')
-            d['code'] = found_by_id.get(cid) or (found_by_hash.get(h) if h else '') or ''
+            code, tokens = found_by_id.get(cid) or (found_by_hash.get(h) if h else None) or ('', None)
+            d['code'] = code
+            if tokens is not None:
+                d['token_count'] = tokens
 
 
 def _apply_filename_boosts(docs: list[dict], question: str) -> None:
@@ -0,0 +1,88 @@
+"""Process-wide registry for local SentenceTransformer models.
+
+Models are loaded once per process (indexer, watcher, API server) and shared.
+EMBED_THREADS caps the torch intra-op thread pool (0 = torch default).
+
+``encode_bucketed`` sorts the whole input by token length before slicing it
+into batches, so each batch pads to a similar length instead of to the
+longest chunk among 128 neighbours in file order, then restores input order.
+Vectors come back as one float32 matrix written in place, batch by batch.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+_MODELS: Dict[str, Any] = {}
+_LOCK = threading.Lock()
+_THREADS_SET = False
+
+
+def _apply_threads() -> None:
+    global _THREADS_SET
+    if _THREADS_SET:
+        return
+    _THREADS_SET = True
+    try:
+        n = int(os.getenv('EMBED_THREADS', '0') or 0)
+    except ValueError:
+        n = 0
+    if n > 0:
+        try:
+            import torch  # type: ignore
+            torch.set_num_threads(n)
+        except Exception:
+            pass
+
+
+def get_model(name: str):
+    """Load ``name`` on first use; later calls return the same instance."""
+    m = _MODELS.get(name)
+    if m is not None:
+        return m
+    with _LOCK:
+        m = _MODELS.get(name)
+        if m is None:
+            _apply_threads()
+            from sentence_transformers import SentenceTransformer
+            m = SentenceTransformer(name)
+            _MODELS[name] = m
+    return m
+
+
+def token_lengths(model, texts: Sequence[str]) -> List[int]:
+    """Token counts (capped at the model's max length); char length if the
+    model exposes no tokenizer."""
+    tok = getattr(model, 'tokenizer', None)
+    if tok is not None:
+        try:
+            max_len = int(getattr(model, 'max_seq_length', 512) or 512)
+            enc = tok(list(texts), add_special_tokens=False, truncation=True, max_length=max_len,
+                      return_attention_mask=False, return_token_type_ids=False)
+            return [len(ids) for ids in enc['input_ids']]
+        except Exception:
+            pass
+    return [len(t) for t in texts]
+
+
+def encode_bucketed(name: str, texts: Sequence[str], batch: int = 128, normalize: bool = True) -> np.ndarray:
+    """Encode ``texts`` with length-sorted batches into an ``(n, dim)`` float32
+    matrix whose rows are in input order."""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    model = get_model(name)
+    lengths = token_lengths(model, texts)
+    order = np.argsort(-np.asarray(lengths), kind='stable')
+    out = None
+    for s in range(0, len(order), batch):
+        idx = order[s:s + batch]
+        v = model.encode([texts[i] for i in idx], batch_size=len(idx), normalize_embeddings=normalize,
+                         show_progress_bar=False, convert_to_numpy=True)
+        if out is None:
+            out = np.empty((len(texts), v.shape[1]), dtype=np.float32)
+        out[idx] = v
+    return out
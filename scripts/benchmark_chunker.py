@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+AST chunker throughput: one parse per file vs one parse per emitted chunk.
+
+  python scripts/benchmark_chunker.py                  # synthetic mixed-language corpus
+  python scripts/benchmark_chunker.py --root ../some-repo --limit 2000
+  python scripts/benchmark_chunker.py --funcs 200 --files 8
+
+"before" mirrors the old retrieval.ast_chunker cost: chunk the file, then
+build a fresh parser and re-parse the whole file once per unit/blob chunk
+(and each section on its own) to extract imports. "after" is the current
+chunk_code: one cached parser per language, one parse and one tree walk per
+file. Chunk boundaries and ids are identical; only the work differs.
+
+  python scripts/benchmark_chunker.py --root ../some-repo --hierarchy
+
+--hierarchy instead compares what gets indexed with the flat chunks and with
+CHUNK_HIERARCHY=1: chunk count and embedding tokens (common.tokens: cl100k
+when available, else ~3 chars per token). Parent records are stored, not counted.
+
+  python scripts/benchmark_chunker.py --root ../some-repo --tokens
+
+--tokens compares sizing by 900 non-whitespace characters (CHUNK_TOKENS=0)
+with the token budget of each embedding model: chunk count, token spread and
+how many chunks exceed the model's input limit (silently truncated).
+
+  python scripts/benchmark_chunker.py --root ../some-repo --incremental --edits 5
+
+--incremental simulates editor saves: each file gets --edits one-line edits
+and is re-chunked after each one, cold (TREE_CACHE_FILES=0) and with the
+tree cache, which re-parses only the edited region. Chunks must match.
+"""
+from __future__ import annotations
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+# (extension, import line, function template) per language.
+_LANGS = {
+    'python': ('.py', 'import os\nfrom typing import List\n',
+               'def handler_{i}(items: List[int]) -> int:\n    total = 0\n    for x in items:\n'
+               '        total += x * {i}\n    return total\n\n'),
+    'javascript': ('.js', "import {{ fetchAll }} from './api';\n",
+                   'function handler_{i}(items) {{\n  let total = 0;\n  for (const x of items) total += x * {i};\n'
+                   '  return total;\n}}\n\n'),
+    'typescript': ('.ts', "import {{ fetchAll }} from './api';\n",
+                   'function handler_{i}(items: number[]): number {{\n  let total = 0;\n'
+                   '  for (const x of items) total += x * {i};\n  return total;\n}}\n\n'),
+    'go': ('.go', 'package main\n\nimport "fmt"\n',
+           'func handler{i}(items []int) int {{\n\ttotal := 0\n\tfor _, x := range items {{\n\t\ttotal += x * {i}\n'
+           '\t}}\n\tfmt.Println(total)\n\treturn total\n}}\n\n'),
+    'java': ('.java', 'import java.util.List;\n\npublic class Handlers {{\n',
+             '  public int handler{i}(List<Integer> items) {{\n    int total = 0;\n'
+             '    for (int x : items) total += x * {i};\n    return total;\n  }}\n\n'),
+    'rust': ('.rs', 'use std::collections::HashMap;\n',
+             'fn handler_{i}(items: &[i64]) -> i64 {{\n    let mut total = 0;\n    for x in items {{\n'
+             '        total += x * {i};\n    }}\n    total\n}}\n\n'),
+    'cpp': ('.cpp', '#include <vector>\n',
+            'int handler_{i}(const std::vector<int>& items) {{\n  int total = 0;\n  for (int x : items) total += x * {i};\n'
+            '  return total;\n}}\n\n'),
+    'bash': ('.sh', 'source ./env.sh\n', 'handler_{i}() {{\n  local total=0\n  echo "$total {i}"\n}}\n\n'),
+}
+
+
+def _synthetic(files: int, funcs: int):
+    out = []
+    for lang, (ext, head, tmpl) in _LANGS.items():
+        for f in range(files):
+            body = ''.join(tmpl.format(i=i) for i in range(funcs))
+            src = head.format() + '\n' + body + ('}\n' if lang == 'java' else '')
+            out.append((f'/bench/{lang}/mod_{f}{ext}', src, lang))
+    return out
+
+
+def _from_root(root: str, limit: int):
+    from retrieval.ast_chunker import collect_files, lang_from_path
+    out = []
+    for fp in collect_files([root]):
+        lang = lang_from_path(fp)
+        if not lang or lang == 'markdown':
+            continue
+        try:
+            with open(fp, 'r', encoding='utf-8', errors='ignore') as f:
+                out.append((fp, f.read(), lang))
+        except OSError:
+            continue
+        if len(out) >= limit:
+            break
+    return out
+
+
+def _before(src: str, fp: str, lang: str) -> int:
+    from tree_sitter_languages import get_parser
+    from retrieval.ast_chunker import IMPORT_NODES, chunk_code
+    chunks = chunk_code(src, fp, lang)
+    parses = 1
+    for c in chunks:
+        text = c['code'] if c['type'] == 'section' else src
+        try:
+            tree = get_parser(lang).parse(bytes(text, 'utf-8'))
+        except Exception:
+            continue
+        parses += 1
+        wanted = IMPORT_NODES.get(lang, set())
+        stack = [tree.root_node]
+        while stack:
+            n = stack.pop()
+            if n.type in wanted:
+                _ = text[n.start_byte:n.end_byte]
+            stack.extend(n.children)
+    return parses
+
+
+def hierarchy_report(corpus) -> None:
+    from common.tokens import tokenizer_name
+    from retrieval.ast_chunker import chunk_code
+    how = tokenizer_name()
+    rows = []
+    for hier in (False, True):
+        chunks = [c for fp, src, lang in corpus for c in chunk_code(src, fp, lang, hierarchy=hier)]
+        indexed = [c for c in chunks if c['type'] != 'parent']
+        rows.append((len(indexed), sum(c['token_count'] for c in indexed), len(chunks) - len(indexed)))
+    (n0, t0, _), (n1, t1, parents) = rows
+    print(f'  flat: {n0:7d} chunks  {t0:10d} tokens ({how})')
+    print(f'  tree: {n1:7d} chunks  {t1:10d} tokens  + {parents} parents (stored, not indexed)')
+    if n0 and t0:
+        print(f'reduction: {100.0 * (n0 - n1) / n0:.1f}% chunks, {100.0 * (t0 - t1) / t0:.1f}% embedding tokens')
+
+
+def tokens_report(corpus) -> None:
+    from common.tokens import EMBED_MODELS, chunk_token_budget, tokenizer_name
+    from retrieval.ast_chunker import chunk_code
+
+    def row(label, budget, limit):
+        counts = sorted(c['token_count'] for fp, src, lang in corpus
+                        for c in chunk_code(src, fp, lang, tokens=budget) if c['type'] != 'parent')
+        if not counts:
+            return
+        over = sum(1 for n in counts if n > limit)
+        print(f'  {label:<28} {len(counts):7d} chunks  median {counts[len(counts) // 2]:5d}  '
+              f'p95 {counts[int(len(counts) * 0.95)]:5d}  max {counts[-1]:6d}  over limit {over}')
+
+    print(f'tokens: {tokenizer_name()}')
+    for et, (model, limit) in EMBED_MODELS.items():
+        print(f'{model} (limit {limit}):')
+        row('chars (CHUNK_TOKENS=0)', 0, limit)
+        budget = chunk_token_budget(et)
+        row(f'tokens (budget {budget})', budget, limit)
+
+
+def _edits(src: str, n: int, seed: int):
+    import random
+    rnd = random.Random(seed)
+    out, cur = [], src
+    for k in range(n):
+        lines = cur.split('\n')
+        i = rnd.randrange(len(lines))
+        lines[i] = lines[i] + f' // edit {k}' if lines[i].strip().startswith(('//', '#')) else lines[i] + ' '
+        cur = '\n'.join(lines)
+        out.append(cur)
+    return out
+
+
+def incremental_report(corpus, edits: int) -> None:
+    import os
+    import retrieval.ast_chunker as ac
+    saves = [(fp, lang, _edits(src, edits, i)) for i, (fp, src, lang) in enumerate(corpus)]
+    results, times = {}, {}
+    for mode, size in (('cold', '0'), ('cached', str(len(corpus) + 1))):
+        os.environ['TREE_CACHE_FILES'] = size
+        ac._TREES.clear()
+        for fp, src, lang in corpus:  # the watcher has seen each file once
+            ac.chunk_code(src, fp, lang)
+        for k in ac.PARSE_STATS:
+            ac.PARSE_STATS[k] = 0
+        t = time.perf_counter()
+        results[mode] = [ac.chunk_code(v, fp, lang) for fp, lang, versions in saves for v in versions]
+        times[mode] = time.perf_counter() - t
+        stats = dict(ac.PARSE_STATS)
+    os.environ.pop('TREE_CACHE_FILES', None)
+    n = sum(len(v) for _fp, _lang, v in saves)
+    for mode in ('cold', 'cached'):
+        print(f'{mode:>6}: {times[mode]:7.3f}s  {n / times[mode]:8.1f} saves/s')
+    print(f'speedup: {times["cold"] / times["cached"]:.2f}x over {n} saves; parses {stats}; '
+          f'identical chunks: {results["cold"] == results["cached"]}')
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--root', help='chunk real files under this directory instead')
+    ap.add_argument('--limit', type=int, default=1000, help='max files with --root')
+    ap.add_argument('--files', type=int, default=4, help='synthetic files per language')
+    ap.add_argument('--funcs', type=int, default=120, help='functions per synthetic file')
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--hierarchy', action='store_true', help='report chunks/tokens flat vs CHUNK_HIERARCHY=1')
+    ap.add_argument('--tokens', action='store_true', help='report chunk token sizes, char vs token budget')
+    ap.add_argument('--incremental', action='store_true', help='time re-chunking after edits, cold vs tree cache')
+    ap.add_argument('--edits', type=int, default=5, help='edits per file with --incremental')
+    args = ap.parse_args()
+
+    from retrieval.ast_chunker import chunk_code
+    corpus = _from_root(args.root, args.limit) if args.root else _synthetic(args.files, args.funcs)
+    langs = sorted({lang for _fp, _src, lang in corpus})
+    nbytes = sum(len(src) for _fp, src, _lang in corpus)
+    print(f'{len(corpus)} files, {nbytes / 1e6:.2f} MB, languages: {", ".join(langs)}')
+    if args.hierarchy:
+        hierarchy_report(corpus)
+        return 0
+    if args.tokens:
+        tokens_report(corpus)
+        return 0
+    if args.incremental:
+        incremental_report(corpus, args.edits)
+        return 0
+
+    best_after = best_before = float('inf')
+    chunks = parses_before = 0
+    for _ in range(max(1, args.repeat)):
+        t = time.perf_counter()
+        chunks = sum(len(chunk_code(src, fp, lang)) for fp, src, lang in corpus)
+        best_after = min(best_after, time.perf_counter() - t)
+        t = time.perf_counter()
+        parses_before = sum(_before(src, fp, lang) for fp, src, lang in corpus)
+        best_before = min(best_before, time.perf_counter() - t)
+
+    for name, secs, parses in (('before', best_before, parses_before), ('after', best_after, len(corpus))):
+        print(f'{name:>6}: {secs:7.3f}s  {len(corpus) / secs:8.1f} files/s  {chunks / secs:9.1f} chunks/s  '
+              f'{nbytes / secs / 1e6:6.2f} MB/s  parses/file {parses / len(corpus):.1f}')
+    print(f'speedup: {best_before / best_after:.1f}x ({chunks} chunks)')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
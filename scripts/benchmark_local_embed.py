@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+CPU throughput of local embeddings: file-order 128-item slices vs length-bucketed batches.
+
+  python scripts/benchmark_local_embed.py                      # chunks.jsonl of $REPO
+  python scripts/benchmark_local_embed.py --limit 3000 --threads 4 --model BAAI/bge-small-en-v1.5
+
+"before" mirrors the old indexer path: construct the model, then encode
+slices in file order (each slice pads to its longest chunk). "after" uses the
+process-wide registry (model already loaded) and retrieval.local_models
+.encode_bucketed. Both produce the same vectors; the script checks that.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def _load_texts(repo: str, limit: int):
+    from common.blob_store import reader
+    from common.config_loader import out_dir
+    p = Path(out_dir(repo)) / 'chunks.jsonl'
+    blobs = reader(str(p.parent))
+    texts = []
+    if p.exists():
+        with open(p, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    texts.append(blobs.text(json.loads(line)))
+                except Exception:
+                    continue
+                if len(texts) >= limit:
+                    break
+    if not texts:
+        # Synthetic mix: mostly short chunks with a long tail, like real code.
+        for i in range(limit):
+            n = 3 if i % 10 else 120
+            texts.append('\n'.join(f'    value_{i}_{j} = compute(value_{i}_{j - 1}, {j})' for j in range(n)))
+    return texts
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repo', default=os.getenv('REPO', 'agro'))
+    ap.add_argument('--limit', type=int, default=2000)
+    ap.add_argument('--batch', type=int, default=128)
+    ap.add_argument('--threads', type=int, default=0, help='EMBED_THREADS (0 = torch default)')
+    ap.add_argument('--model', default='BAAI/bge-small-en-v1.5')
+    args = ap.parse_args()
+    if args.threads:
+        os.environ['EMBED_THREADS'] = str(args.threads)
+
+    import numpy as np
+    from retrieval.local_models import encode_bucketed, get_model
+    texts = _load_texts(args.repo, args.limit)
+    print(f'{len(texts)} chunks, model {args.model}, batch {args.batch}, threads {args.threads or "default"}')
+
+    from sentence_transformers import SentenceTransformer
+    t0 = time.time()
+    model = SentenceTransformer(args.model)
+    t_load = time.time() - t0
+    before = []
+    for i in range(0, len(texts), args.batch):
+        before.extend(model.encode(texts[i:i + args.batch], normalize_embeddings=True, show_progress_bar=False).tolist())
+    t_before = time.time() - t0
+    del model
+
+    get_model(args.model)  # registry load happens once per process, outside the timed loop
+    t0 = time.time()
+    after = encode_bucketed(args.model, texts, batch=args.batch)
+    t_after = time.time() - t0
+
+    print(f'before: {t_before:7.2f}s ({len(texts) / t_before:8.1f} chunks/s, incl. {t_load:.2f}s model load)')
+    print(f'after:  {t_after:7.2f}s ({len(texts) / t_after:8.1f} chunks/s)')
+    diff = float(np.max(np.abs(np.asarray(before) - np.asarray(after)))) if texts else 0.0
+    print(f'speedup x{t_before / max(t_after, 1e-9):.2f}; max |delta| between vectors {diff:.2e}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
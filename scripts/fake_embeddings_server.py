@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the OpenAI embeddings endpoint.
+
+  python scripts/fake_embeddings_server.py --port 8099 --latency-ms 150 --rpm 600
+  OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=fake python -m indexer.index_repo
+
+- POST /v1/embeddings returns deterministic vectors (hash of the text), so
+  results can be compared across runs and concurrency settings; honours
+  encoding_format=base64 (little-endian float32) like the real API
+- --latency-ms simulates round-trip time; --rpm / --tpm answer 429 with a
+  Retry-After header once the sliding 60s window is full; --fail-rate injects
+  random 429s
+"""
+from __future__ import annotations
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_vector(text: str, dim: int) -> list:
+    out = []
+    seed = hashlib.sha256(text.encode('utf-8', 'ignore')).digest()
+    i = 0
+    while len(out) < dim:
+        block = hashlib.sha256(seed + i.to_bytes(4, 'little')).digest()
+        out.extend(x / 2**31 for x in struct.unpack('<8i', block))
+        i += 1
+    v = out[:dim]
+    n = sum(x * x for x in v) ** 0.5 or 1.0
+    return [x / n for x in v]
+
+
+class _Limits:
+    def __init__(self, rpm: int, tpm: int, fail_rate: float):
+        self.rpm, self.tpm, self.fail_rate = rpm, tpm, fail_rate
+        self.events: deque = deque()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'rejected': 0, 'inputs': 0}
+
+    def admit(self, tokens: int) -> float | None:
+        """None if admitted, else seconds until retry."""
+        with self.lock:
+            now = time.monotonic()
+            while self.events and now - self.events[0][0] >= 60:
+                self.events.popleft()
+            used = sum(t for _, t in self.events)
+            over = (self.rpm and len(self.events) >= self.rpm) or (self.tpm and self.events and used + tokens > self.tpm)
+            if over or (self.fail_rate and random.random() < self.fail_rate):
+                self.stats['rejected'] += 1
+                return max(0.05, 60 - (now - self.events[0][0])) if over else 0.2
+            self.events.append((now, tokens))
+            self.stats['requests'] += 1
+            return None
+
+
+def make_server(port: int = 8099, dim: int = 256, latency_ms: float = 100.0, rpm: int = 0, tpm: int = 0,
+                fail_rate: float = 0.0) -> ThreadingHTTPServer:
+    limits = _Limits(rpm, tpm, fail_rate)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: dict, headers: dict | None = None):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/embeddings'):
+                return self._send(404, {'error': {'message': 'not found'}})
+            req = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            inputs = req.get('input') or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            tokens = sum(len(str(t)) // 4 + 1 for t in inputs)
+            wait = limits.admit(tokens)
+            if wait is not None:
+                return self._send(429, {'error': {'message': 'rate limited', 'type': 'rate_limit_exceeded'}},
+                                  {'retry-after-ms': str(int(wait * 1000))})
+            time.sleep(latency_ms / 1000.0)
+            if req.get('encoding_format') == 'base64':
+                encode = lambda v: base64.b64encode(struct.pack(f'<{len(v)}f', *v)).decode()  # noqa: E731
+            else:
+                encode = lambda v: v  # noqa: E731
+            limits.stats['inputs'] += len(inputs)
+            self._send(200, {
+                'object': 'list',
+                'model': req.get('model', 'fake'),
+                'data': [{'object': 'embedding', 'index': i, 'embedding': encode(fake_vector(str(t), dim))} for i, t in enumerate(inputs)],
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+            })
+
+    srv = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    srv.stats = limits.stats  # type: ignore[attr-defined]
+    return srv
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--port', type=int, default=8099)
+    ap.add_argument('--dim', type=int, default=256)
+    ap.add_argument('--latency-ms', type=float, default=100.0)
+    ap.add_argument('--rpm', type=int, default=0)
+    ap.add_argument('--tpm', type=int, default=0)
+    ap.add_argument('--fail-rate', type=float, default=0.0)
+    args = ap.parse_args()
+    srv = make_server(args.port, args.dim, args.latency_ms, args.rpm, args.tpm, args.fail_rate)
+    print(f'[fake-embeddings] listening on http://127.0.0.1:{args.port}/v1')
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -14,7 +14,7 @@ cat > "$HOOKS_DIR/post-checkout" << 'H'
 repo_root="$(git rev-parse --show-toplevel)"
 cd "$repo_root" || exit 0
 if [ -d .venv ]; then . .venv/bin/activate; fi
-export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1
+export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1 GIT_DIFF_INDEX=1
 # Use shared profile by default
 export OUT_DIR_BASE="./out.noindex-shared"
 python -m indexer.index_repo >/dev/null 2>&1 || true
@@ -27,7 +27,7 @@ cat > "$HOOKS_DIR/post-commit" << 'H'
 repo_root="$(git rev-parse --show-toplevel)"
 cd "$repo_root" || exit 0
 if [ -d .venv ]; then . .venv/bin/activate; fi
-export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1
+export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1 GIT_DIFF_INDEX=1
 export OUT_DIR_BASE="./out.noindex-shared"
 python -m indexer.index_repo >/dev/null 2>&1 || true
 H
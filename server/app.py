@@ -11,6 +11,7 @@ from server.tracing import start_trace, end_trace, Trace, latest_trace_path
 from retrieval.hybrid_search import search_routed_multi
 from common.config_loader import load_repos, out_dir
 from server.index_stats import get_index_stats as _get_index_stats
+from server.index_stats import get_build_report as _get_build_report
 from typing import cast
 try:
     # Optional import; used for MCP wrapper endpoints
@@ -63,7 +64,7 @@ def health():
         g = get_graph()
         return {"status": "healthy", "graph_loaded": g is not None, "ts": __import__('datetime').datetime.utcnow().isoformat() + 'Z'}
     except Exception as e:
-    return {"status": "error", "detail": str(e)}
+        return {"status": "error", "detail": str(e)}
 
 @app.get("/health/langsmith")
 def health_langsmith() -> Dict[str, Any]:
@@ -1237,35 +1238,61 @@ _INDEX_STATUS: List[str] = []
 _INDEX_METADATA: Dict[str, Any] = {}
 
 @app.post("/api/index/start")
-def index_start() -> Dict[str, Any]:
-    """Start indexing with real subprocess execution."""
+def index_start(payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Start indexing with real subprocess execution.
+
+    Body (optional): {"repos": ["a", "b"]} or {"all": true} runs the
+    multi-repo orchestrator (indexer.index_all); default is the current REPO.
+    """
     global _INDEX_STATUS, _INDEX_METADATA
     import subprocess
     import threading
 
+    payload = payload or {}
+    repos = [str(r) for r in (payload.get("repos") or []) if str(r).strip()]
+    if payload.get("all"):
+        from common.config_loader import list_repos
+        repos = list_repos()
+    if not repos:
+        repos = [os.getenv("REPO", "agro")]
+
     _INDEX_STATUS = ["Indexing started..."]
     _INDEX_METADATA = {}
 
     def run_index():
         global _INDEX_STATUS, _INDEX_METADATA
         try:
-            repo = os.getenv("REPO", "agro")
-            _INDEX_STATUS.append(f"Indexing repository: {repo}")
+            _INDEX_STATUS.append(f"Indexing repositories: {', '.join(repos)}" if len(repos) > 1
+                                 else f"Indexing repository: {repos[0]}")
+            if len(repos) > 1:
+                cmd = [sys.executable, "-m", "indexer.index_all"]
+                for r in repos:
+                    cmd += ["--repo", r]
+            else:
+                cmd = [sys.executable, "-m", "indexer.index_repo"]
 
-            # Run the actual indexer
-            result = subprocess.run(
-                ["python", "index_repo.py"],
-                capture_output=True,
+            # Run the actual indexer, streaming its progress lines
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
                 text=True,
-                cwd=repo_root(),
-                env={**os.environ, "REPO": repo}
+                cwd=str(repo_root()),
+                env={**os.environ, "REPO": repos[0], "PYTHONUNBUFFERED": "1"}
             )
-
-            if result.returncode == 0:
+            tail: List[str] = []
+            for line in proc.stdout:  # type: ignore[union-attr]
+                line = line.rstrip()
+                if line:
+                    _INDEX_STATUS.append(line)
+                    tail = (tail + [line])[-5:]
+            rc = proc.wait()
+
+            if rc == 0:
                 _INDEX_STATUS.append("✓ Indexing completed successfully")
                 _INDEX_METADATA = _get_index_stats()
             else:
-                _INDEX_STATUS.append(f"✗ Indexing failed: {result.stderr[:200]}")
+                _INDEX_STATUS.append(f"✗ Indexing failed: {' | '.join(tail)[:200]}")
         except Exception as e:
             _INDEX_STATUS.append(f"✗ Error: {str(e)}")
 
@@ -1273,23 +1300,30 @@ def index_start() -> Dict[str, Any]:
     thread = threading.Thread(target=run_index, daemon=True)
     thread.start()
 
-    return {"ok": True, "message": "Indexing started in background"}
+    return {"ok": True, "message": "Indexing started in background", "repos": repos}
 
 @app.get("/api/index/status")
 def index_status() -> Dict[str, Any]:
     """Return comprehensive indexing status with all metrics."""
+    from indexer.index_all import read_status as _read_index_all_status
+    repos = _read_index_all_status().get("repos") or {}
+    build_report = _get_build_report(os.getenv("REPO", "agro"))
     if not _INDEX_METADATA:
         # Return basic status if no metadata yet
         return {
-            "lines": _INDEX_STATUS,
-            "running": len(_INDEX_STATUS) > 0 and not any("completed" in s or "failed" in s for s in _INDEX_STATUS),
-            "metadata": _get_index_stats()  # Always provide current stats
+            "lines": _INDEX_STATUS[-200:],
+            "running": len(_INDEX_STATUS) > 0 and not _INDEX_STATUS[-1].startswith(("✓", "✗")),
+            "metadata": _get_index_stats(),  # Always provide current stats
+            "repos": repos,
+            "build_report": build_report,
         }
 
     return {
-        "lines": _INDEX_STATUS,
+        "lines": _INDEX_STATUS[-200:],
         "running": False,
-        "metadata": _INDEX_METADATA
+        "metadata": _INDEX_METADATA,
+        "repos": repos,
+        "build_report": build_report,
     }
 
 @app.post("/api/cards/build")
@@ -1555,9 +1589,9 @@ _HOOK_POST_CHECKOUT = """#!/usr/bin/env bash
 repo_root="$(git rev-parse --show-toplevel)"
 cd "$repo_root" || exit 0
 if [ -d .venv ]; then . .venv/bin/activate; fi
-export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1
+export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1 GIT_DIFF_INDEX=1
 export OUT_DIR_BASE="./out.noindex-shared"
-python index_repo.py >/dev/null 2>&1 || true
+python -m indexer.index_repo >/dev/null 2>&1 || true
 """
 
 _HOOK_POST_COMMIT = """#!/usr/bin/env bash
@@ -1566,9 +1600,9 @@ _HOOK_POST_COMMIT = """#!/usr/bin/env bash
 repo_root="$(git rev-parse --show-toplevel)"
 cd "$repo_root" || exit 0
 if [ -d .venv ]; then . .venv/bin/activate; fi
-export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1
+export REPO=agro EMBEDDING_TYPE=local SKIP_DENSE=1 GIT_DIFF_INDEX=1
 export OUT_DIR_BASE="./out.noindex-shared"
-python index_repo.py >/dev/null 2>&1 || true
+python -m indexer.index_repo >/dev/null 2>&1 || true
 """
 
 @app.get("/api/git/hooks/status")
@@ -10,6 +10,7 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, Any, Optional, Iterator, List
 
+from common.blob_store import reader as blob_reader
 from common.config_loader import out_dir
 from server.env_model import generate_text
 
@@ -202,7 +203,7 @@ class CardsBuildJob:
                         self.status = "cancelled"
                         self._emit_event("cancelled", {"message": "Cancelled by user"})
                         return
-                    code = (ch.get("code") or "")[:2000]
+                    code = blob_reader(str(paths["chunks"].parent)).text(ch, 2000)
                     fp = ch.get("file_path", "")
                     if self.enrich:
                         prompt = (
@@ -50,6 +50,41 @@ def _last_index_timestamp_for_repo(base: Path, repo_name: str) -> str | None:
     return None
 
 
+def _repo_out_dir(repo: str) -> str:
+    try:
+        from common.config_loader import out_dir
+        return out_dir(repo)
+    except Exception:
+        return str(repo_root() / "out" / repo)
+
+
+def get_freshness(repo: str) -> Dict[str, Any]:
+    """Per-repo freshness for the ``freshness.status`` trace event.
+
+    Reads out/<repo>/last_index.json (BM25 time, dense catch-up time and the
+    number of chunks whose Qdrant points lag behind) and, when the file
+    watcher (``python -m indexer.watch``) runs, its watch_state.json (edits
+    seen but not yet indexed).
+    """
+    base = Path(_repo_out_dir(repo))
+    meta = _read_json(base / "last_index.json", {})
+    watch = _read_json(base / "watch_state.json", {})
+    return {
+        "bm25_updated": meta.get("timestamp"),
+        "dense_updated": meta.get("dense_timestamp") or (meta.get("timestamp") if meta.get("dense_mode") else None),
+        "dense_backlog": int(meta.get("dense_backlog") or 0),
+        "watch_backend": watch.get("backend"),
+        "watch_pending_files": int(watch.get("pending_files") or 0),
+        "watch_indexing": bool(watch.get("indexing")),
+    }
+
+
+def get_build_report(repo: str) -> Dict[str, Any]:
+    """Per-stage timings of the last ``index_repo`` run (out/<repo>/build_report.json)."""
+    from indexer.build_report import read_report
+    return read_report(_repo_out_dir(repo))
+
+
 def get_index_stats() -> Dict[str, Any]:
     """Gather comprehensive indexing statistics with storage calculator integration.
 
@@ -62,6 +97,9 @@ def get_index_stats() -> Dict[str, Any]:
     # Get embedding configuration
     embedding_type = os.getenv("EMBEDDING_TYPE", "openai").lower()
     embedding_dim = int(os.getenv("EMBEDDING_DIM", "3072" if embedding_type == "openai" else "512"))
+    # Quantization as built (last_index.json of the current repo), else the index-time knob
+    quantization = str(_read_json(Path(_repo_out_dir(os.getenv("REPO", "agro"))) / "last_index.json", {}).get("quantization")
+                       or os.getenv("QDRANT_QUANTIZATION", "none") or "none").lower()
 
     stats: Dict[str, Any] = {
         "timestamp": datetime.utcnow().isoformat() + 'Z',  # may be replaced below
@@ -71,7 +109,8 @@ def get_index_stats() -> Dict[str, Any]:
             "provider": embedding_type,
             "model": "text-embedding-3-large" if embedding_type == "openai" else f"local-{embedding_type}",
             "dimensions": embedding_dim,
-            "precision": "float32",
+            "precision": {"scalar": "int8", "binary": "binary"}.get(quantization, "float32"),
+            "quantization": quantization,
         },
         "keywords_count": 0,
         "storage_breakdown": {
@@ -80,6 +119,7 @@ def get_index_stats() -> Dict[str, Any]:
             "cards": 0,
             "embeddings_raw": 0,
             "qdrant_overhead": 0,
+            "qdrant_ram": 0,
             "reranker_cache": 0,
             "redis": 419430400,  # 400 MiB default
         },
@@ -101,6 +141,7 @@ def get_index_stats() -> Dict[str, Any]:
         stats["current_branch"] = "unknown"
 
     total_chunks = 0
+    total_tokens = 0
 
     # Index profiles to scan (shared, gui, devclean)
     base_paths = ["out.noindex-shared", "out.noindex-gui", "out.noindex-devclean"]
@@ -142,7 +183,24 @@ def get_index_stats() -> Dict[str, Any]:
                         repo_stats["chunk_count"] = cc
                         total_chunks += cc
                 except Exception:
-                    pass
+                    cc = 0
+                # The indexer records the summed token_count of the chunks;
+                # older indexes fall back to ~750 tokens per chunk.
+                try:
+                    with open(repo_dir / "last_index.json", 'r') as f:
+                        tc = json.load(f).get("token_count")
+                except Exception:
+                    tc = None
+                repo_stats["token_count"] = tc
+                total_tokens += int(tc) if tc is not None else cc * 750
+
+            # CHUNK_STORE=blob: chunk text lives in the file blobs, not chunks.jsonl.
+            blobs_dir = repo_dir / "blobs"
+            if blobs_dir.exists():
+                blob_size = sum(f.stat().st_size for f in blobs_dir.rglob('*') if f.is_file())
+                repo_stats["sizes"]["blobs"] = blob_size
+                stats["total_storage"] += blob_size
+                stats["storage_breakdown"]["chunks_json"] += blob_size
 
             if bm25_dir.exists():
                 bm25_size = sum(f.stat().st_size for f in bm25_dir.rglob('*') if f.is_file())
@@ -168,15 +226,23 @@ def get_index_stats() -> Dict[str, Any]:
         bytes_per_float = 4
         embeddings_raw = total_chunks * embedding_dim * bytes_per_float
         qdrant_overhead_multiplier = 1.5
-        qdrant_total = embeddings_raw * qdrant_overhead_multiplier
+        # Quantized collections keep int8 (1 byte/dim) or binary (1 bit/dim)
+        # codes + the HNSW graph in RAM; the float32 originals live on disk.
+        if quantization == "scalar":
+            searchable = total_chunks * embedding_dim
+        elif quantization == "binary":
+            searchable = total_chunks * ((embedding_dim + 7) // 8)
+        else:
+            searchable = embeddings_raw
+        qdrant_ram = searchable * qdrant_overhead_multiplier
+        qdrant_total = qdrant_ram + (embeddings_raw if searchable != embeddings_raw else 0)
         reranker_cache = embeddings_raw * 0.5
         stats["storage_breakdown"]["embeddings_raw"] = embeddings_raw
         stats["storage_breakdown"]["qdrant_overhead"] = int(qdrant_total - embeddings_raw)
+        stats["storage_breakdown"]["qdrant_ram"] = int(qdrant_ram)
         stats["storage_breakdown"]["reranker_cache"] = int(reranker_cache)
         stats["total_storage"] += qdrant_total + reranker_cache + stats["storage_breakdown"]["redis"]
         if embedding_type == "openai":
-            est_tokens_per_chunk = 750
-            total_tokens = total_chunks * est_tokens_per_chunk
             cost_per_million = 0.13
             embedding_cost = (total_tokens / 1_000_000) * cost_per_million
             stats["costs"]["total_tokens"] = total_tokens
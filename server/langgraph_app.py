@@ -8,6 +8,7 @@ from retrieval.hybrid_search import search_routed_multi as hybrid_search_routed_
 from server.tracing import get_trace
 from server.env_model import generate_text
 from server.index_stats import get_index_stats
+from common.tokens import stored_tokens
 
 # Load environment from repo root .env without hard-coded paths
 try:
@@ -51,15 +52,16 @@ def retrieve_node(state: RAGState) -> Dict:
     repo_used = (repo or (docs[0].get('repo') if docs else os.getenv('REPO','project')))
     # freshness snapshot (per-request)
     try:
-        from server.index_stats import get_index_stats
-        stats = get_index_stats()
         if tr is not None:
+            from server.index_stats import get_freshness
+            fresh = get_freshness(str(repo_used))
             tr.add('freshness.status', {
-                'bm25_updated': stats.get('timestamp'),
+                'bm25_updated': fresh.get('bm25_updated'),
                 'cards_updated': None,
-                'dense_updated_min': stats.get('timestamp'),
-                'dense_updated_max': stats.get('timestamp'),
-                'dense_backlog': 0,
+                'dense_updated_min': fresh.get('dense_updated'),
+                'dense_updated_max': fresh.get('dense_updated'),
+                'dense_backlog': fresh.get('dense_backlog', 0),
+                'watch_pending_files': fresh.get('watch_pending_files', 0),
                 'vector_backend': (os.getenv('VECTOR_BACKEND','qdrant') or 'qdrant'),
             })
     except Exception:
@@ -119,7 +121,7 @@ def generate_node(state: RAGState) -> Dict:
                 sel = {
                     'path': d.get('file_path'),
                     'lines': f"L{d.get('start_line')}-L{d.get('end_line')}",
-                    'est_tokens': int(len((d.get('code') or ''))/4),
+                    'est_tokens': stored_tokens(d),
                     'reason': ['high_rerank']
                 }
                 selected.append(sel)
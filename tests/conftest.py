@@ -0,0 +1,79 @@
+"""Shared fixtures: a tiny repo indexed by index_repo into in-memory Qdrant"""
+import hashlib
+import importlib
+import json
+
+import numpy as np
+import pytest
+
+REPO = "itest"
+DIM = 8
+
+
+class IndexEnv:
+    """One configured repo; ``run()`` is an ``index_repo.main()`` call."""
+
+    def __init__(self, ir, client, src, out):
+        self.ir = ir
+        self.client = client
+        self.src = src
+        self.out = out
+        self.embedded = []  # chunk ids sent to the embedder, per run
+        self.fail_after = None  # raise once this many batches were embedded
+
+    def run(self, changed_paths=None):
+        self.embedded.append([])
+        self.ir.main(changed_paths)
+        return self.embedded[-1]
+
+    def manifest(self):
+        with open(self.out / "manifest.json") as f:
+            return json.load(f)
+
+    def chunks(self):
+        with open(self.out / "chunks.jsonl") as f:
+            return [json.loads(line) for line in f]
+
+    def collections(self):
+        return sorted(c.name for c in self.client.get_collections().collections)
+
+
+def fake_vector(code):
+    v = np.frombuffer(hashlib.sha256(code.encode()).digest()[:DIM], dtype=np.uint8).astype(np.float32) + 1
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def index_env(tmp_path, monkeypatch):
+    qdrant_client = pytest.importorskip("qdrant_client")
+    src = tmp_path / "src"
+    src.mkdir()
+    repos = tmp_path / "repos.json"
+    repos.write_text(json.dumps({"default_repo": REPO, "repos": [{"name": REPO, "path": str(src)}]}))
+    for k, v in {"REPOS_FILE": str(repos), "OUT_DIR_BASE": str(tmp_path / "out"), "REPO": REPO,
+                 "EMBEDDING_TYPE": "local", "INDEX_WORKERS": "1", "DENSE_CHECKPOINT_SECS": "0",
+                 "EMBED_STREAM_BATCH": "2", "QDRANT_VERIFY_SECS": "5"}.items():
+        monkeypatch.setenv(k, v)
+    for k in ("SKIP_DENSE", "FULL_REINDEX", "COLLECTION_NAME", "INDEX_SHARDS", "GIT_DIFF_INDEX", "NEAR_DUP",
+              "CHUNK_HIERARCHY", "CHUNK_STORE", "QDRANT_QUANTIZATION", "QDRANT_SPARSE", "QDRANT_KEEP_VERSIONS",
+              "QDRANT_SHARD_NUMBER", "EMBED_PREFIX_DIM", "TREE_CACHE_FILES", "CHUNK_TOKENS"):
+        monkeypatch.delenv(k, raising=False)
+    from common import config_loader
+    monkeypatch.setattr(config_loader, "_CACHE", {})
+    import indexer.index_repo
+    ir = importlib.reload(indexer.index_repo)  # rebinds REPO / OUTDIR / COLLECTION
+    client = qdrant_client.QdrantClient(":memory:")
+    env = IndexEnv(ir, client, src, tmp_path / "out" / REPO)
+
+    def embed(chunks, cache=None):
+        if env.fail_after is not None and env.fail_after <= 0:
+            raise RuntimeError("embedding service went away")
+        if env.fail_after is not None:
+            env.fail_after -= 1
+        env.embedded[-1].extend(str(c["id"]) for c in chunks)
+        return np.stack([fake_vector(c["code"]) for c in chunks]) if chunks else np.zeros((0, DIM), np.float32)
+
+    monkeypatch.setattr(ir, "make_client", lambda url=None, **kw: client)
+    monkeypatch.setattr(ir, "_embed_chunks", embed)
+    yield env
+    config_loader._CACHE.clear()
@@ -0,0 +1,76 @@
+"""Parse-once chunking and cached parsers (retrieval/ast_chunker.py)"""
+import threading
+
+import pytest
+
+from retrieval import ast_chunker
+from retrieval.ast_chunker import chunk_code, extract_imports
+
+pytest.importorskip("tree_sitter_languages")
+
+SRC = "# répertoire: données\nimport os\nfrom typing import List\n\n" + "\n\n".join(
+    f"def f{i}(x: List[int]) -> int:\n    return len(x) + {i}\n" for i in range(40)) + "\n\nimport json\n"
+
+
+class _Counting:
+    def __init__(self, inner, calls):
+        self.inner, self.calls = inner, calls
+
+    def parse(self, *a):
+        self.calls["parse"] += 1
+        return self.inner.parse(*a)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.delenv("TREE_CACHE_FILES", raising=False)
+    monkeypatch.delenv("CHUNK_HIERARCHY", raising=False)
+    monkeypatch.setattr(ast_chunker, "_TLS", threading.local())
+    real = ast_chunker._ts_get_parser
+    counts = {"get": 0, "parse": 0}
+
+    def get_parser(lang):
+        counts["get"] += 1
+        return _Counting(real(lang), counts)
+
+    monkeypatch.setattr(ast_chunker, "_ts_get_parser", get_parser)
+    return counts
+
+
+def test_each_file_is_parsed_once(calls):
+    """40 functions cost one parse, and the parser is built once per language"""
+    chunks = chunk_code(SRC, "/src/m.py", "python", tokens=0)
+    assert len(chunks) == 40
+    assert calls == {"get": 1, "parse": 1}
+    chunk_code(SRC, "/src/n.py", "python", tokens=0)
+    assert calls == {"get": 1, "parse": 2}
+
+
+def test_parsers_are_cached_per_thread(calls):
+    """Each thread builds its own parser (tree-sitter parsers are not thread-safe)"""
+    mine = ast_chunker._parser("python")
+    assert ast_chunker._parser("python") is mine
+    seen = []
+    t = threading.Thread(target=lambda: seen.append(ast_chunker._parser("python")))
+    t.start()
+    t.join()
+    assert seen[0] is not mine
+    assert calls["get"] == 2
+
+
+def test_imports_come_from_the_same_walk(calls):
+    """Every chunk carries the file's imports, sliced correctly after non-ASCII text"""
+    want = ["import os", "from typing import List", "import json"]
+    assert extract_imports(SRC, "python") == want
+    assert all(c["imports"] == want for c in chunk_code(SRC, "/src/m.py", "python", tokens=0))
+
+
+def test_flat_chunks_pass_through_parent_expansion(calls, tmp_path, monkeypatch):
+    """Without CHUNK_HIERARCHY there are no parent ids, so hits are returned as-is"""
+    import retrieval.hybrid_search as hs
+    monkeypatch.setenv("OUT_DIR_BASE", str(tmp_path))  # no parents.jsonl anywhere
+    monkeypatch.setenv("HYDRATION_PARENT", "always")
+    docs = chunk_code(SRC, "/src/m.py", "python", tokens=0)[:5]
+    assert not any(c.get("parent_id") for c in docs)
+    before = [dict(d) for d in docs]
+    assert hs._expand_parents("flat", docs) == before
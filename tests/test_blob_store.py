@@ -0,0 +1,63 @@
+"""Offset-based chunk storage (common/blob_store.py)"""
+import hashlib
+import os
+
+from common.blob_store import BlobReader, attach_offsets, blobs_dir, gc_blobs, put_blob, strip_code
+from retrieval.ast_chunker import chunk_code
+
+SRC = '''"""Greeting helpers — naïve ünïcödé on purpose."""
+
+
+def greet(name):
+    return f"héllo, {name}"
+
+
+class Shouter:
+    def shout(self, text):
+        return text.upper() + "!"
+'''
+
+
+def _store(tmp_path, chunks, text=SRC):
+    data = text.encode("utf-8")
+    h = hashlib.sha1(data).hexdigest()
+    n = attach_offsets(chunks, data, h)
+    put_blob(blobs_dir(str(tmp_path)), data, h)
+    return h, n
+
+
+def test_offsets_round_trip_through_the_blob(tmp_path):
+    """Stripped rows read back byte-identical code, non-ASCII included"""
+    chunks = chunk_code(SRC, "/src/greet.py", "python")
+    h, n = _store(tmp_path, chunks)
+    assert n == len(chunks)
+    rows = [strip_code(dict(c)) for c in chunks]
+    assert all("code" not in r and r["blob"] == h for r in rows)
+
+    rd = BlobReader(str(tmp_path), max_open=1)
+    assert [rd.hydrate(r)["code"] for r in rows] == [c["code"] for c in chunks]
+    assert rd.text(strip_code(dict(chunks[0])), max_chars=5) == chunks[0]["code"][:5]
+
+
+def test_rows_that_are_not_a_slice_keep_their_code(tmp_path):
+    """Non-slices stay inline; a wrong start_line falls back to a search"""
+    chunks = [{"code": "def greet(name): ...", "start_line": 4},
+              {"code": "    return f\"héllo, {name}\"", "start_line": 99}]
+    _h, n = _store(tmp_path, chunks)
+    assert n == 1
+    assert "blob" not in chunks[0] and strip_code(chunks[0]) is chunks[0]
+    start, end = chunks[1]["byte_range"]
+    assert SRC.encode("utf-8")[start:end].decode("utf-8") == chunks[1]["code"]
+
+
+def test_put_blob_is_idempotent_and_gc_removes_unreferenced(tmp_path):
+    """Blobs are stored once and collected when no chunk refers to them"""
+    root = blobs_dir(str(tmp_path))
+    a = put_blob(root, b"alpha")
+    assert put_blob(root, b"alpha") == a
+    b = put_blob(root, b"beta")
+    assert gc_blobs(str(tmp_path), {a}) == 1
+    assert os.path.exists(os.path.join(root, a[:2], a))
+    assert not os.path.exists(os.path.join(root, b[:2], b))
+    assert gc_blobs(str(tmp_path), set()) == 1
+    assert not os.path.exists(root)
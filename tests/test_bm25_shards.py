@@ -0,0 +1,76 @@
+"""BM25 shard merging (INDEX_SHARDS builds)"""
+import json
+import os
+
+import bm25s
+import pytest
+from bm25s.tokenization import Tokenizer
+from Stemmer import Stemmer
+
+from indexer.bm25_shards import shard_mode
+from indexer.bm25_stream import build_bm25_streaming
+import retrieval.hybrid_search as hs
+
+REPO = "stest"
+# Every document has four tokens, so avgdl is the same in each shard and
+# overall; only the IDF differs between a shard and the whole corpus.
+SHARDS = {
+    "small": ["cache alpha beta gamma", "delta alpha beta gamma", "omega alpha beta gamma"],
+    "large": ["cache eviction policy lru", "cache eviction policy fifo", "cache warm start path",
+              "cache cold start path", "cache layer store disk", "router table entry path",
+              "router table entry name", "queue worker pool size", "queue worker pool name"],
+}
+
+
+def _write_shards(root):
+    os.makedirs(root)
+    for name, docs in SHARDS.items():
+        d = os.path.join(root, name)
+        build_bm25_streaming(lambda docs=docs: iter(docs), d)
+        with open(os.path.join(d, "chunk_ids.txt"), "w") as f:
+            f.write("".join(f"{name}:{i}\n" for i in range(len(docs))))
+    with open(os.path.join(root, "shards.json"), "w") as f:
+        json.dump({"mode": "dir", "shards": {n: {"chunks": len(d)} for n, d in SHARDS.items()}}, f)
+
+
+def _unsharded(query):
+    docs = [d for ds in SHARDS.values() for d in ds]
+    ids = [f"{n}:{i}" for n, ds in SHARDS.items() for i in range(len(ds))]
+    tok = Tokenizer(stemmer=Stemmer("english"), stopwords="en")
+    retriever = bm25s.BM25(method="lucene", k1=1.2, b=0.65)
+    retriever.index(tok.tokenize(docs, show_progress=False), show_progress=False)
+    q = tok.tokenize([query], update_vocab=False, show_progress=False)
+    res, scores = retriever.retrieve(q, k=len(docs), show_progress=False)
+    return {ids[int(i)]: float(s) for i, s in zip(res[0], scores[0]) if s > 0}
+
+
+def test_shard_scores_use_corpus_wide_idf(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUT_DIR_BASE", str(tmp_path))
+    _write_shards(str(tmp_path / REPO / "bm25_shards"))
+    for query in ("cache eviction", "cache", "path start"):
+        hits = hs._sparse_from_shards(REPO, query, 20)
+        assert {cid: score for score, cid in hits} == pytest.approx(_unsharded(query), rel=1e-4)
+
+
+def test_rare_term_in_small_shard_does_not_outscore(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUT_DIR_BASE", str(tmp_path))
+    _write_shards(str(tmp_path / REPO / "bm25_shards"))
+    # "cache" is rare in the small shard but common overall; a cache-only
+    # document must score the same whichever shard holds it.
+    scores = {cid: score for score, cid in hs._sparse_from_shards(REPO, "cache eviction", 20)}
+    assert scores["small:0"] == pytest.approx(scores["large:2"], rel=1e-4)
+    assert scores["large:0"] > scores["small:0"]
+
+
+@pytest.mark.parametrize("env, recorded, want", [
+    ("", None, None),
+    ("", "dir", "dir"),
+    ("", "hash:4", "hash:4"),
+    ("hash:8", "dir", "hash:8"),
+    ("off", "dir", None),
+    ("hash:1", None, None),
+])
+def test_shard_mode_keeps_the_recorded_layout(monkeypatch, env, recorded, want):
+    """Without INDEX_SHARDS a build keeps the layout of the last one"""
+    monkeypatch.setenv("INDEX_SHARDS", env)
+    assert shard_mode(recorded) == want
@@ -0,0 +1,51 @@
+"""BM25 as Qdrant sparse vectors (retrieval/bm25_sparse.py)"""
+import math
+import zlib
+
+import bm25s
+import pytest
+from bm25s.tokenization import Tokenizer
+from Stemmer import Stemmer
+
+from retrieval.bm25_sparse import K1, doc_vectors, query_vector
+
+DOCS = ["def load_config(path): return parse(open(path).read())",
+        "class ConfigError(Exception): pass",
+        "def retry(fn, attempts=3): return fn() if attempts else None",
+        "configs loaded from the config path are cached"]
+
+
+def test_term_ids_are_crc32_of_stemmed_tokens():
+    """Ids need no shared vocabulary: crc32 of the stemmed term"""
+    idx, vals = query_vector("Loading configs")
+    assert idx == sorted(zlib.crc32(t.encode()) for t in ("load", "config"))
+    assert vals == [1.0, 1.0]
+    assert query_vector("config config")[1] == [2.0]
+
+
+def test_dot_product_with_idf_is_the_bm25s_score():
+    """Query . document, weighted by Qdrant's IDF modifier, ranks like bm25s (lucene)"""
+    tok = Tokenizer(stemmer=Stemmer("english"), stopwords="en")
+    tokens = tok.tokenize(DOCS, return_as="string", show_progress=False)
+    avgdl = sum(len(t) for t in tokens) / len(DOCS)
+    docs = doc_vectors(DOCS, avgdl)
+    df = {}
+    for idx, _vals in docs:
+        for i in idx:
+            df[i] = df.get(i, 0) + 1
+
+    retriever = bm25s.BM25(method="lucene", k1=1.2, b=0.65)
+    retriever.index(tok.tokenize(DOCS, show_progress=False), show_progress=False)
+    for query in ("config path", "retry attempts", "load config error"):
+        q = dict(zip(*query_vector(query)))
+        got = []
+        for idx, vals in docs:
+            got.append(sum(q[i] * v * math.log(1 + (len(DOCS) - df[i] + 0.5) / (df[i] + 0.5))
+                           for i, v in zip(idx, vals) if i in q))
+        ids = tok.tokenize([query], update_vocab=False, show_progress=False)
+        res, scores = retriever.retrieve(ids, k=len(DOCS), show_progress=False)
+        want = [0.0] * len(DOCS)
+        for i, s in zip(res[0], scores[0]):
+            # bm25s drops the constant (k1 + 1) numerator of the tf part.
+            want[int(i)] = float(s) * (K1 + 1)
+        assert got == pytest.approx(want, rel=1e-5, abs=1e-6)
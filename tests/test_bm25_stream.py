@@ -0,0 +1,56 @@
+"""Streaming BM25 build (indexer/bm25_stream.py)"""
+import os
+
+import bm25s
+import pytest
+from bm25s.tokenization import Tokenizer
+from Stemmer import Stemmer
+
+from indexer.bm25_stream import build_bm25_streaming
+
+DOCS = ["def parse_config(path): return yaml.load(open(path))",
+        "class RetryPolicy: max_attempts = 5",
+        "def retry(fn, policy): return fn()",
+        "SELECT id FROM users WHERE email = ?",
+        ""]
+
+
+def _in_memory_scores(query):
+    tok = Tokenizer(stemmer=Stemmer("english"), stopwords="en")
+    retriever = bm25s.BM25(method="lucene", k1=1.2, b=0.65)
+    retriever.index(tok.tokenize(DOCS, show_progress=False), show_progress=False)
+    q = tok.tokenize([query], update_vocab=False, show_progress=False)
+    res, scores = retriever.retrieve(q, k=len(DOCS), show_progress=False)
+    return {int(i): float(s) for i, s in zip(res[0], scores[0]) if s > 0}
+
+
+def _load(index_dir):
+    retriever = bm25s.BM25.load(index_dir)
+    tok = Tokenizer(stemmer=Stemmer("english"), stopwords="en")
+    tok.load_vocab(index_dir)
+    return retriever, tok
+
+
+def test_streaming_build_matches_in_memory_index(tmp_path):
+    """Scores equal an index built from the whole corpus in memory"""
+    d = str(tmp_path / "idx")
+    n, avgdl = build_bm25_streaming(lambda: iter(DOCS), d)
+    assert n == len(DOCS)
+    assert avgdl > 0
+    assert not os.path.exists(os.path.join(d, "tokens.tmp.bin"))
+
+    retriever, tok = _load(d)
+    for query in ("retry policy", "parse config path", "users email"):
+        q = tok.tokenize([query], update_vocab=False, show_progress=False)
+        res, scores = retriever.retrieve(q, k=len(DOCS), show_progress=False)
+        got = {int(i): float(s) for i, s in zip(res[0], scores[0]) if s > 0}
+        assert got == pytest.approx(_in_memory_scores(query), rel=1e-5)
+
+
+def test_save_corpus_false_drops_the_corpus_copy(tmp_path):
+    """The index loads without the corpus copy search never reads"""
+    d = str(tmp_path / "idx")
+    build_bm25_streaming(lambda: iter(DOCS), d, save_corpus=False)
+    assert not os.path.exists(os.path.join(d, "corpus.jsonl"))
+    retriever, _tok = _load(d)
+    assert retriever.scores["num_docs"] == len(DOCS)
@@ -0,0 +1,48 @@
+"""Build checkpoints: embedding cache flushes and the dense backlog"""
+import numpy as np
+
+from indexer.manifest import dense_backlog, empty_manifest
+from retrieval.embed_cache import EmbeddingCache
+
+
+def _vec(x):
+    return np.array([x, x + 1], dtype=np.float32)
+
+
+def test_flush_appends_new_vectors_only(tmp_path):
+    """Vectors flushed before a crash are there on the next run"""
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("a", _vec(1))
+    cache.flush()
+    cache.put("a", _vec(1))
+    cache.put("b", _vec(2))
+    cache.flush()
+    cache.flush()
+    lines = open(cache.path).read().splitlines()
+    assert len(lines) == 2
+
+    with open(cache.path, "a") as f:
+        f.write('{"hash": "c", "vec": [3.0')  # torn write from the crash
+    again = EmbeddingCache(str(tmp_path))
+    assert sorted(again.cache) == ["a", "b"]
+    np.testing.assert_array_equal(again.get("b"), _vec(2))
+
+
+def test_prune_rewrites_the_file(tmp_path):
+    """Pruning drops vectors of chunks that no longer exist, on disk too"""
+    cache = EmbeddingCache(str(tmp_path))
+    for h in "abc":
+        cache.put(h, _vec(ord(h)))
+    cache.flush()
+    assert cache.prune({"a", "c"}) == 1
+    assert sorted(EmbeddingCache(str(tmp_path)).cache) == ["a", "c"]
+
+
+def test_dense_backlog_counts_unsynced_chunks():
+    """Chunks of files without the dense flag plus pending deletes"""
+    m = empty_manifest()
+    m["files"] = {"/a.py": {"chunks": [["a1", "h1"], ["a2", "h2"]], "dense": True},
+                  "/b.py": {"chunks": [["b1", "h3"]], "dense": False},
+                  "/c.py": {"chunks": [["c1", "h4"], ["c2", "h5"]]}}
+    m["dense_pending_deletes"] = ["old1", "old2"]
+    assert dense_backlog(m) == 5
@@ -0,0 +1,84 @@
+"""Parallel ingestion stage (indexer/chunk_pool.py)"""
+import hashlib
+
+from indexer.chunk_pool import MAX_AVG_LINE, content_skip_reason, ingest_file, iter_ingested_files
+
+SRC = "def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n"
+
+
+def test_ingest_file_hashes_and_chunks(tmp_path):
+    """The sha is of the raw bytes; chunks see normalized newlines"""
+    fp = tmp_path / "m.py"
+    fp.write_bytes(SRC.replace("\n", "\r\n").encode())
+    rec = ingest_file(str(fp))
+    assert rec["skip"] is None
+    assert rec["sha1"] == hashlib.sha1(fp.read_bytes()).hexdigest()
+    assert rec["chunks"] and all("\r" not in c["code"] for c in rec["chunks"])
+    assert "def add" in "".join(c["code"] for c in rec["chunks"])
+    assert all(c["hash"] == hashlib.md5(c["code"].encode()).hexdigest() for c in rec["chunks"])
+
+
+def test_ingest_file_skips_unchanged_and_unknown(tmp_path):
+    """A matching sha is reported unchanged without chunking"""
+    fp = tmp_path / "m.py"
+    fp.write_text(SRC)
+    rec = ingest_file(str(fp), expected_sha=hashlib.sha1(SRC.encode()).hexdigest())
+    assert rec["unchanged"] and rec["chunks"] == []
+    assert ingest_file(str(tmp_path / "notes.unknownext"))["skip"] == "language"
+    assert ingest_file(str(tmp_path / "missing.py"))["skip"] == "unreadable"
+
+
+def test_content_skip_reason():
+    """Minified one-liners are skipped"""
+    assert content_skip_reason(SRC) is None
+    assert content_skip_reason("x" * (MAX_AVG_LINE + 1)) == "long_lines"
+
+
+def test_iter_ingested_files_keeps_input_order(tmp_path):
+    """Records come back in input order from the process pool"""
+    items = []
+    for i in range(12):
+        fp = tmp_path / f"f{i}.py"
+        fp.write_text(f"def f{i}():\n    return {i}\n" * (i + 1))
+        items.append((str(fp), None))
+    recs = list(iter_ingested_files(items, workers=2))
+    assert [r["path"] for r in recs] == [fp for fp, _ in items]
+    serial = list(iter_ingested_files(items, workers=1))
+    assert [r["chunks"] for r in recs] == [r["chunks"] for r in serial]
+
+
+def test_large_files_are_mmapped_with_the_same_result(tmp_path, monkeypatch):
+    """The mmap path yields the same record as a plain read"""
+    import indexer.chunk_pool as cp
+    fp = tmp_path / "m.py"
+    fp.write_bytes(("# MIT License\r\n" + SRC).replace("\n", "\r\n").encode())
+    plain = ingest_file(str(fp))
+    monkeypatch.setattr(cp, "MMAP_MIN_BYTES", 1)
+    mapped = ingest_file(str(fp))
+    for k in ("sha1", "skip", "head", "chunks", "bytes"):
+        assert mapped[k] == plain[k]
+    assert mapped["head"].startswith("# MIT License\n")
+    sha = plain["sha1"]
+    assert ingest_file(str(fp), expected_sha=sha)["unchanged"]
+
+
+def test_indexer_opens_each_source_file_once(index_env, monkeypatch):
+    """Vetting, chunking and the license sniff share one read; short files still get tagged"""
+    import builtins
+    vendored = index_env.src / "lib.py"
+    vendored.write_text("# Licensed under the MIT License\ndef f(x):\n    return x\n")
+    mine = index_env.src / "app.py"
+    mine.write_text(SRC)
+    opened = {}
+    real_open = builtins.open
+
+    def counting_open(file, *a, **kw):
+        opened[str(file)] = opened.get(str(file), 0) + 1
+        return real_open(file, *a, **kw)
+
+    monkeypatch.setattr(builtins, "open", counting_open)
+    index_env.run()
+    monkeypatch.setattr(builtins, "open", real_open)
+    assert opened[str(vendored)] == opened[str(mine)] == 1
+    origin = {c["file_path"]: c["origin"] for c in index_env.chunks()}
+    assert origin == {str(vendored): "vendor", str(mine): "first_party"}
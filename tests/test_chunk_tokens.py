@@ -0,0 +1,55 @@
+"""Token-budget chunk sizing (common/tokens.py, retrieval/ast_chunker.py)"""
+import pytest
+
+from common.tokens import LIMIT_SHARE, chunk_token_budget, count_tokens, embed_token_limit, stored_tokens
+from retrieval.ast_chunker import _split_to_budget, chunk_code
+
+
+def _big_function(n):
+    body = "\n".join(f"    total += compute_value(items[{i}], weight={i}, scale=factor)" for i in range(n))
+    return f"def accumulate(items, factor):\n    total = 0\n{body}\n    return total\n"
+
+
+@pytest.mark.parametrize("env, etype, want", [
+    ("", "openai", 400),
+    ("", "local", int(512 * LIMIT_SHARE)),
+    ("2000", "local", int(512 * LIMIT_SHARE)),
+    ("2000", "voyage", 2000),
+    ("0", "openai", 0),
+    ("junk", "openai", 400),
+])
+def test_chunk_token_budget(monkeypatch, env, etype, want):
+    """CHUNK_TOKENS is capped by the model limit; 0 switches to characters"""
+    monkeypatch.setenv("CHUNK_TOKENS", env)
+    assert chunk_token_budget(etype) == want
+
+
+def test_embed_token_limit_defaults_to_openai(monkeypatch):
+    """Unset or unknown EMBEDDING_TYPE uses the OpenAI limit"""
+    monkeypatch.delenv("EMBEDDING_TYPE", raising=False)
+    assert embed_token_limit() == embed_token_limit("openai") == embed_token_limit("unknown")
+
+
+def test_split_to_budget_keeps_lines_and_order():
+    """An oversized chunk splits into consecutive, in-budget line ranges"""
+    c = {"id": "c1", "start_line": 10, "end_line": 0, "code": _big_function(60), "type": "unit"}
+    parts = _split_to_budget(c, 80)
+    assert len(parts) > 1
+    assert "\n".join(p["code"] for p in parts) == c["code"]
+    assert all(count_tokens(p["code"]) <= 80 for p in parts)
+    assert parts[0]["start_line"] == 10
+    for a, b in zip(parts, parts[1:]):
+        assert b["start_line"] == a["end_line"] + 1
+    assert len({p["id"] for p in parts}) == len(parts)
+
+
+@pytest.mark.parametrize("hierarchy", [False, True])
+def test_chunks_fit_the_budget(hierarchy):
+    """Every non-parent chunk fits, and token_count is stored"""
+    src = _big_function(120) + "\n\ndef small():\n    return 1\n"
+    chunks = chunk_code(src, "/src/acc.py", "python", hierarchy=hierarchy, tokens=100)
+    units = [c for c in chunks if c.get("type") != "parent"]
+    assert len(units) > 1
+    assert all(c["token_count"] <= 100 for c in units)
+    assert all(stored_tokens(c) == count_tokens(c["code"]) for c in chunks)
+    assert "def small" in "".join(c["code"] for c in units)
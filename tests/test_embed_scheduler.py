@@ -0,0 +1,110 @@
+"""Concurrent embedding scheduler (retrieval/embed_scheduler.py)"""
+import base64
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from retrieval.embed_scheduler import (RateBudget, embed_batches, embed_texts_scheduled, openai_embed_call,
+                                       retry_delay)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after_ms="20"):
+        super().__init__("429")
+        self.status_code = 429
+        self.response = SimpleNamespace(headers={"retry-after-ms": retry_after_ms})
+
+
+def _vec(text):
+    return [float(len(text)), float(text.count("x"))]
+
+
+def test_results_keep_input_order():
+    """Batches finishing out of order still come back in input order"""
+    def call(batch):
+        time.sleep(random.random() * 0.02)
+        return [_vec(t) for t in batch]
+
+    texts = ["x" * (i % 7) + "y" * i for i in range(50)]
+    out = embed_texts_scheduled(texts, call, batch=4, concurrency=8)
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(out, np.asarray([_vec(t) for t in texts], dtype=np.float32))
+
+
+def test_429_is_retried_and_pauses_every_worker():
+    """A 429 is retried after Retry-After and pauses the shared budget"""
+    calls = {}
+    lock = threading.Lock()
+    budget = RateBudget()
+    paused = []
+    real_pause = budget.pause
+    budget.pause = lambda secs: (paused.append(secs), real_pause(secs))
+
+    def call(batch):
+        with lock:
+            calls[batch[0]] = calls.get(batch[0], 0) + 1
+            first = calls[batch[0]] == 1
+        if first and batch[0] in ("b", "d"):
+            raise RateLimited()
+        return [_vec(t) for t in batch]
+
+    out = embed_batches([["a"], ["b"], ["c"], ["d"]], call, concurrency=2, budget=budget, max_retries=2)
+    assert out == [[_vec("a")], [_vec("b")], [_vec("c")], [_vec("d")]]
+    assert calls == {"a": 1, "b": 2, "c": 1, "d": 2}
+    assert paused == [pytest.approx(0.02)] * 2
+
+
+def test_non_transient_errors_and_exhausted_retries_raise():
+    """Client errors fail at once; retries are bounded"""
+    def bad_request(batch):
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        embed_batches([["a"], ["b"]], bad_request, concurrency=2, budget=RateBudget())
+
+    n = []
+
+    def always_429(batch):
+        n.append(1)
+        raise RateLimited("1")
+
+    with pytest.raises(RateLimited):
+        embed_batches([["a"]], always_429, budget=RateBudget(), max_retries=2)
+    assert len(n) == 3
+
+
+def test_wrong_vector_count_is_an_error():
+    """A short response never misaligns vectors and texts"""
+    with pytest.raises(RuntimeError):
+        embed_batches([["a", "b"]], lambda batch: [_vec("a")], budget=RateBudget())
+
+
+def test_retry_delay_classification():
+    """429 honours Retry-After; 5xx backs off; 4xx is not retried"""
+    assert retry_delay(RateLimited("1500"), 0) == pytest.approx(1.5)
+    server = Exception("boom")
+    server.status_code = 503
+    assert 0 < retry_delay(server, 3) <= 4.0
+    client = Exception("nope")
+    client.status_code = 400
+    assert retry_delay(client, 0) is None
+
+
+def test_openai_call_decodes_base64_in_index_order():
+    """Base64 float32 vectors are decoded and sorted by index"""
+    vecs = {0: np.array([1, 2], dtype="<f4"), 1: np.array([3, 4], dtype="<f4")}
+    data = [SimpleNamespace(index=i, embedding=base64.b64encode(vecs[i].tobytes()).decode()) for i in (1, 0)]
+    seen = {}
+
+    def create(**kw):
+        seen.update(kw)
+        return SimpleNamespace(data=data)
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    out = openai_embed_call(client, "m")(["a", "b"])
+    np.testing.assert_array_equal(out, np.stack([vecs[0], vecs[1]]))
+    assert seen["encoding_format"] == "base64"
@@ -0,0 +1,65 @@
+"""Embeddings as float32 matrices end to end (index_repo, embed_cache)"""
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import retrieval.embed_cache as ec
+from indexer.qdrant_upload import BulkUploader
+
+
+def test_renorm_truncate_is_one_matrix_op(index_env):
+    """Rows are truncated and re-normalized into a contiguous float32 matrix"""
+    rt = index_env.ir._renorm_truncate
+    v = np.array([[3.0, 4.0, 12.0], [0.0, 0.0, 5.0], [1.0, 1.0, 1.0]], dtype=np.float64)
+    out = rt(v, 2)
+    assert out.dtype == np.float32 and out.flags["C_CONTIGUOUS"] and out.shape == (3, 2)
+    assert out.ravel().tolist() == pytest.approx([0.6, 0.8, 0.0, 0.0, 2 ** -0.5, 2 ** -0.5])  # zero rows stay zero
+    full = rt(v, 0)
+    assert full.shape == (3, 3)
+    assert np.linalg.norm(full, axis=1) == pytest.approx([1.0, 1.0, 1.0])
+    assert rt(v, 8).shape == (3, 3)
+    assert rt(np.zeros((0, 4), np.float32), 2).shape == (0, 4)
+
+
+def test_embedding_cache_fills_one_float32_matrix(tmp_path, monkeypatch):
+    """Hits and misses land in one matrix; only misses are embedded; JSON only on save"""
+    calls = []
+
+    def scheduled(texts, call, batch, costs):
+        calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(ec, "embed_texts_scheduled", scheduled)
+    monkeypatch.setattr(ec, "clip_tokens", lambda texts, enc, counts=None: (list(texts), [1] * len(texts)))
+    monkeypatch.setattr(ec, "tiktoken", SimpleNamespace(get_encoding=lambda name: None))
+    cache = ec.EmbeddingCache(str(tmp_path))
+    cache.put("h1", np.array([9.0, 9.0], dtype=np.float32))
+    embs = cache.embed_texts(None, ["aa", "bbb", "c"], ["h1", "h2", "h3"])
+    assert embs.dtype == np.float32 and embs.shape == (3, 2)
+    assert embs.tolist() == [[9.0, 9.0], [3.0, 1.0], [1.0, 1.0]]
+    assert calls == [["bbb", "c"]]
+    assert isinstance(cache.get("h2"), np.ndarray)
+
+    cache.save()
+    with open(tmp_path / "embed_cache.jsonl") as f:
+        assert {json.loads(line)["hash"] for line in f} == {"h1", "h2", "h3"}
+    again = ec.EmbeddingCache(str(tmp_path))
+    assert again.get("h2").dtype == np.float32 and again.get("h2").tolist() == [3.0, 1.0]
+
+
+def test_indexer_hands_float32_matrices_to_the_uploader(index_env, monkeypatch):
+    """The embedder's matrix reaches BulkUploader.add without becoming lists"""
+    seen = []
+    real_add = BulkUploader.add
+
+    def add(self, ids, vectors, payloads, sparse=None, named=None):
+        seen.append(vectors)
+        return real_add(self, ids, vectors, payloads, sparse, named)
+
+    monkeypatch.setattr(BulkUploader, "add", add)
+    (index_env.src / "m.py").write_text("def f(x):\n    return x\n\n\ndef g(y):\n    return y\n")
+    index_env.run()
+    assert seen and all(isinstance(v, np.ndarray) and v.dtype == np.float32 and v.ndim == 2 for v in seen)
+    assert sum(len(v) for v in seen) == len(index_env.chunks())
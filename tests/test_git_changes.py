@@ -0,0 +1,76 @@
+"""Git-diff change detection (indexer/git_changes.py)"""
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from indexer.git_changes import _name_status_paths, changed_since, snapshot
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    _git(root, "init", "-q")
+    _git(root, "config", "user.email", "t@example.com")
+    _git(root, "config", "user.name", "t")
+    _write(root / "top.py", "x = 1\n")
+    _write(root / "svc" / "a.py", "a = 1\n")
+    _write(root / "svc" / "b.py", "b = 1\n")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-qm", "init")
+    return root
+
+
+def test_name_status_paths_keeps_both_rename_paths():
+    """Renames and copies report the old and the new path"""
+    out = "M\0a.py\0R100\0old/b.py\0new/b.py\0C75\0c.py\0c2.py\0D\0gone.py\0"
+    assert _name_status_paths(out) == ["a.py", "old/b.py", "new/b.py", "c.py", "c2.py", "gone.py"]
+
+
+def test_changed_since_covers_commits_edits_and_untracked(repo):
+    """Committed, staged and untracked changes since the snapshot"""
+    state = snapshot(str(repo))
+    _write(repo / "svc" / "a.py", "a = 2\n")
+    _git(repo, "commit", "-qam", "edit a")
+    _git(repo, "mv", "svc/b.py", "svc/b2.py")
+    _write(repo / "svc" / "new.py", "n = 1\n")
+
+    got = changed_since(str(repo), state)
+    assert got == {os.path.join(str(repo), p) for p in ("svc/a.py", "svc/b.py", "svc/b2.py", "svc/new.py")}
+
+
+def test_changed_since_in_a_subdirectory(repo):
+    """Paths outside the indexed subdirectory are dropped, the rest joined onto it"""
+    base = str(repo / "svc")
+    state = snapshot(base)
+    _write(repo / "top.py", "x = 2\n")
+    _write(repo / "svc" / "a.py", "a = 3\n")
+    assert changed_since(base, state) == {os.path.join(base, "a.py")}
+
+
+def test_previously_dirty_paths_are_rechecked(repo):
+    """A dirty file indexed last time is re-read even after it was reverted"""
+    _write(repo / "top.py", "x = 9\n")
+    state = snapshot(str(repo))
+    assert state["dirty"] == ["top.py"]
+    _git(repo, "checkout", "--", "top.py")
+    assert changed_since(str(repo), state) == {os.path.join(str(repo), "top.py")}
+
+
+def test_unknown_commit_falls_back(repo):
+    """No usable state means the caller walks the tree"""
+    assert changed_since(str(repo), {"head": "0" * 40, "dirty": []}) is None
+    assert changed_since(str(repo), None) is None
@@ -0,0 +1,99 @@
+"""Incremental tree-sitter re-parse and vector reuse for edited files"""
+import json
+import random
+
+import pytest
+
+from conftest import fake_vector
+from retrieval.ast_chunker import PARSE_STATS, chunk_code
+
+PY = '''import os
+from typing import List
+
+
+class Store:
+    """Keeps items."""
+
+    def __init__(self, root):
+        self.root = root
+        self.items: List[str] = []
+
+    def add(self, item):
+        self.items.append(item)
+        return len(self.items)
+
+
+def load(path):
+    with open(path) as f:
+        return [line.strip() for line in f]
+
+
+def save(path, items):
+    with open(path, "w") as f:
+        f.write("\\n".join(items))
+'''
+SNIPPETS = ["    return None", "def extra(a, b):\n    return a + b", "# café ✓", "x = 1", "",
+            "    if root:", "class Empty:\n    pass", "    def helper(self):\n        return self.root"]
+
+
+def test_incremental_parse_matches_a_fresh_parse(monkeypatch):
+    """Random line edits: the re-used tree yields exactly the fresh-parse chunks"""
+    rng = random.Random(7)
+    lines = PY.split("\n")
+    fpath = "/src/store.py"
+    before = dict(PARSE_STATS)
+    for _step in range(60):
+        op = rng.choice(["insert", "delete", "replace"])
+        i = rng.randrange(len(lines))
+        if op == "insert":
+            lines.insert(i, rng.choice(SNIPPETS))
+        elif op == "delete" and len(lines) > 4:
+            del lines[i]
+        else:
+            lines[i] = lines[i] + rng.choice([" ", "  # edited", "x", ""])
+        src = "\n".join(lines)
+        monkeypatch.setenv("TREE_CACHE_FILES", "4")
+        incremental = chunk_code(src, fpath, "python", tokens=120)
+        monkeypatch.setenv("TREE_CACHE_FILES", "0")
+        fresh = chunk_code(src, fpath, "python", tokens=120)
+        assert incremental == fresh
+    assert PARSE_STATS["incremental"] > before["incremental"]
+
+
+def test_unchanged_chunks_reuse_their_vectors(index_env, monkeypatch):
+    """Only the edited function is embedded; shifted but identical ones keep their vectors"""
+    monkeypatch.setenv("TREE_CACHE_FILES", "8")
+    monkeypatch.setenv("CHUNK_TOKENS", "40")  # one definition per chunk
+    env = index_env
+    fp = env.src / "store.py"
+    fp.write_text(PY)
+    first = env.run()
+    assert first
+    old = {c["code"]: c for c in env.chunks()}
+
+    # Two new lines in __init__ shift every later definition down.
+    fp.write_text(PY.replace("        self.root = root\n",
+                             "        self.root = root\n        self.size = 0\n        self.dirty = False\n"))
+    embedded = env.run([str(fp)])
+    new = env.chunks()
+    changed = [c for c in new if c["code"] not in old]
+    assert changed and sorted(embedded) == sorted(str(c["id"]) for c in changed)
+    with open(env.out / "last_index.json") as f:
+        meta = json.load(f)
+    assert meta["vectors_reused"] == len(new) - len(changed) > 0
+    assert env.client.count("code_chunks_itest", exact=True).count == len(new)
+
+    ids = {env.ir._point_id(c["id"]): c for c in new}
+    for p in env.client.retrieve("code_chunks_itest", ids=list(ids), with_vectors=True):
+        assert p.vector["dense"] == pytest.approx(fake_vector(ids[str(p.id)]["code"]).tolist(), abs=1e-6)
+
+
+def test_reuse_map_skips_ids_taken_by_another_chunk():
+    """An old point whose id now belongs to another chunk is overwritten, not copied"""
+    from indexer.index_repo import _reuse_map
+    prev = {"chunks": [["a", "h1"], ["b", "h2"], ["c", "h3"]]}
+    kept = [{"id": "a", "hash": "h1"},   # same id, same code
+            {"id": "x", "hash": "h2"},   # b's code, but id b is taken below
+            {"id": "b", "hash": "h3"},   # c's code under b's id: copy from c
+            {"id": "y", "hash": "h9"}]   # new code
+    assert _reuse_map(prev, kept) == {"a": "a", "b": "c"}
@@ -0,0 +1,85 @@
+"""Local model registry and length-bucketed encoding (retrieval/local_models.py)"""
+import sys
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import retrieval.local_models as lm
+
+
+class _Model:
+    """Stand-in SentenceTransformer: vector = (len, first char, 1) with no tokenizer."""
+    loads = 0
+
+    def __init__(self, name):
+        type(self).loads += 1
+        self.name = name
+        self.batches = []
+
+    def encode(self, texts, batch_size, normalize_embeddings, show_progress_bar, convert_to_numpy):
+        assert batch_size == len(texts)
+        self.batches.append(list(texts))
+        return np.array([[len(t), ord(t[0]), 1.0] for t in texts], dtype=np.float64)
+
+
+@pytest.fixture
+def st(monkeypatch):
+    _Model.loads = 0
+    monkeypatch.setitem(sys.modules, "sentence_transformers", SimpleNamespace(SentenceTransformer=_Model))
+    monkeypatch.setattr(lm, "_MODELS", {})
+    monkeypatch.setattr(lm, "_THREADS_SET", False)
+    monkeypatch.delenv("EMBED_THREADS", raising=False)
+    return _Model
+
+
+def test_models_load_once_per_process(st):
+    """Concurrent callers share one instance per model name"""
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(lm.get_model("m1"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert st.loads == 1 and all(m is got[0] for m in got)
+    assert lm.get_model("m2") is not got[0]
+    assert st.loads == 2
+
+
+def test_embed_threads_sets_the_torch_pool_once(st, monkeypatch):
+    """EMBED_THREADS is applied on the first load only"""
+    calls = []
+    monkeypatch.setitem(sys.modules, "torch", SimpleNamespace(set_num_threads=calls.append))
+    monkeypatch.setenv("EMBED_THREADS", "3")
+    lm.get_model("m1")
+    lm.get_model("m2")
+    assert calls == [3]
+
+
+def test_encode_bucketed_sorts_batches_and_restores_order(st):
+    """Batches hold texts of similar length; rows come back in input order"""
+    texts = ["a" * n for n in (5, 40, 1, 33, 7, 20, 2, 38)]
+    texts = [chr(ord("a") + i) + t for i, t in enumerate(texts)]
+    out = lm.encode_bucketed("m1", texts, batch=3)
+    assert out.dtype == np.float32 and out.flags["C_CONTIGUOUS"]
+    assert out.tolist() == [[len(t), ord(t[0]), 1.0] for t in texts]
+    batches = lm.get_model("m1").batches
+    assert [len(b) for b in batches] == [3, 3, 2]
+    flat = [len(t) for b in batches for t in b]
+    assert flat == sorted(flat, reverse=True)
+
+
+def test_encode_bucketed_empty_input(st):
+    """No texts, no model load"""
+    assert lm.encode_bucketed("m1", []).shape == (0, 0)
+    assert st.loads == 0
+
+
+def test_token_lengths_use_the_tokenizer():
+    """Token counts are capped at max_seq_length; char length without a tokenizer"""
+    def tok(texts, max_length, **kw):
+        return {"input_ids": [list(range(min(len(t.split()), max_length))) for t in texts]}
+    model = SimpleNamespace(tokenizer=tok, max_seq_length=4)
+    assert lm.token_lengths(model, ["a b", "a b c d e f"]) == [2, 4]
+    assert lm.token_lengths(SimpleNamespace(), ["abc", ""]) == [3, 0]
@@ -0,0 +1,82 @@
+"""Incremental change planning (indexer/manifest.py)"""
+import os
+
+from indexer.manifest import (empty_manifest, file_stat, load_manifest, make_entry, plan_changes,
+                              plan_from_changed, save_manifest)
+
+
+def _write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def _entry(fp, chunks, dups=()):
+    return make_entry(file_stat(fp), None, [{"id": cid, "hash": h} for cid, h in chunks], list(dups))
+
+
+def test_plan_changes_classifies_files(tmp_path):
+    """Unchanged stat is fresh, a touched or new file is stale, a vanished one deleted"""
+    a = _write(tmp_path / "a.py", "a = 1\n")
+    b = _write(tmp_path / "b.py", "b = 1\n")
+    prev = empty_manifest()
+    prev["files"] = {a: _entry(a, [("a1", "ha")]), b: _entry(b, [("b1", "hb")]),
+                     str(tmp_path / "gone.py"): {"size": 1, "mtime": 1, "chunks": []}}
+    _write(tmp_path / "b.py", "b = 22\n")
+    c = _write(tmp_path / "c.py", "c = 1\n")
+
+    plan = plan_changes(prev, [a, b, c])
+    assert plan["fresh"] == [a]
+    assert sorted(plan["stale"]) == [b, c]
+    assert plan["deleted"] == [str(tmp_path / "gone.py")]
+    assert set(plan["stats"]) == {a, b, c}
+
+
+def test_dropped_duplicate_is_released(tmp_path):
+    """A fresh file whose duplicate chunk pointed at a changed file is re-chunked"""
+    a = _write(tmp_path / "a.py", "x = 1\n")
+    b = _write(tmp_path / "b.py", "x = 1\n")
+    prev = empty_manifest()
+    prev["files"] = {a: _entry(a, [("a1", "hx")]), b: _entry(b, [], dups=["hx"])}
+    os.remove(a)
+
+    plan = plan_changes(prev, [b])
+    assert plan["fresh"] == []
+    assert plan["stale"] == [b]
+    assert plan["deleted"] == [a]
+
+
+def test_plan_from_changed_touches_only_the_change_set(tmp_path):
+    """An explicit change set carries every other file over without a stat"""
+    a = _write(tmp_path / "a.py", "a = 1\n")
+    b = _write(tmp_path / "b.py", "b = 1\n")
+    prev = empty_manifest()
+    # a's stat no longer matches, but it is outside the change set.
+    prev["files"] = {a: dict(_entry(a, [("a1", "ha")]), mtime=0), b: _entry(b, [("b1", "hb")])}
+    removed = str(tmp_path / "removed.py")
+    prev["files"][removed] = {"size": 1, "mtime": 1, "chunks": [["r1", "hr"]]}
+
+    plan = plan_from_changed(prev, [b, removed], [b])
+    assert plan["fresh"] == [a]
+    assert plan["stale"] == [b]
+    assert plan["deleted"] == [removed]
+
+
+def test_manifest_round_trip_fills_defaults(tmp_path):
+    """Keys missing from an older manifest get their defaults on load"""
+    m = empty_manifest()
+    m["files"] = {"/x.py": {"size": 1, "mtime": 2, "chunks": [["x1", "hx"]]}}
+    del m["near_dup"], m["chunk_tokenizer"]
+    m["chunk_size"] = {"tokens": 400, "tokenizer": "cl100k"}
+    save_manifest(str(tmp_path), m)
+
+    loaded = load_manifest(str(tmp_path))
+    assert loaded["files"] == m["files"]
+    assert loaded["near_dup"] is None
+    assert loaded["chunk_tokenizer"] == "cl100k"
+
+
+def test_load_manifest_rejects_other_versions(tmp_path):
+    """A missing or other-version manifest means a full build"""
+    assert load_manifest(str(tmp_path)) is None
+    save_manifest(str(tmp_path), dict(empty_manifest(), version=0))
+    assert load_manifest(str(tmp_path)) is None
@@ -0,0 +1,52 @@
+"""Near-duplicate chunk detection (indexer/near_dup.py)"""
+from indexer.near_dup import NearDupIndex, alt_locations, settings, simhash
+
+CODE = """def fetch_user(session, user_id):
+    resp = session.get(f"/api/users/{user_id}", timeout=10)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    data = resp.json()
+    return User(id=data["id"], name=data["name"], email=data["email"])
+"""
+
+
+def _bits(a, b):
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_ignores_whitespace_and_short_code():
+    """Reformatting moves no bits; tiny chunks get no signature"""
+    reformatted = CODE.replace("    ", "\t").replace(", ", ",  ")
+    assert simhash(CODE) == simhash(reformatted)
+    assert simhash("return x", min_tokens=40) is None
+
+
+def test_small_edit_stays_close_unrelated_code_does_not():
+    """A renamed identifier moves few bits; different code about half of them"""
+    edited = CODE.replace("fetch_user", "fetch_account")
+    other = "\n".join(f"total_{i} = compute(values[{i}]) * weight + offset" for i in range(8))
+    assert _bits(simhash(CODE), simhash(edited)) <= 16
+    assert _bits(simhash(CODE), simhash(other)) > 16
+
+
+def test_index_finds_within_threshold_and_same_language():
+    """Lookups respect the bit threshold and the language"""
+    sig = simhash(CODE)
+    idx = NearDupIndex(max_bits=3)
+    idx.add(sig, "python", ("c1",))
+    assert idx.find(sig ^ 0b101, "python") == ("c1",)
+    assert idx.find(sig ^ (1 << 63) ^ (1 << 40) ^ (1 << 20) ^ 1, "python") is None
+    assert idx.find(sig, "javascript") is None
+
+
+def test_settings_and_alt_locations(monkeypatch):
+    """NEAR_DUP_BITS is clamped; copies are listed per representative"""
+    monkeypatch.setenv("NEAR_DUP", "0")
+    assert settings() is None
+    monkeypatch.setenv("NEAR_DUP", "1")
+    monkeypatch.setenv("NEAR_DUP_BITS", "99")
+    assert settings() == {"bits": 16, "min_tokens": 40}
+    files = {"/b.py": {"near_dups": [["c1", 5, 9]]}, "/a.py": {"near_dups": [["c1", 1, 3]]}, "/c.py": {}}
+    assert alt_locations(files) == {"c1": [{"file_path": "/a.py", "start_line": 1, "end_line": 3},
+                                           {"file_path": "/b.py", "start_line": 5, "end_line": 9}]}
@@ -0,0 +1,65 @@
+"""Parent expansion of search hits (CHUNK_HIERARCHY=1 indexes)"""
+import json
+import uuid
+
+import pytest
+
+qdrant_client = pytest.importorskip("qdrant_client")
+from qdrant_client import models
+
+from indexer.bm25_stream import build_bm25_streaming
+import retrieval.hybrid_search as hs
+
+REPO = "ptest"
+PARENT = {"id": "p1", "file_path": "/src/shapes.py", "type": "parent", "name": "Shape",
+          "start_line": 1, "end_line": 40, "code": "class Shape:\n    def area(self): ...\n    def scale(self): ..."}
+CHILD = {"id": "c1", "file_path": "/src/shapes.py", "type": "unit", "name": "area", "parent_id": "p1",
+         "start_line": 2, "end_line": 12, "hash": "h1", "code": "def area(self):\n    return self.w * self.h"}
+OTHER = {"id": "c2", "file_path": "/src/util.py", "type": "unit", "name": "slugify",
+         "start_line": 1, "end_line": 3, "hash": "h2", "code": "def slugify(text):\n    return text.lower()"}
+
+
+def _point_id(cid):
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, cid))
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    out = tmp_path / REPO
+    out.mkdir()
+    with open(out / "chunks.jsonl", "w") as f:
+        for c in (CHILD, OTHER):
+            f.write(json.dumps(c) + "\n")
+    with open(out / "parents.jsonl", "w") as f:
+        f.write(json.dumps(PARENT) + "\n")
+    build_bm25_streaming(lambda: iter([CHILD["code"], OTHER["code"]]), str(out / "bm25_index"))
+
+    qc = qdrant_client.QdrantClient(":memory:")
+    coll = f"code_chunks_{REPO}"
+    qc.create_collection(coll, vectors_config={"dense": models.VectorParams(size=2, distance=models.Distance.COSINE)})
+    payload = {k: CHILD[k] for k in ("id", "file_path", "start_line", "end_line", "hash", "parent_id")}
+    qc.upsert(coll, points=[models.PointStruct(id=_point_id("c1"), vector={"dense": [1.0, 0.0]}, payload=payload)])
+
+    monkeypatch.setenv("OUT_DIR_BASE", str(tmp_path))
+    monkeypatch.setattr("retrieval.rerank.RERANK_BACKEND", "none")
+    monkeypatch.delenv("COLLECTION_NAME", raising=False)
+    monkeypatch.setattr(hs, "QdrantClient", lambda *a, **kw: qc)
+    monkeypatch.setattr(hs, "_get_embedding", lambda q, kind="query": [1.0, 0.0])
+    return out
+
+
+@pytest.mark.parametrize("mode", ["always", "off"])
+def test_dense_hit_expands_to_parent(index, monkeypatch, mode):
+    monkeypatch.setenv("HYDRATION_PARENT", mode)
+    # No query term occurs in the corpus, so the hit can only come from Qdrant.
+    docs = hs.search("zebra", repo=REPO, topk_dense=5, topk_sparse=1, final_k=5)
+    hit = [d for d in docs if d.get("file_path") == "/src/shapes.py"]
+    assert len(hit) == 1
+    if mode == "always":
+        assert hit[0]["type"] == "parent"
+        assert hit[0]["id"] == "p1"
+        assert hit[0]["expanded_from"] == ["c1"]
+        assert hit[0]["code"].startswith("class Shape:")
+    else:
+        assert hit[0].get("parent_id") == "p1"
+        assert "expanded_from" not in hit[0]
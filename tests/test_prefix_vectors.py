@@ -0,0 +1,69 @@
+"""Matryoshka prefix vectors (prefix_dim / EMBED_PREFIX_DIM)"""
+import json
+
+import numpy as np
+import pytest
+
+qdrant_client = pytest.importorskip("qdrant_client")
+
+from common.qdrant_utils import PREFIX_NAME
+from conftest import fake_vector
+import retrieval.hybrid_search as hs
+
+E = [0.5, 0.5, 0.5, 0.5, 0.1, 0.1, 0.1, 0.1]
+
+
+@pytest.mark.parametrize("meta", [{}, {"prefix_dim": 0}, {"prefix_dim": None}, {"prefix_dim": 8}, {"prefix_dim": 16}])
+def test_no_prefix_prefetch_without_a_shorter_prefix(meta):
+    """prefix_dim 0 (or not shorter than the query) searches the full vector directly"""
+    p = hs._dense_prefetch(E, meta, 10)
+    assert p.using == "dense" and p.query == E and p.limit == 10
+    assert p.prefetch is None
+
+
+def test_prefix_prefetch_rescores_with_the_full_vector(monkeypatch):
+    """The re-normalized prefix fetches oversampled candidates; the full vector ranks them"""
+    monkeypatch.setenv("EMBED_PREFIX_OVERSAMPLING", "3")
+    p = hs._dense_prefetch(E, {"prefix_dim": 4}, 10)
+    assert p.using == "dense" and p.query == E and p.limit == 10
+    (first,) = p.prefetch
+    assert first.using == PREFIX_NAME and first.limit == 30
+    assert first.query == pytest.approx([0.5, 0.5, 0.5, 0.5])
+
+
+@pytest.mark.parametrize("want, dim, eff", [(0, 8, 0), (4, 8, 4), (8, 8, 0), (16, 8, 0), (4, None, 0)])
+def test_effective_prefix_dim(index_env, want, dim, eff):
+    """Only a prefix shorter than the embedding is stored"""
+    assert index_env.ir._prefix_dim({"prefix_dim": want}, dim) == eff
+
+
+def _vectors(env):
+    coll = env.client.get_collection("code_chunks_itest")
+    return coll.config.params.vectors
+
+
+def test_build_without_prefix_has_only_the_full_vector(index_env):
+    """EMBED_PREFIX_DIM unset: one named vector, kept in RAM"""
+    (index_env.src / "m.py").write_text("def f(x):\n    return x\n")
+    index_env.run()
+    vectors = _vectors(index_env)
+    assert set(vectors) == {"dense"}
+    with open(index_env.out / "last_index.json") as f:
+        assert json.load(f)["prefix_dim"] == 0
+
+
+def test_build_with_prefix_stores_the_renormalized_prefix(index_env, monkeypatch):
+    """Each point carries the unit-length first prefix_dim components next to the full vector"""
+    monkeypatch.setenv("EMBED_PREFIX_DIM", "4")
+    (index_env.src / "m.py").write_text("def f(x):\n    return x\n\n\ndef g(y):\n    return y * 2\n")
+    index_env.run()
+    vectors = _vectors(index_env)
+    assert vectors[PREFIX_NAME].size == 4
+    assert vectors["dense"].on_disk is True
+    code = {c["id"]: c["code"] for c in index_env.chunks()}
+    points, _ = index_env.client.scroll("code_chunks_itest", with_payload=True, with_vectors=True)
+    assert len(points) == len(code)
+    for p in points:
+        full = fake_vector(code[p.payload["id"]])
+        assert p.vector["dense"] == pytest.approx(full.tolist(), abs=1e-6)
+        assert p.vector[PREFIX_NAME] == pytest.approx((full[:4] / np.linalg.norm(full[:4])).tolist(), abs=1e-6)
@@ -0,0 +1,84 @@
+"""Bulk Qdrant upload (indexer/qdrant_upload.py)"""
+import threading
+import uuid
+
+import numpy as np
+import pytest
+
+qdrant_client = pytest.importorskip("qdrant_client")
+from qdrant_client import models
+
+from indexer.qdrant_upload import BulkUploader
+
+COLL = "upload_test"
+
+
+class _Client:
+    """Delegates to an in-memory client; records upserts and can hold back
+    ``wait=False`` ones (acknowledged but not applied yet)."""
+
+    def __init__(self, hold=0):
+        self.inner = qdrant_client.QdrantClient(":memory:")
+        self.inner.create_collection(COLL, vectors_config={"dense": models.VectorParams(
+            size=2, distance=models.Distance.COSINE)})
+        self.hold = hold
+        self.held = []
+        self.waits = []
+        self._lock = threading.Lock()  # the embedded client is not thread-safe
+
+    def upsert(self, collection, points, wait):
+        with self._lock:
+            self.waits.append((len(points.ids), wait))
+            if not wait and len(self.held) < self.hold:
+                self.held.append(points)
+                return
+            self.inner.upsert(collection, points=points, wait=wait)
+
+    def count(self, *args, **kwargs):
+        with self._lock:
+            return self.inner.count(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name == "_client":
+            raise AttributeError(name)  # look like a server client: parallel uploads
+        return getattr(self.inner, name)
+
+
+def _add(up, n):
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_DNS, f"c{i}")) for i in range(n)]
+    vecs = np.random.default_rng(0).random((n, 2), dtype=np.float32)
+    up.add(ids, vecs, [{"i": i} for i in range(n)])
+
+
+def test_finish_resends_last_round_and_counts_every_point():
+    """Every batch of the last round goes out again with wait=True"""
+    client = _Client()
+    up = BulkUploader(client, COLL, batch_size=4, parallel=2)
+    _add(up, 10)
+    stats = up.finish()
+    assert stats["points"] == 10 and stats["requests"] == 3
+    assert sorted(client.waits[:3]) == [(2, False), (4, False), (4, False)]
+    assert client.waits[3:] == [(4, True), (2, True)]
+    assert client.count(COLL, exact=True).count == 10
+
+
+def test_finish_fails_while_points_are_missing(monkeypatch):
+    """An acknowledged batch that never shows up blocks the alias swap"""
+    monkeypatch.setenv("QDRANT_VERIFY_SECS", "1")
+    client = _Client(hold=1)
+    up = BulkUploader(client, COLL, batch_size=4, parallel=2)
+    _add(up, 12)  # first batch held back; the re-sent last round does not cover it
+    with pytest.raises(RuntimeError, match="4 of 12"):
+        up.finish()
+
+
+def test_verify_waits_for_late_points():
+    """verify() returns once the held-back batch is applied"""
+    client = _Client(hold=1)
+    up = BulkUploader(client, COLL, batch_size=4)
+    _add(up, 8)
+    up.drain()
+    up._tail.clear()
+    assert up._missing() == 4
+    client.inner.upsert(COLL, points=client.held[0], wait=True)
+    up.verify(timeout=1)
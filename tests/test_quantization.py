@@ -0,0 +1,71 @@
+"""Scalar / binary quantization with rescoring (common/qdrant_utils.py)"""
+import pytest
+
+qdrant_client = pytest.importorskip("qdrant_client")
+from qdrant_client import models
+
+from common.qdrant_utils import (DEFAULT_OVERSAMPLING, quantization_config, quantization_mode,
+                                 quantization_search_params, resolve_alias)
+
+
+@pytest.mark.parametrize("env, want", [("", "none"), ("scalar", "scalar"), (" Binary ", "binary"), ("pq", "none")])
+def test_quantization_mode(monkeypatch, env, want):
+    """Unknown QDRANT_QUANTIZATION values mean no quantization"""
+    monkeypatch.setenv("QDRANT_QUANTIZATION", env)
+    assert quantization_mode() == want
+
+
+def test_quantization_config_per_mode():
+    """int8 scalar or 1-bit binary codes, kept in RAM"""
+    scalar = quantization_config("scalar")
+    assert isinstance(scalar, models.ScalarQuantization)
+    assert scalar.scalar.type == models.ScalarType.INT8
+    assert scalar.scalar.always_ram is True
+    binary = quantization_config("binary")
+    assert isinstance(binary, models.BinaryQuantization)
+    assert binary.binary.always_ram is True
+    assert quantization_config("none") is None
+
+
+@pytest.mark.parametrize("mode", ["scalar", "binary"])
+def test_search_params_rescore_oversampled_candidates(monkeypatch, mode):
+    """Per-mode oversampling default; QDRANT_OVERSAMPLING / QDRANT_RESCORE override"""
+    monkeypatch.delenv("QDRANT_OVERSAMPLING", raising=False)
+    monkeypatch.delenv("QDRANT_RESCORE", raising=False)
+    q = quantization_search_params(mode).quantization
+    assert q.ignore is False and q.rescore is True
+    assert q.oversampling == DEFAULT_OVERSAMPLING[mode]
+
+    monkeypatch.setenv("QDRANT_OVERSAMPLING", "5")
+    monkeypatch.setenv("QDRANT_RESCORE", "0")
+    q = quantization_search_params(mode).quantization
+    assert q.oversampling == 5.0 and q.rescore is False
+
+    monkeypatch.setenv("QDRANT_OVERSAMPLING", "lots")
+    assert quantization_search_params(mode).quantization.oversampling == DEFAULT_OVERSAMPLING[mode]
+
+
+def test_no_search_params_without_quantization():
+    """Plain collections are searched without quantization params"""
+    assert quantization_search_params("none") is None
+    assert quantization_search_params("pq") is None
+
+
+def test_quantized_build_keeps_originals_on_disk(index_env, monkeypatch):
+    """The collection gets the codes config; the float32 vectors go to disk"""
+    created = {}
+    real = index_env.client.create_collection
+
+    def create_collection(collection_name, **kwargs):
+        created.update(kwargs)  # the embedded client does not keep quantization_config
+        return real(collection_name, **kwargs)
+
+    monkeypatch.setattr(index_env.client, "create_collection", create_collection)
+    monkeypatch.setenv("QDRANT_QUANTIZATION", "binary")
+    (index_env.src / "m.py").write_text("def f(x):\n    return x\n")
+    index_env.run()
+    assert isinstance(created["quantization_config"], models.BinaryQuantization)
+    assert created["vectors_config"]["dense"].on_disk is True
+    assert resolve_alias(index_env.client, "code_chunks_itest")
+    with open(index_env.out / "last_index.json") as f:
+        assert '"quantization": "binary"' in f.read()
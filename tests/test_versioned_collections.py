@@ -0,0 +1,89 @@
+"""Full rebuilds into versioned collections behind an alias (common/qdrant_utils.py)"""
+from common.qdrant_utils import VERSION_SEP, gc_versions, resolve_alias, swap_alias
+
+ALIAS = "code_chunks_itest"
+
+
+def _write_files(src, n):
+    for i in range(n):
+        (src / f"m{i}.py").write_text(f"def f{i}(x):\n    return x + {i}\n")
+
+
+def _count(client, name):
+    return client.count(name, exact=True).count
+
+
+def test_full_rebuild_swaps_alias_and_drops_old_version(index_env, monkeypatch):
+    env = index_env
+    _write_files(env.src, 3)
+    env.run()
+    first = resolve_alias(env.client, ALIAS)
+    assert first.startswith(ALIAS + VERSION_SEP)
+    assert _count(env.client, ALIAS) == len(env.chunks())
+
+    monkeypatch.setenv("FULL_REINDEX", "1")
+    env.run()
+    second = resolve_alias(env.client, ALIAS)
+    assert second != first and second > first
+    assert env.collections() == [second]
+    assert _count(env.client, ALIAS) == len(env.chunks())
+    assert env.manifest()["dense_build"] is None
+
+
+def test_keep_versions_retains_older_builds(index_env, monkeypatch):
+    """QDRANT_KEEP_VERSIONS=1 keeps one previous version for rollback"""
+    env = index_env
+    _write_files(env.src, 2)
+    monkeypatch.setenv("QDRANT_KEEP_VERSIONS", "1")
+    monkeypatch.setenv("FULL_REINDEX", "1")
+    names = []
+    for _ in range(3):
+        env.run()
+        names.append(resolve_alias(env.client, ALIAS))
+    assert env.collections() == names[1:]
+
+
+def test_interrupted_rebuild_resumes_into_the_same_version(index_env, monkeypatch):
+    """A crash mid-upload keeps the old alias; the rerun fills the same collection"""
+    env = index_env
+    _write_files(env.src, 3)
+    env.run()
+    live = resolve_alias(env.client, ALIAS)
+    total = len(env.chunks())
+
+    (env.src / "m0.py").write_text("def f0(x):\n    return x * 100\n")
+    monkeypatch.setenv("FULL_REINDEX", "1")
+    env.fail_after = 1  # the second embedding batch fails (the build degrades to BM25-only)
+    env.run()
+    monkeypatch.delenv("FULL_REINDEX")
+    build = env.manifest()["dense_build"]
+    assert build and build["target"] != live
+    assert resolve_alias(env.client, ALIAS) == live  # still served
+    done_first = list(env.embedded[-1])
+    assert 0 < len(done_first) < total
+
+    env.fail_after = None
+    embedded = env.run()
+    assert resolve_alias(env.client, ALIAS) == build["target"]
+    assert not set(done_first) & set(embedded)
+    assert len(done_first) + len(embedded) == total
+    assert _count(env.client, ALIAS) == total
+    assert env.collections() == [build["target"]]
+
+
+def test_swap_alias_migrates_a_plain_collection(index_env):
+    """A pre-alias collection under the alias name is replaced by the alias"""
+    from qdrant_client import models
+    client = index_env.client
+    params = models.VectorParams(size=2, distance=models.Distance.COSINE)
+    client.create_collection(ALIAS, vectors_config=params)
+    client.create_collection(ALIAS + VERSION_SEP + "1", vectors_config=params)
+    assert swap_alias(client, ALIAS, ALIAS + VERSION_SEP + "1") is None
+    assert resolve_alias(client, ALIAS) == ALIAS + VERSION_SEP + "1"
+    client.create_collection(ALIAS + VERSION_SEP + "2", vectors_config=params)
+    client.create_collection(ALIAS + VERSION_SEP + "3", vectors_config=params)
+    assert swap_alias(client, ALIAS, ALIAS + VERSION_SEP + "2") == ALIAS + VERSION_SEP + "1"
+    # Newer versions may be builds in progress and are left alone.
+    assert gc_versions(client, ALIAS) == [ALIAS + VERSION_SEP + "1"]
+    assert sorted(c.name for c in client.get_collections().collections) == [ALIAS + VERSION_SEP + "2",
+                                                                            ALIAS + VERSION_SEP + "3"]
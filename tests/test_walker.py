@@ -0,0 +1,83 @@
+"""scandir repository walker (common/walker.py)"""
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from common.walker import GlobMatcher, RepoWalker
+
+FILES = ["app.py", "app.log", "keep.log", "build/out.py", "src/build/gen.py", "src/main.py",
+         "src/debug.log", "docs/build", "docs/a.md", "sub/.gitignore", "sub/x.tmp", "sub/deep/y.tmp",
+         "sub/deep/z.py", "node_modules/m.js", "vendor/lib.py", "vendor/keep/k.py", "tmp/t.py"]
+ROOT_IGNORE = """# comment
+*.log
+!keep.log
+/build/
+/tmp
+docs/build
+vendor/*
+!vendor/keep/
+"""
+SUB_IGNORE = """*.tmp
+!deep/y.tmp
+"""
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "repo"
+    for rel in FILES:
+        p = root / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text("x\n")
+    (root / ".gitignore").write_text(ROOT_IGNORE)
+    (root / "sub" / ".gitignore").write_text(SUB_IGNORE)
+    return root
+
+
+def _walk(root, **kw):
+    return sorted(os.path.relpath(p, root) for p in RepoWalker(str(root), **kw).walk())
+
+
+def test_gitignore_negation_and_anchoring(tree):
+    """Anchored, unanchored, dir-only and re-included patterns, per directory"""
+    assert _walk(tree, prune={"node_modules"}, gitignore=True) == sorted([
+        ".gitignore", "app.py", "keep.log", "docs/a.md", "src/build/gen.py", "src/main.py",
+        "sub/.gitignore", "sub/deep/y.tmp", "sub/deep/z.py", "vendor/keep/k.py"])
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_gitignore_agrees_with_git(tree):
+    """walk() and ignored() give what git reports as untracked, not ignored"""
+    subprocess.run(["git", "init", "-q", str(tree)], check=True)
+    out = subprocess.run(["git", "-C", str(tree), "ls-files", "--others", "--exclude-standard"],
+                         capture_output=True, text=True, check=True).stdout
+    want = sorted(p.replace("/", os.sep) for p in out.splitlines())
+    walker = RepoWalker(str(tree), prune={".git"}, gitignore=True)
+    assert sorted(os.path.relpath(p, tree) for p in walker.walk()) == want
+    for rel in FILES:
+        assert walker.ignored(str(tree / rel)) == (rel.replace("/", os.sep) not in want), rel
+
+
+def test_gitignore_off_and_excludes(tree):
+    """WALK_GITIGNORE=0 keeps ignored files; exclude globs prune whole dirs"""
+    got = _walk(tree, prune={"node_modules"}, gitignore=False, excludes=["sub/*", "*.log"])
+    assert "build/out.py" in got and "tmp/t.py" in got
+    assert not any(p.startswith("sub") or p.endswith(".log") for p in got)
+
+
+def test_glob_matcher_keeps_fnmatch_semantics():
+    """``*`` crosses ``/``; a trailing ``*`` covers a whole directory"""
+    m = GlobMatcher(["*/generated/*", "*.min.js"])
+    assert m.match("a/b/generated/c/d.py")
+    assert m.match("deep/dir/x.min.js")
+    assert m.match_dir("a/generated")
+    assert not m.match_dir("a/src")
+
+
+def test_walk_order_is_deterministic(tree):
+    """A directory's files come before its subdirectories, sorted by name"""
+    got = [os.path.relpath(p, tree) for p in RepoWalker(str(tree), gitignore=False).walk()]
+    assert got.index("app.py") < got.index(os.path.join("build", "out.py"))
+    assert got[:4] == [".gitignore", "app.log", "app.py", "keep.log"]
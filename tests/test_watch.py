@@ -0,0 +1,95 @@
+"""Filesystem watch daemon helpers (indexer/watch.py)"""
+import os
+import sys
+import time
+
+import pytest
+
+from indexer.watch import (InotifyWatcher, PollWatcher, _debounce_secs, _expand, _poll_secs, _restart_delay,
+                           read_state, write_state)
+
+
+def _tree(tmp_path):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    (root / "node_modules").mkdir()
+    (root / "pkg" / "a.py").write_text("a = 1\n")
+    (root / "pkg" / "b.py").write_text("b = 1\n")
+    return root
+
+
+def _bump(path, text):
+    path.write_text(text)
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10_000_000))
+
+
+def test_poll_watcher_reports_changes(tmp_path, monkeypatch):
+    """Modified, created and deleted source files; pruned dirs are not scanned"""
+    monkeypatch.setenv("WATCH_POLL_SECS", "0.2")
+    root = _tree(tmp_path)
+    w = PollWatcher([str(root)])
+    _bump(root / "pkg" / "a.py", "a = 22\n")
+    (root / "pkg" / "c.py").write_text("c = 1\n")
+    (root / "pkg" / "b.py").unlink()
+    (root / "node_modules" / "x.js").write_text("x\n")
+    (root / "pkg" / "notes.unknownext").write_text("n\n")
+    assert w.poll(0.2) == {str(root / "pkg" / p) for p in ("a.py", "b.py", "c.py")}
+    assert w.poll(0.2) == set()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+def test_inotify_watcher_picks_up_new_directories(tmp_path):
+    """Files in a directory created after start are reported and watched"""
+    root = _tree(tmp_path)
+    w = InotifyWatcher([str(root)])
+    try:
+        (root / "pkg" / "new").mkdir()
+        (root / "pkg" / "new" / "d.py").write_text("d = 1\n")
+        got = set()
+        deadline = time.time() + 5
+        while str(root / "pkg" / "new" / "d.py") not in got and time.time() < deadline:
+            got |= w.poll(0.5) or set()
+        assert str(root / "pkg" / "new" / "d.py") in got
+        (root / "pkg" / "new" / "d.py").write_text("d = 2\n")
+        assert str(root / "pkg" / "new" / "d.py") in (w.poll(2.0) or set())
+    finally:
+        w.close()
+
+
+def test_expand_replaces_removed_directories(tmp_path):
+    """A directory that went away stands for the indexed files under it"""
+    root = _tree(tmp_path)
+    gone = str(root / "old")
+    indexed = [os.path.join(gone, "x.py"), os.path.join(gone, "sub", "y.py"), str(root / "pkg" / "a.py"),
+               str(root / "older.py")]
+    got = _expand({gone, str(root / "pkg" / "a.py")}, indexed)
+    assert got == {os.path.join(gone, "x.py"), os.path.join(gone, "sub", "y.py"), str(root / "pkg" / "a.py")}
+
+
+def test_state_round_trip(tmp_path):
+    """watch_state.json is written atomically and read back"""
+    out = str(tmp_path / "out")
+    assert read_state(out) == {}
+    write_state(out, {"repo": "r", "pending_files": 3})
+    assert read_state(out) == {"repo": "r", "pending_files": 3}
+
+
+def test_bad_timing_knobs_fall_back_to_defaults(monkeypatch):
+    """A malformed WATCH_* value must not kill the watcher at startup"""
+    monkeypatch.setenv("WATCH_DEBOUNCE_MS", "abc")
+    monkeypatch.setenv("WATCH_POLL_SECS", "")
+    assert _debounce_secs() == 0.75
+    assert _poll_secs() == 2.0
+    monkeypatch.setenv("WATCH_POLL_SECS", "0.01")
+    assert _poll_secs() == 0.2
+
+
+def test_restart_backoff_resets_after_a_healthy_run():
+    """Quick crashes back off up to a minute; a long-lived child starts over"""
+    delays, prev = [], None
+    for _ in range(7):
+        prev = _restart_delay(prev, uptime=3)
+        delays.append(prev)
+    assert delays == [2, 4, 8, 16, 32, 60, 60]
+    assert _restart_delay(60, uptime=4 * 3600) == 2